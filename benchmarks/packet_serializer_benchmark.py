@@ -0,0 +1,101 @@
+"""
+Compare PacketSerializer against the recursive sanitiser it replaced, using the sample packets in docs/packets.
+
+    python -m benchmarks.packet_serializer_benchmark [iterations]
+
+On a shared single-core x86_64 VM (Python 3.11.7, default settings), to_api_dict usually came out about 1.5x faster,
+but anywhere from 1.1x to 2.4x across runs. to_json_bytes was usually about 1.1-1.2x faster, but ranged from 0.9x to
+1.25x. json.dumps takes most of that time, and both sides pay for it. Results are this noisy on a busy machine, so
+run the benchmark a few times before quoting a figure.
+"""
+import base64
+import copy
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from src.api.packet_serializer import PacketSerializer
+
+PACKETS_DIR = Path(__file__).parent.parent / 'docs' / 'packets'
+ROUNDS = 15
+
+
+def legacy_sanitise_raw_packet(data):
+    """StorageAPIWrapper._sanitise_raw_packet, as it was"""
+    if isinstance(data, dict):
+        if 'raw' in data:
+            data.pop('raw')
+
+        return {key: legacy_sanitise_raw_packet(value) for key, value in data.items()}
+    elif isinstance(data, list):
+        return [legacy_sanitise_raw_packet(item) for item in data]
+    elif isinstance(data, bytes):
+        return base64.b64encode(data).decode('utf-8')
+    else:
+        return data
+
+
+def legacy_to_json_bytes(packet: dict) -> bytes:
+    # What requests did with json=...
+    return json.dumps(legacy_sanitise_raw_packet(packet), allow_nan=False).encode('utf-8')
+
+
+def load_packets() -> list[dict]:
+    packets = []
+    for path in sorted(PACKETS_DIR.glob('*.json')):
+        with open(path) as f:
+            # The fixtures were copied from Python reprs, so payloads use \x escapes
+            packet = json.loads(f.read().replace('\\x', '\\u00'))
+
+        # Live packets have the payload as bytes
+        decoded = packet.get('decoded')
+        if decoded and 'payload' in decoded:
+            payload = decoded['payload']
+            decoded['payload'] = os.urandom(32) if payload == '...' else payload.encode('latin-1')
+        packets.append(packet)
+
+    return packets
+
+
+def time_round(fn, packets: list[dict], iterations: int) -> float:
+    """Seconds per packet for one round"""
+    # The legacy sanitiser pops keys out of its input, so every call gets its own copy (made outside the timing)
+    inputs = [copy.deepcopy(packet) for _ in range(iterations) for packet in packets]
+
+    start = time.perf_counter()
+    for packet in inputs:
+        fn(packet)
+    return (time.perf_counter() - start) / len(inputs)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    packets = load_packets()
+    print(f"{len(packets)} sample packets x {iterations} iterations, best of {ROUNDS} rounds\n")
+
+    candidates = {
+        'legacy _sanitise_raw_packet': legacy_sanitise_raw_packet,
+        'PacketSerializer.to_api_dict': PacketSerializer.to_api_dict,
+        'legacy sanitise + json.dumps': legacy_to_json_bytes,
+        'PacketSerializer.to_json_bytes': PacketSerializer.to_json_bytes,
+    }
+    # Rounds are interleaved, so a slow patch on a busy machine hits every candidate rather than skewing one of them
+    best = {}
+    for _ in range(ROUNDS):
+        for name, fn in candidates.items():
+            elapsed = time_round(fn, packets, iterations)
+            best[name] = min(best.get(name, elapsed), elapsed)
+
+    for name, per_packet in best.items():
+        print(f"{name:<40} {per_packet * 1_000_000:8.2f} us/packet")
+
+    dict_speedup = best['legacy _sanitise_raw_packet'] / best['PacketSerializer.to_api_dict']
+    bytes_speedup = best['legacy sanitise + json.dumps'] / best['PacketSerializer.to_json_bytes']
+    print(f"\nto_api_dict speedup:   {dict_speedup:.2f}x")
+    print(f"to_json_bytes speedup: {bytes_speedup:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
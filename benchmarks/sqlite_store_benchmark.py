@@ -0,0 +1,64 @@
+"""
+Compare SqliteNodeDB's long-lived WAL connections against opening a new connection per operation, as it used to.
+
+    python -m benchmarks.sqlite_store_benchmark [operations]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from src.data_classes import MeshNode
+from src.persistence.node_db import SqliteNodeDB
+
+
+class LegacySqliteNodeDB(SqliteNodeDB):
+    """SqliteNodeDB, with a fresh rollback-journal connection per operation as it was"""
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        # A new connection on an existing WAL database would stay in WAL mode
+        conn.execute('PRAGMA journal_mode=DELETE')
+        return conn
+
+
+def run(name: str, db: SqliteNodeDB, operations: int) -> tuple[float, float]:
+    users = [MeshNode.User(node_id=f"!{i:08x}", short_name=f"N{i % 1000}", long_name=f"Node {i}")
+             for i in range(operations)]
+    position = MeshNode.Position(logged_time=datetime.now(timezone.utc), latitude=55.86, longitude=-4.25)
+
+    start = time.perf_counter()
+    for user in users:
+        db.store_user(user)
+        db.store_position(user.id, position)
+    write_us = (time.perf_counter() - start) / (operations * 2) * 1_000_000
+
+    start = time.perf_counter()
+    for user in users:
+        db.get_by_id(user.id)
+    read_us = (time.perf_counter() - start) / operations * 1_000_000
+
+    print(f"{name:<32} write {write_us:9.2f} us/op    read {read_us:8.2f} us/op")
+    return write_us, read_us
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print(f"{operations} users + positions written, then read back by ID\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacySqliteNodeDB(os.path.join(tmp, 'legacy.sqlite'))
+        legacy_write, legacy_read = run('connection per operation', legacy, operations)
+
+        db = SqliteNodeDB(os.path.join(tmp, 'pooled.sqlite'))
+        write, read = run('long-lived WAL connection', db, operations)
+        db.close()
+
+    print(f"\nwrite speedup: {legacy_write / write:.2f}x")
+    print(f"read speedup:  {legacy_read / read:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
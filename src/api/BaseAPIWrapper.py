@@ -1,15 +1,55 @@
 from abc import ABC
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 class BaseAPIWrapper(ABC):
+    DEFAULT_POOL_SIZE = 4
+    DEFAULT_GET_RETRIES = 3
+    DEFAULT_CONNECT_TIMEOUT = 3.05
+    DEFAULT_READ_TIMEOUT = 10.0
+
     base_url: str
     auth_token: str | None
+    session: requests.Session
+    timeout: tuple[float, float]
 
-    def __init__(self, base_url: str, auth_token: str = None):
+    def __init__(self, base_url: str, auth_token: str = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, get_retries: int = DEFAULT_GET_RETRIES,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT):
+        """
+        @param pool_size: Max number of keep-alive connections to hold open to the API
+        @param get_retries: How many times to retry GETs on connection errors or 502/503/504 responses. POSTs
+            are never retried at the transport level
+        @param connect_timeout: Seconds to wait for a connection to the API to be established
+        @param read_timeout: Seconds to wait between bytes of the API's response
+        """
         self.base_url = base_url.rstrip('/')
         self.auth_token = auth_token
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = self._create_session(pool_size, get_retries)
+
+    def _create_session(self, pool_size: int, get_retries: int) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self._get_headers())
+
+        retry = Retry(
+            total=get_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
+    def close(self):
+        self.session.close()
 
     def _get_headers(self) -> dict:
         headers = {
@@ -21,15 +61,23 @@ class BaseAPIWrapper(ABC):
 
         return headers
 
-    def _get(self, url: str) -> requests.Response:
+    def _get(self, url: str, timeout: tuple[float, float] = None) -> requests.Response:
         full_url = f"{self.base_url}/{url.lstrip('/')}"
-        response = requests.get(full_url, headers=self._get_headers())
+        response = self.session.get(full_url, timeout=timeout or self.timeout)
         response.raise_for_status()
 
         return response
 
-    def _post(self, url: str, json: dict) -> requests.Response:
+    def _post(self, url: str, json: dict | list = None, timeout: tuple[float, float] = None,
+              data: bytes = None, headers: dict = None) -> requests.Response:
+        """
+        @param data: An already-encoded body, sent instead of `json`
+        @param headers: Extra headers for this request, e.g. the Content-Type of `data` if it isn't JSON
+        """
         full_url = f"{self.base_url}/{url.lstrip('/')}"
-        response = requests.post(full_url, json=json, headers=self._get_headers())
+        body = {'data': data} if data is not None else {'json': json}
+        if headers:
+            body['headers'] = headers
+        response = self.session.post(full_url, timeout=timeout or self.timeout, **body)
         response.raise_for_status()
         return response
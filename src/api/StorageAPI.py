@@ -1,28 +1,194 @@
-import base64
-import json
 import logging
-import os
-import traceback
-from datetime import datetime
-from pathlib import Path
 from typing import Union
 
-from meshtastic.protobuf.mesh_pb2 import MeshPacket
-from requests import HTTPError
+import requests
+from requests import HTTPError, Timeout
 
 from src.api.BaseAPIWrapper import BaseAPIWrapper
+from src.api.circuit_breaker import CircuitBreaker
+from src.api.compression import BodyCompressor
+from src.api.deadline import Deadline
+from src.api.errors import CircuitOpenError, DeadlineExceededError, is_retryable_error
+from src.api.node_fingerprint import NodeFingerprintCache
+from src.api.packet_serializer import PacketSerializer, PreparedPacket
+from src.api.retry_policy import RetryPolicy, RetryScheduler
 from src.api.serializers import MeshNodeSerializer
 from src.data_classes import MeshNode
+from src.persistence.upload_spool import AbstractUploadSpool
+from src.utils.batcher import Batcher
+from src.utils.counters import Counters
 
+# Status codes which mean the server doesn't have the bulk ingest endpoint (i.e. an older API version)
+BULK_UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+# Status codes which mean the server can't ingest protobuf packets
+PROTOBUF_UNSUPPORTED_STATUS_CODES = (404, 405, 415, 501)
+
+# Status codes which may mean the server couldn't decode a compressed body
+COMPRESSION_REJECTED_STATUS_CODES = (400, 415)
+
+PROTOBUF_CONTENT_TYPE = 'application/x-protobuf'
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
 
-class StorageAPIWrapper(BaseAPIWrapper):
-    failed_packets_dir: Path
 
-    def __init__(self, bot, base_url: str, token: str = None, api_version: int = 1, failed_packets_dir: str = None):
-        super().__init__(base_url, token)
+class StorageAPIWrapper(BaseAPIWrapper):
+    UPLOAD_FORMAT_JSON = 'json'
+    UPLOAD_FORMAT_PROTOBUF = 'protobuf'
+
+    spool: AbstractUploadSpool | None
+    breaker: CircuitBreaker
+    bulk_supported: bool
+    nodes_bulk_supported: bool
+    protobuf_supported: bool
+    compressor: BodyCompressor | None
+    node_fingerprints: NodeFingerprintCache | None
+    retry_policy: RetryPolicy
+    counters: Counters
+
+    def __init__(self, bot, base_url: str, token: str = None, api_version: int = 1,
+                 spool: AbstractUploadSpool = None, upload_format: str = UPLOAD_FORMAT_JSON,
+                 batch_size: int = 0, batch_interval_ms: int = 1000,
+                 compression: str = None, compression_min_bytes: int = BodyCompressor.DEFAULT_MIN_BYTES,
+                 pool_size: int = BaseAPIWrapper.DEFAULT_POOL_SIZE,
+                 connect_timeout: float = BaseAPIWrapper.DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = BaseAPIWrapper.DEFAULT_READ_TIMEOUT,
+                 breaker_failure_threshold: int = CircuitBreaker.DEFAULT_FAILURE_THRESHOLD,
+                 breaker_probe_interval_sec: float = CircuitBreaker.DEFAULT_PROBE_INTERVAL_SEC,
+                 node_max_staleness_sec: float = NodeFingerprintCache.DEFAULT_MAX_STALENESS_SEC,
+                 retry_attempts: int = RetryPolicy.DEFAULT_MAX_ATTEMPTS,
+                 retry_base_delay_sec: float = RetryPolicy.DEFAULT_BASE_DELAY_SEC,
+                 retry_max_delay_sec: float = RetryPolicy.DEFAULT_MAX_DELAY_SEC):
+        """
+        @param spool: Where packets which fail to upload are kept until they can be replayed
+        @param upload_format: 'protobuf' to upload the packet's original protobuf bytes (API v2 only), rather than the
+            decoded packet as JSON. Falls back to JSON for packets without a protobuf, or if the server doesn't
+            support it
+        @param batch_size: If > 1, packets are collected and sent to the bulk ingest endpoint in batches of up to
+            this many packets
+        @param batch_interval_ms: The longest a packet will wait for its batch to fill before being sent
+        @param compression: 'gzip' or 'zstd' to compress request bodies. Turned off automatically if the server
+            rejects compressed bodies
+        @param compression_min_bytes: Bodies smaller than this are sent uncompressed
+        @param pool_size: Max number of keep-alive connections to hold open to the API
+        @param connect_timeout: Seconds to wait for a connection to the API to be established
+        @param read_timeout: Seconds to wait between bytes of the API's response
+        @param breaker_failure_threshold: Consecutive failures after which we stop calling the API, and send packets
+            straight to the spool
+        @param breaker_probe_interval_sec: While the API is failing, how often to let a probe request through
+        @param node_max_staleness_sec: Node updates which don't change anything are skipped, unless the node hasn't
+            been sent for this long. 0 sends every update
+        @param retry_attempts: Attempts made at uploading a packet before it's spooled, if its upload fails with a
+            retryable error (timeouts, connection errors, 5xx). 1 spools on the first failure
+        @param retry_base_delay_sec: Retries back off exponentially (with jitter) from this delay...
+        @param retry_max_delay_sec: ...up to this one
+        """
+        super().__init__(base_url, token, pool_size=pool_size,
+                         connect_timeout=connect_timeout, read_timeout=read_timeout)
         self.bot = bot
-        self.failed_packets_dir = Path(failed_packets_dir) if failed_packets_dir else None
+        self.counters = Counters()
+        self.spool = spool
         self.api_version = api_version
+        self.breaker = CircuitBreaker(breaker_failure_threshold, breaker_probe_interval_sec, name=self.base_url)
+        self.compressor = BodyCompressor(compression, compression_min_bytes) if compression else None
+        self.node_fingerprints = NodeFingerprintCache(node_max_staleness_sec) if node_max_staleness_sec else None
+        self.retry_policy = RetryPolicy(retry_attempts, retry_base_delay_sec, retry_max_delay_sec)
+        self._retry_scheduler = None
+        if self.retry_policy.max_attempts > 1:
+            self._retry_scheduler = RetryScheduler(name=f"retry-{self.base_url}")
+
+        self.upload_format = upload_format
+        self.protobuf_supported = upload_format == self.UPLOAD_FORMAT_PROTOBUF and api_version != 1
+        if upload_format == self.UPLOAD_FORMAT_PROTOBUF and not self.protobuf_supported:
+            logging.warning(f"Protobuf uploads are not supported by API v{api_version}, sending packets as JSON")
+
+        # API v1 has no bulk endpoints
+        self.bulk_supported = api_version != 1
+        self.nodes_bulk_supported = api_version != 1
+        self._batcher = None
+        if batch_size > 1 and self.bulk_supported:
+            self._batcher = Batcher(self._store_packet_batch, batch_size, batch_interval_ms,
+                                    name=f"packets-{self.base_url}")
+        elif batch_size > 1:
+            logging.warning(f"Packet batching is not supported by API v{api_version}, sending packets individually")
+
+    def close(self):
+        """
+        Send any packets still waiting in a batch, spool any waiting to be retried, then close the HTTP session
+        """
+        if self._batcher is not None:
+            self._batcher.close()
+        if self._retry_scheduler is not None:
+            self._retry_scheduler.close()
+        super().close()
+
+    def _post(self, url: str, json: dict | list = None, timeout: tuple[float, float] = None,
+              data: bytes = None, headers: dict = None) -> requests.Response:
+        """
+        POST via the circuit breaker: refused with CircuitOpenError while the API is known to be failing
+        """
+        if not self.breaker.allow_request():
+            self.counters.incr('short_circuited')
+            raise CircuitOpenError(f"Circuit breaker open for {self.base_url}")
+
+        try:
+            response = self._send(url, json, timeout, data, headers)
+        except Exception as ex:
+            # A rejected request still means the API is up
+            if is_retryable_error(ex):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+
+        self.breaker.record_success()
+        return response
+
+    def _clamp_timeout(self, deadline: Deadline | None) -> tuple[float, float] | None:
+        """
+        The request timeout to use under `deadline`, counting it if the deadline has already passed
+        """
+        if deadline is None:
+            return None
+        try:
+            return deadline.clamp_timeout(self.timeout)
+        except DeadlineExceededError:
+            self.counters.incr('deadline_exceeded')
+            raise
+
+    def _send(self, url: str, json: dict | list, timeout: tuple[float, float] | None, data: bytes | None,
+              headers: dict | None) -> requests.Response:
+        """
+        POST the body, compressed if it's worth it
+        """
+        compressor = self.compressor
+        if compressor is None:
+            return super()._post(url, json, timeout=timeout, data=data, headers=headers)
+
+        if data is None:
+            data = PacketSerializer.dumps(json)
+        compressed = compressor.compress(data)
+        if compressed is None:
+            return super()._post(url, timeout=timeout, data=data, headers=headers)
+
+        try:
+            response = super()._post(url, timeout=timeout, data=compressed,
+                                     headers={**(headers or {}), 'Content-Encoding': compressor.encoding})
+        except HTTPError as ex:
+            if ex.response is None or ex.response.status_code not in COMPRESSION_REJECTED_STATUS_CODES:
+                raise
+
+            # Find out whether it was the compression or the body the server didn't like. If the body is bad, this
+            # raises and we keep compressing
+            response = super()._post(url, timeout=timeout, data=data, headers=headers)
+            logging.warning(f"{self.base_url} rejected a {compressor.encoding} body ({ex.response.status_code}) but "
+                            f"accepted it uncompressed, disabling compression")
+            self.compressor = None
+            self.counters.incr('compression_disabled')
+            return response
+
+        self.counters.incr('compressed_requests')
+        self.counters.incr('bytes_before_compression', len(data))
+        self.counters.incr('bytes_after_compression', len(compressed))
+        return response
 
     def _get_url(self, path: str, args: dict = None):
         if args is None:
@@ -38,65 +204,187 @@ class StorageAPIWrapper(BaseAPIWrapper):
             my_nodenum = self.bot.my_nodenum
             api_paths = {
                 'raw_packet': f'/api/packets/{my_nodenum}/ingest/',
+                'raw_packet_bulk': f'/api/packets/{my_nodenum}/ingest/bulk/',
+                'raw_packet_protobuf': f'/api/packets/{my_nodenum}/ingest/protobuf/',
                 'nodes': f'/api/packets/{my_nodenum}/nodes/',
+                'nodes_bulk': f'/api/packets/{my_nodenum}/nodes/bulk/',
                 'node_by_id': f'/api/nodes/{args.get("node_id", "")}',
             }
 
         return api_paths[path]
 
+    @staticmethod
+    def _idempotency_headers(packet: dict) -> dict:
+        """
+        A key identifying the packet, so the API can recognise a retry of a packet it already stored. The same packet
+        relayed by several nodes has the same key
+        """
+        sender, packet_id = packet.get('from'), packet.get('id')
+        if sender is None or not packet_id:
+            return {}
+        return {IDEMPOTENCY_KEY_HEADER: f"{sender}-{packet_id}"}
 
     @classmethod
-    def _sanitise_raw_packet(cls, data):
-        if isinstance(data, dict):
-            # We never want these pesky raw fields
-            if 'raw' in data:
-                data.pop('raw')
-
-            return {key: cls._sanitise_raw_packet(value) for key, value in data.items()}
-        elif isinstance(data, list):
-            return [cls._sanitise_raw_packet(item) for item in data]
-        elif isinstance(data, bytes):
-            return base64.b64encode(data).decode('utf-8')
-        else:
-            return data
+    def prepare_packet(cls, packet: dict) -> dict:
+        """
+        Convert a packet from the meshtastic library into the JSON form the API expects
+        """
+        return PreparedPacket(packet).api_dict
 
-    def store_raw_packet(self, packet: dict):
+    def store_raw_packet(self, packet: dict, deadline: Deadline = None):
         """
         Store a raw packet in the storage API
+
+        @param deadline: If given, the request's timeouts are clamped to the time left before the deadline
+        """
+        return self.store_prepared_packet(PreparedPacket(packet), deadline)
+
+    def store_prepared_packet(self, packet: PreparedPacket, deadline: Deadline = None):
+        """
+        Store a packet in the storage API. Lets callers sending the same packet to several APIs share its conversions
+        """
+        if self.protobuf_supported and packet.raw is not None:
+            return self._post_protobuf_packet(packet, deadline)
+
+        if self._batcher is not None and self.bulk_supported:
+            self._batcher.add(packet.api_dict)
+            return
+
+        return self._post_packet(packet.api_dict, deadline)
+
+    def defer_packet(self, packet: PreparedPacket, reason: str):
+        """
+        Hand a packet which wasn't uploaded, e.g. because its upload deadline expired, to the retry path
+        """
+        logging.warning(f"Deferring packet {packet.id} for {self.base_url}: {reason}")
+        self._spool_packet(packet.api_dict, reason)
+
+    def replay_packet(self, packet: dict):
+        """
+        Re-send a (sanitised) packet from the spool. Unlike store_raw_packet, errors are raised to the caller
+        """
+        response = self._post(self._get_url('raw_packet'), data=PacketSerializer.dumps(packet),
+                              headers=self._idempotency_headers(packet) or None)
+        return response.json()
+
+    def _store_packet_batch(self, packets: list[dict]):
+        """
+        Send a batch of (sanitised) packets to the bulk ingest endpoint, falling back to individual posts if the
+        server doesn't support it
         """
-        # Convert bytes to Base64-encoded strings recursively
-        raw_packet: MeshPacket = packet.get('raw')
-        packet = StorageAPIWrapper._sanitise_raw_packet(packet)
+        if not self.bulk_supported:
+            for packet in packets:
+                self._post_packet(packet)
+            return
 
-        # Some fields are not present in the packet if they're a nullish value, so we need to get them from the raw packet
-        if raw_packet:
-            if 'channel' not in packet:
-                packet['channel'] = raw_packet.channel
+        logging.debug(f"Storing batch of {len(packets)} packets")
+        try:
+            response = self._post(self._get_url('raw_packet_bulk'), data=PacketSerializer.dumps(packets))
+            return response.json()
+        except HTTPError as ex:
+            if ex.response is not None and ex.response.status_code in BULK_UNSUPPORTED_STATUS_CODES:
+                logging.warning(f"Bulk ingest not supported by {self.base_url} ({ex.response.status_code}), "
+                                f"falling back to single packet uploads")
+                self.bulk_supported = False
+                for packet in packets:
+                    self._post_packet(packet)
+                return
+
+            logging.error(f"HTTP error storing batch of {len(packets)} packets: {ex.response.text}")
+            for packet in packets:
+                self._handle_failed_packet(packet, ex)
+        except Exception as ex:
+            if not isinstance(ex, CircuitOpenError):
+                logging.error(f"Error storing batch of {len(packets)} packets: {ex}")
+            for packet in packets:
+                self._handle_failed_packet(packet, ex)
 
+    def _post_packet(self, packet: dict, deadline: Deadline = None, attempt: int = 1):
         logging.debug(f"Storing packet: {packet}")
         try:
-            response = self._post(self._get_url('raw_packet'), json=packet)
+            timeout = self._clamp_timeout(deadline)
+            response = self._post(self._get_url('raw_packet'), data=PacketSerializer.dumps(packet), timeout=timeout,
+                                  headers=self._idempotency_headers(packet) or None)
 
+            self.counters.incr('packets_stored')
             response_json = response.json()
             return response_json
+        except Exception as ex:
+            self._handle_post_error(packet, ex, attempt)
+
+    def _post_protobuf_packet(self, packet: PreparedPacket, deadline: Deadline = None):
+        """
+        Send the packet's original protobuf. Failed packets are spooled (and replayed) as JSON
+        """
+        try:
+            timeout = self._clamp_timeout(deadline)
+            response = self._post(self._get_url('raw_packet_protobuf'), data=packet.envelope_bytes(self.bot.my_id),
+                                  timeout=timeout, headers={'Content-Type': PROTOBUF_CONTENT_TYPE,
+                                                            **self._idempotency_headers(packet.packet)})
+
+            self.counters.incr('packets_stored')
+            self.counters.incr('protobuf_packets_stored')
+            return response.json()
         except HTTPError as ex:
-            logging.error(f"HTTP error storing packet: {ex.response.text}")
-            logging.error(f"Packet: {packet}")
+            if ex.response is not None and ex.response.status_code in PROTOBUF_UNSUPPORTED_STATUS_CODES:
+                logging.warning(f"Protobuf ingest not supported by {self.base_url} ({ex.response.status_code}), "
+                                f"falling back to JSON uploads")
+                self.protobuf_supported = False
+                return self.store_prepared_packet(packet, deadline)
+            self._handle_post_error(packet.api_dict, ex)
+        except Exception as ex:
+            self._handle_post_error(packet.api_dict, ex)
 
-            # Dump the packet to a .json file
-            if self.failed_packets_dir:
-                self._dump_failed_packet(packet, ex)
+    def _handle_post_error(self, packet: dict, ex: Exception, attempt: int = 1):
+        if isinstance(ex, CircuitOpenError):
+            # The API is known to be down - straight to the spool, without logging every packet
+            self._spool_packet(packet, 'circuit breaker open')
+            return
+
+        if isinstance(ex, HTTPError):
+            logging.error(f"HTTP error storing packet {packet.get('id')}: {ex.response.text}")
+        elif isinstance(ex, DeadlineExceededError):
+            # Already counted by _clamp_timeout
+            logging.warning(f"Upload deadline exceeded storing packet {packet.get('id')}")
+        else:
+            if isinstance(ex, Timeout):
+                self.counters.incr('timeouts')
+            logging.error(f"Error storing packet {packet.get('id')}: {ex}")
+        logging.debug(f"Packet: {packet}")
+        self._handle_failed_packet(packet, ex, attempt)
+
+    def _handle_failed_packet(self, packet: dict, ex: Exception, attempt: int = 1):
+        """
+        Retry a packet whose upload failed with a retryable error, after a backoff. Once its attempts run out, spool it.
+        Packets the API rejected outright are spooled for inspection, but won't be replayed
+        """
+        retryable = is_retryable_error(ex)
+        if retryable and self._retry_scheduler is not None and not isinstance(ex, CircuitOpenError) \
+                and self.retry_policy.should_retry(attempt):
+            self.counters.incr('retries')
+            self._retry_scheduler.schedule(
+                self.retry_policy.backoff(attempt),
+                lambda: self._post_packet(packet, attempt=attempt + 1),
+                on_cancel=lambda: self._spool_packet(packet, 'shut down before retry'))
             return
-        except Exception as ex:
-            logging.error(f"Error storing packet: {ex}")
-            logging.error(f"Packet: {packet}")
 
-            # Dump the packet to a .json file
-            if self.failed_packets_dir:
-                self._dump_failed_packet(packet, ex)
+        self.counters.incr('packets_failed')
+        if isinstance(ex, HTTPError) and ex.response is not None:
+            error = f"HTTP {ex.response.status_code}: {ex.response.text}"
+        else:
+            error = repr(ex)
+        self._spool_packet(packet, error, dead=not retryable)
 
+    def _spool_packet(self, packet: dict, error: str, dead: bool = False):
+        if not self.spool:
             return
 
+        try:
+            self.spool.append(self.base_url, packet, error, dead=dead)
+            self.counters.incr('spooled_dead' if dead else 'spooled')
+        except Exception as spool_ex:
+            logging.error(f"Failed to spool packet {packet.get('id')}: {spool_ex}")
+
     def list_nodes(self) -> list[MeshNode]:
         """
         Get a list of all nodes stored in the storage API. This list generally does not include position or metrics data.
@@ -106,7 +394,7 @@ class StorageAPIWrapper(BaseAPIWrapper):
 
         return [MeshNodeSerializer.from_api_dict(node_data) for node_data in response_json]
 
-    def store_node(self, node: MeshNode):
+    def store_node(self, node: MeshNode, deadline: Deadline = None):
         """
         Create a or update a node in the storage API
 
@@ -114,10 +402,88 @@ class StorageAPIWrapper(BaseAPIWrapper):
         """
 
         node_data = MeshNodeSerializer.to_api_dict(node)
+        return self.store_node_data(node_data, deadline)
+
+    def store_node_data(self, node_data: dict, deadline: Deadline = None):
+        """
+        Store a node which has already been serialised with MeshNodeSerializer.to_api_dict. Skipped (returning None)
+        if the API already has the same data
+        """
+        fingerprint = None
+        if self.node_fingerprints is not None:
+            fingerprint = self.node_fingerprints.fingerprint(node_data)
+            if self.node_fingerprints.is_unchanged(node_data['id'], fingerprint):
+                self.counters.incr('nodes_unchanged')
+                return None
+
+        try:
+            timeout = self._clamp_timeout(deadline)
+            response = self._post(self._get_url('nodes'), json=node_data, timeout=timeout)
+        except CircuitOpenError:
+            # Nodes are re-sent on their next update, so there's no need to spool them
+            return None
+        except DeadlineExceededError:
+            logging.warning(f"Upload deadline exceeded, skipping node {node_data['id']} for {self.base_url}")
+            return None
+
+        self.counters.incr('nodes_stored')
+        if fingerprint is not None:
+            self.node_fingerprints.record(node_data['id'], fingerprint)
+        return response.json()
+
+    def store_nodes(self, nodes: list[dict], deadline: Deadline = None):
+        """
+        Store several (serialised) nodes, in one request if the API supports it. Unchanged nodes are skipped
+        """
+        changed = []
+        for node_data in nodes:
+            fingerprint = None
+            if self.node_fingerprints is not None:
+                fingerprint = self.node_fingerprints.fingerprint(node_data)
+                if self.node_fingerprints.is_unchanged(node_data['id'], fingerprint):
+                    self.counters.incr('nodes_unchanged')
+                    continue
+            changed.append((node_data, fingerprint))
+
+        if not changed:
+            return None
+        if not self.nodes_bulk_supported or len(changed) == 1:
+            return self._store_nodes_individually([node_data for node_data, _ in changed], deadline)
 
-        response = self._post(self._get_url('nodes'), json=node_data)
+        try:
+            timeout = self._clamp_timeout(deadline)
+            response = self._post(self._get_url('nodes_bulk'), json=[node_data for node_data, _ in changed],
+                                  timeout=timeout)
+        except CircuitOpenError:
+            return None
+        except DeadlineExceededError:
+            logging.warning(f"Upload deadline exceeded, skipping {len(changed)} nodes for {self.base_url}")
+            return None
+        except HTTPError as ex:
+            if ex.response is None or ex.response.status_code not in BULK_UNSUPPORTED_STATUS_CODES:
+                raise
+            logging.warning(f"Bulk node upload not supported by {self.base_url} ({ex.response.status_code}), "
+                            f"falling back to single node uploads")
+            self.nodes_bulk_supported = False
+            return self._store_nodes_individually([node_data for node_data, _ in changed], deadline)
+
+        self.counters.incr('nodes_stored', len(changed))
+        if self.node_fingerprints is not None:
+            for node_data, fingerprint in changed:
+                self.node_fingerprints.record(node_data['id'], fingerprint)
         return response.json()
 
+    def _store_nodes_individually(self, nodes: list[dict], deadline: Deadline = None):
+        for node_data in nodes:
+            try:
+                self.store_node_data(node_data, deadline)
+            except HTTPError as ex:
+                self.counters.incr('errors')
+                logging.warning(f"Error storing node {node_data['id']} in {self.base_url}: {ex.response.text}")
+            except Exception as ex:
+                self.counters.incr('errors')
+                logging.warning(f"Error storing node {node_data['id']} in {self.base_url}: {ex}")
+
     def get_node_by_id(self, node_id: Union[int, str], include_positions=0, include_metrics=0) -> MeshNode | None:
         """
         Get a node by the int or hex representation of its ID
@@ -133,48 +499,3 @@ class StorageAPIWrapper(BaseAPIWrapper):
             return MeshNodeSerializer.from_api_dict(response_json)
         else:
             return None
-
-    def _dump_failed_packet(self, packet, ex: HTTPError):
-        raw_packet: MeshPacket = packet.get('raw', None)
-
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-
-        # ensure output dir exists
-        os.makedirs(self.failed_packets_dir, exist_ok=True)
-
-        try:
-            error_info = {
-                'status_code': ex.response.status_code,
-                'reason': ex.response.reason,
-                'text': ex.response.text,
-                'url': ex.response.url,
-                'headers': dict(ex.response.headers),
-                'traceback': traceback.format_exc()
-            }
-            filename = f"failed_packet_{timestamp}_error.json"
-            filepath = self.failed_packets_dir / filename
-            with open(filepath, 'w') as f:
-                json.dump(error_info, f, indent=4)
-            logging.info(f"Error dumped to {filename}")
-        except Exception as dump_ex:
-            logging.error(f"Failed to dump error: {dump_ex}")
-
-        try:
-            filename = f"failed_packet_{timestamp}.json"
-            filepath = self.failed_packets_dir / filename
-            with open(filepath, 'w') as f:
-                json.dump(packet, f, indent=4)
-            logging.info(f"Packet dumped to {filename}")
-        except Exception as dump_ex:
-            logging.error(f"Failed to dump packet: {dump_ex}")
-
-        # Dump the raw packet to a .json file
-        if raw_packet:
-            try:
-                filename = f"failed_packet_{timestamp}_raw.json"
-                filepath = self.failed_packets_dir / filename
-                with open(filepath, 'w') as f:
-                    json.dump(raw_packet, f, indent=4)
-                logging.info(f"Raw packet dumped to {filename}")
-            except Exception as dump_ex:
-                logging.error(f"Failed to dump raw packet: {dump_ex}")
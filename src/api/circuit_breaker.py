@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+
+from src.utils.counters import Counters
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of a single endpoint so callers can stop paying for calls that are bound to fail.
+
+    - closed: calls go through. After `failure_threshold` consecutive failures the breaker opens
+    - open: calls are refused. After `probe_interval_sec` the breaker goes half-open
+    - half-open: a single probe call is let through. Success closes the breaker, failure re-opens it
+
+    Every call allowed by `allow_request` must be followed by `record_success` or `record_failure`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_PROBE_INTERVAL_SEC = 30.0
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 probe_interval_sec: float = DEFAULT_PROBE_INTERVAL_SEC, name: str = ''):
+        self.failure_threshold = max(1, failure_threshold)
+        self.probe_interval_sec = probe_interval_sec
+        self.name = name
+        self.counters = Counters()
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now - self._opened_at < self.probe_interval_sec:
+                    self.counters.incr('rejected')
+                    return False
+                self._transition(self.HALF_OPEN)
+
+            # Half-open: only one probe at a time. If a probe never reported back, allow another after an interval
+            if self._probe_started_at is not None and now - self._probe_started_at < self.probe_interval_sec:
+                self.counters.incr('rejected')
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+            if self._state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._probe_started_at = None
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        logger.info(f"CircuitBreaker {self.name}: {self._state} -> {state}")
+        self._state = state
+        self.counters.incr(f"to_{state}")
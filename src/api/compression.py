@@ -0,0 +1,59 @@
+import gzip
+import logging
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+
+class BodyCompressor:
+    """
+    Compresses request bodies for sending with a matching Content-Encoding header.
+
+    Bodies smaller than `min_bytes` aren't worth compressing and are left alone. zstd needs the optional `zstandard`
+    package; without it, gzip is used instead.
+    """
+
+    DEFAULT_MIN_BYTES = 1024
+
+    def __init__(self, encoding: str = GZIP, min_bytes: int = DEFAULT_MIN_BYTES, level: int = None):
+        if encoding == ZSTD and zstandard is None:
+            logger.warning("zstd compression requested but the zstandard package is not installed, using gzip")
+            encoding = GZIP
+        if encoding not in (GZIP, ZSTD):
+            raise ValueError(f"Unsupported compression: {encoding}")
+
+        self.encoding = encoding
+        self.min_bytes = min_bytes
+        # Fast levels: we're saving bandwidth on small JSON bodies, not archiving
+        self.level = level if level is not None else (3 if encoding == ZSTD else 5)
+        # zstandard compressors can't be shared between threads
+        self._local = threading.local()
+
+    def compress(self, data: bytes) -> bytes | None:
+        """
+        @return: The compressed body, or None if it should be sent as it is
+        """
+        if len(data) < self.min_bytes:
+            return None
+
+        if self.encoding == ZSTD:
+            compressed = self._zstd_compressor().compress(data)
+        else:
+            compressed = gzip.compress(data, compresslevel=self.level, mtime=0)
+
+        # Already-compressed or random data can grow
+        return compressed if len(compressed) < len(data) else None
+
+    def _zstd_compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor
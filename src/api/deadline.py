@@ -0,0 +1,41 @@
+import time
+
+from src.api.errors import DeadlineExceededError
+
+
+class Deadline:
+    """
+    An overall time budget for a unit of work (e.g. uploading one packet to every storage API).
+
+    Individual HTTP calls made under the deadline have their connect and read timeouts clamped to whatever budget is
+    left.
+    """
+
+    def __init__(self, seconds: float | None):
+        """
+        @param seconds: The budget, or None for no deadline
+        """
+        self.seconds = seconds
+        self._expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> float | None:
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self._expires_at is not None and time.monotonic() >= self._expires_at
+
+    def clamp_timeout(self, timeout: tuple[float, float]) -> tuple[float, float]:
+        """
+        Clamp a (connect, read) timeout so that neither exceeds the remaining budget
+
+        @raise DeadlineExceededError: If there's no budget left - a zero timeout isn't valid
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise DeadlineExceededError(f"Deadline of {self.seconds}s exceeded")
+        connect, read = timeout
+        return min(connect, remaining), min(read, remaining)
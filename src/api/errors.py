@@ -0,0 +1,38 @@
+from requests import ConnectionError, HTTPError, Timeout
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an API whose circuit breaker is open
+    """
+    pass
+
+
+class DeadlineExceededError(Timeout):
+    """
+    Raised instead of making a request once its upload deadline has passed. A Timeout, so it's retried like one
+    """
+    pass
+
+
+# 4xx responses which are worth retrying: the request itself was fine, the server just couldn't take it right now
+RETRYABLE_CLIENT_STATUS_CODES = (408, 425, 429)
+
+
+def is_retryable_error(ex: Exception) -> bool:
+    """
+    Whether a failed API call might succeed if we try again later.
+
+    Timeouts, dropped connections and 5xx responses are retryable. Other 4xx responses mean the server rejected the
+    request, and sending it again won't change that.
+    """
+    if isinstance(ex, CircuitOpenError):
+        return True
+
+    if isinstance(ex, HTTPError):
+        if ex.response is None:
+            return True
+        status_code = ex.response.status_code
+        return status_code >= 500 or status_code in RETRYABLE_CLIENT_STATUS_CODES
+
+    return isinstance(ex, (Timeout, ConnectionError, OSError))
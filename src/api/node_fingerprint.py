@@ -0,0 +1,61 @@
+import hashlib
+import json
+import threading
+import time
+
+# Set to when we logged the data, so they change on every update even when nothing else does
+_TIMESTAMP_KEYS = ('logged_time', 'reported_time')
+
+
+class NodeFingerprintCache:
+    """
+    Remembers a fingerprint of the last node data successfully sent for each node, so updates which don't change
+    anything can be skipped.
+
+    Timestamps are left out of the fingerprint. A node is always re-sent once its last upload is older than
+    `max_staleness_sec`, so the API still sees when it was last heard.
+    """
+
+    DEFAULT_MAX_STALENESS_SEC = 3600.0
+
+    def __init__(self, max_staleness_sec: float = DEFAULT_MAX_STALENESS_SEC):
+        self.max_staleness_sec = max_staleness_sec
+        self._lock = threading.Lock()
+        self._fingerprints: dict[str, tuple[bytes, float]] = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._fingerprints)
+
+    @staticmethod
+    def fingerprint(node_data: dict) -> bytes:
+        """
+        @param node_data: A node, as serialised by MeshNodeSerializer.to_api_dict
+        """
+        significant = {key: value for key, value in node_data.items() if key not in ('position', 'device_metrics')}
+        for key in ('position', 'device_metrics'):
+            section = node_data.get(key)
+            if section:
+                significant[key] = {k: v for k, v in section.items() if k not in _TIMESTAMP_KEYS}
+
+        encoded = json.dumps(significant, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+        return hashlib.blake2b(encoded, digest_size=16).digest()
+
+    def is_unchanged(self, node_id: str, fingerprint: bytes) -> bool:
+        """
+        @return: True if this node was last sent with the same fingerprint, and not too long ago
+        """
+        with self._lock:
+            previous = self._fingerprints.get(node_id)
+        if previous is None:
+            return False
+
+        previous_fingerprint, sent_at = previous
+        return previous_fingerprint == fingerprint and time.monotonic() - sent_at < self.max_staleness_sec
+
+    def record(self, node_id: str, fingerprint: bytes):
+        """
+        Record that the node was sent successfully
+        """
+        with self._lock:
+            self._fingerprints[node_id] = (fingerprint, time.monotonic())
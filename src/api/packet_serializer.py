@@ -0,0 +1,131 @@
+import json
+import threading
+from base64 import b64encode
+
+from meshtastic.protobuf.mesh_pb2 import MeshPacket
+from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+
+# Values of these types are copied into the output as-is
+_SCALAR_TYPES = frozenset({str, int, float, bool, type(None)})
+
+# The meshtastic library attaches the protobuf it decoded under this key, at the top level and in decoded sections
+_RAW_KEY = 'raw'
+
+
+class PacketSerializer:
+    """
+    Converts packets from the meshtastic library into what the storage API expects: JSON, without the `raw`
+    protobufs, and with bytes (e.g. `decoded.payload`) as base64 strings.
+    """
+
+    @classmethod
+    def to_api_dict(cls, packet: dict) -> dict:
+        """
+        Build a JSON-safe copy of the packet in a single (non-recursive) pass. The input packet is not modified
+        """
+        result = {}
+        stack = [(packet, result)]
+
+        while stack:
+            source, target = stack.pop()
+
+            if not isinstance(source, dict):
+                for value in source:
+                    value_type = type(value)
+                    if value_type in _SCALAR_TYPES:
+                        target.append(value)
+                    elif value_type is bytes:
+                        target.append(b64encode(value).decode('ascii'))
+                    else:
+                        target.append(cls._convert_container(value, stack))
+                continue
+
+            for key, value in source.items():
+                if key == _RAW_KEY:
+                    continue
+                value_type = type(value)
+                if value_type in _SCALAR_TYPES:
+                    target[key] = value
+                elif value_type is bytes:
+                    target[key] = b64encode(value).decode('ascii')
+                else:
+                    target[key] = cls._convert_container(value, stack)
+
+        return result
+
+    @classmethod
+    def dumps(cls, data) -> bytes:
+        """
+        Encode an already-converted packet (or list of packets) as compact UTF-8 JSON
+        """
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False, check_circular=False).encode('utf-8')
+
+    @classmethod
+    def to_json_bytes(cls, packet: dict) -> bytes:
+        return cls.dumps(cls.to_api_dict(packet))
+
+    @classmethod
+    def to_envelope_bytes(cls, raw_packet: MeshPacket, gateway_id: str) -> bytes:
+        """
+        Wrap the packet's original protobuf in a ServiceEnvelope (as used by MQTT gateways), recording which node
+        received it. The rx metadata (time, SNR, RSSI, hops) is already part of the MeshPacket
+        """
+        return ServiceEnvelope(packet=raw_packet, gateway_id=gateway_id or '').SerializeToString()
+
+    @staticmethod
+    def _convert_container(value, stack: list):
+        """
+        Queue a nested dict or list to be converted, returning the (not yet filled) container it'll be written to.
+        Anything else is passed through for json to deal with
+        """
+        if isinstance(value, dict):
+            target = {}
+        elif isinstance(value, (list, tuple)):
+            target = []
+        elif isinstance(value, (bytes, bytearray)):
+            return b64encode(value).decode('ascii')
+        else:
+            return value
+
+        stack.append((value, target))
+        return target
+
+
+class PreparedPacket:
+    """
+    A packet on its way to the storage APIs. Each upload format is built the first time an API asks for it, then
+    shared with the others, so a packet is never converted more than once per format.
+    """
+
+    def __init__(self, packet: dict):
+        self.packet = packet
+        self.raw: MeshPacket | None = packet.get('raw')
+        self._lock = threading.Lock()
+        self._envelopes: dict[str, bytes] = {}
+        self._api_dict: dict | None = None
+
+    @property
+    def id(self):
+        return self.packet.get('id')
+
+    @property
+    def api_dict(self) -> dict:
+        # Read from every fan-out thread at once, and cached_property doesn't lock (since Python 3.12)
+        with self._lock:
+            if self._api_dict is None:
+                api_dict = PacketSerializer.to_api_dict(self.packet)
+
+                # Some fields are not present in the packet if they're a nullish value, so we need to get them from the
+                # raw packet
+                if self.raw:
+                    if 'channel' not in api_dict:
+                        api_dict['channel'] = self.raw.channel
+
+                self._api_dict = api_dict
+            return self._api_dict
+
+    def envelope_bytes(self, gateway_id: str) -> bytes:
+        with self._lock:
+            if gateway_id not in self._envelopes:
+                self._envelopes[gateway_id] = PacketSerializer.to_envelope_bytes(self.raw, gateway_id)
+            return self._envelopes[gateway_id]
@@ -0,0 +1,114 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and full jitter: before retry N, wait a random time between 0 and
+    `base_delay_sec * 2^(N-1)`, capped at `max_delay_sec`. The jitter stops clients which failed together from
+    retrying together.
+    """
+
+    DEFAULT_MAX_ATTEMPTS = 3
+    DEFAULT_BASE_DELAY_SEC = 1.0
+    DEFAULT_MAX_DELAY_SEC = 30.0
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay_sec: float = DEFAULT_BASE_DELAY_SEC,
+                 max_delay_sec: float = DEFAULT_MAX_DELAY_SEC):
+        """
+        @param max_attempts: Total attempts, including the first. 1 disables retries
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_sec = base_delay_sec
+        self.max_delay_sec = max_delay_sec
+
+    def should_retry(self, attempt: int) -> bool:
+        """
+        @param attempt: The attempt which just failed, starting at 1
+        """
+        return attempt < self.max_attempts
+
+    def backoff(self, attempt: int) -> float:
+        """
+        @param attempt: The attempt which just failed, starting at 1
+        @return: Seconds to wait before the next attempt
+        """
+        cap = min(self.max_delay_sec, self.base_delay_sec * (2 ** (attempt - 1)))
+        return random.uniform(0, cap)
+
+
+class RetryScheduler:
+    """
+    Runs callbacks after a delay on a single background thread, so callers never block waiting to retry.
+
+    Callbacks still pending when the scheduler is closed aren't run; their `on_cancel` is called instead (e.g. to
+    spool the work for later).
+    """
+
+    def __init__(self, name: str = 'retry'):
+        self.name = name
+        self._heap: list[tuple[float, int, Callable, Callable | None]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"{name}-scheduler", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def schedule(self, delay_sec: float, fn: Callable[[], None], on_cancel: Callable[[], None] = None):
+        with self._cond:
+            if not self._running:
+                cancelled = True
+            else:
+                cancelled = False
+                heapq.heappush(self._heap, (time.monotonic() + delay_sec, next(self._sequence), fn, on_cancel))
+                # Wake the scheduler in case this is now the first callback due
+                self._cond.notify()
+
+        if cancelled and on_cancel:
+            on_cancel()
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+            pending = [heapq.heappop(self._heap) for _ in range(len(self._heap))]
+        self._thread.join()
+
+        for _, _, _, on_cancel in pending:
+            if on_cancel:
+                self._call(on_cancel)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._heap:
+                        wait = self._heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+
+                if not self._running:
+                    return
+                _, _, fn, _ = heapq.heappop(self._heap)
+
+            self._call(fn)
+
+    def _call(self, fn: Callable[[], None]):
+        try:
+            fn()
+        except Exception as ex:
+            logger.error(f"RetryScheduler '{self.name}': callback failed: {ex}")
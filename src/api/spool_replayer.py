@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from src.api.errors import CircuitOpenError, is_retryable_error
+from src.persistence.upload_spool import AbstractUploadSpool
+from src.utils.counters import Counters
+
+if TYPE_CHECKING:
+    from src.api.StorageAPI import StorageAPIWrapper
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolReplayer:
+    """
+    Background thread which drains a storage API's packets from the upload spool.
+
+    Packets are re-sent oldest first, no faster than `rate_per_sec`. When a replay fails with a retryable error the
+    API is assumed to still be unhealthy, and the replayer backs off (exponentially, up to `max_backoff_sec`) before
+    probing again with the same packet. Packets the API rejects are marked dead and skipped.
+
+    Every `purge_interval_sec` it also purges the spool of packets past its retention limits.
+    """
+
+    DEFAULT_RATE_PER_SEC = 5.0
+
+    def __init__(self, storage_api: "StorageAPIWrapper", spool: AbstractUploadSpool,
+                 rate_per_sec: float = DEFAULT_RATE_PER_SEC, batch_size: int = 50,
+                 idle_interval_sec: float = 30.0, max_backoff_sec: float = 300.0,
+                 purge_interval_sec: float = 3600.0):
+        self.storage_api = storage_api
+        self.spool = spool
+        self.min_interval = 1 / rate_per_sec if rate_per_sec > 0 else 0
+        self.batch_size = batch_size
+        self.idle_interval_sec = idle_interval_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.purge_interval_sec = purge_interval_sec
+        self.counters = Counters()
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._backoff = idle_interval_sec
+        self._last_send = 0.0
+        # The spool purges itself on startup
+        self._next_purge = time.monotonic() + purge_interval_sec
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"spool-replayer-{self.storage_api.base_url}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                wait = self.replay_once()
+            except Exception as ex:
+                logger.error(f"SpoolReplayer: unexpected error: {ex}")
+                wait = self.idle_interval_sec
+            if wait:
+                self._stop.wait(wait)
+
+    def replay_once(self) -> float:
+        """
+        Replay up to one batch of spooled packets
+
+        @return: How long to wait before the next call
+        """
+        if time.monotonic() >= self._next_purge:
+            self.spool.purge()
+            self._next_purge = time.monotonic() + self.purge_interval_sec
+
+        if self.storage_api.api_version != 1 and self.storage_api.bot.my_nodenum is None:
+            # v2 URLs include our node number, so we can't replay until we're connected to the radio
+            return self.idle_interval_sec
+
+        entries = self.spool.peek(self.storage_api.base_url, self.batch_size)
+        if not entries:
+            return self.idle_interval_sec
+
+        for entry in entries:
+            if self._stop.is_set():
+                return 0
+            self._throttle()
+
+            try:
+                self.storage_api.replay_packet(entry.payload)
+            except CircuitOpenError:
+                # The live upload path is probing the API; wait for it to recover
+                return self.idle_interval_sec
+            except Exception as ex:
+                if is_retryable_error(ex):
+                    self.spool.record_failure(entry.id, repr(ex))
+                    self.counters.incr('failed')
+                    wait = self._backoff
+                    self._backoff = min(self._backoff * 2, self.max_backoff_sec)
+                    logger.info(f"SpoolReplayer: {self.storage_api.base_url} still unavailable ({ex}), "
+                                f"retrying in {wait:.0f}s")
+                    return wait
+
+                self.spool.record_failure(entry.id, repr(ex), dead=True)
+                self.counters.incr('rejected')
+                continue
+
+            self.spool.remove(entry.id)
+            self.counters.incr('replayed')
+            self._backoff = self.idle_interval_sec
+
+        logger.info(f"SpoolReplayer: processed {len(entries)} spooled packets for {self.storage_api.base_url}, "
+                    f"{self.spool.count(self.storage_api.base_url)} remaining")
+        return 0
+
+    def _throttle(self):
+        wait = self._last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        self._last_send = time.monotonic()
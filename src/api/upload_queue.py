@@ -0,0 +1,140 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+from src.utils.counters import Counters
+
+logger = logging.getLogger(__name__)
+
+
+class UploadQueue:
+    """
+    Bounded in-process work queue, drained by a pool of worker threads.
+
+    Used to move storage API uploads off the Meshtastic receive thread: the pubsub callbacks only
+    enqueue work, so a slow API can never stall the radio reader. When the queue is full, new work
+    is dropped (and counted) rather than blocking the caller.
+    """
+
+    DEFAULT_MAX_SIZE = 1000
+    DEFAULT_WORKERS = 2
+    # Weight of the newest task in the moving average of queue wait
+    LATENCY_SMOOTHING = 0.2
+    # With no new samples, the average halves every this many seconds, so a quiet queue doesn't keep reporting the
+    # wait from its last burst
+    LATENCY_HALF_LIFE_SEC = 10.0
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, workers: int = DEFAULT_WORKERS, name: str = 'upload'):
+        self.name = name
+        self.max_size = max_size
+        self.worker_count = max(1, workers)
+        self.counters = Counters()
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._threads: list[threading.Thread] = []
+        self._running = False
+        self._latency_ms = 0.0
+        self._latency_at = time.monotonic()
+        self._latency_lock = threading.Lock()
+
+    @property
+    def depth(self) -> int:
+        """Number of tasks waiting to be picked up by a worker."""
+        return self._queue.qsize()
+
+    @property
+    def latency_ms(self) -> float:
+        """
+        Exponentially weighted moving average of how long timed tasks wait in the queue before a worker picks them
+        up, decaying towards zero while no tasks are picked up
+        """
+        with self._latency_lock:
+            return self._decayed_latency_ms(time.monotonic())
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"UploadQueue '{self.name}': started {self.worker_count} workers (max size {self.max_size})")
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Stop the workers once the queue has drained, waiting up to `timeout` seconds for each worker
+        """
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._threads:
+            # Sentinels go in behind any outstanding work, so the queue drains before the workers exit
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+        remaining = self.depth
+        if remaining:
+            logger.warning(f"UploadQueue '{self.name}': stopped with {remaining} tasks still queued")
+
+    def submit(self, fn: Callable, *args, timed: bool = True, **kwargs) -> bool:
+        """
+        Queue `fn(*args, **kwargs)` for execution on a worker thread.
+
+        Returns False (and counts a drop) if the queue is full.
+
+        @param timed: Whether the task's queue wait counts towards latency_ms
+        """
+        try:
+            self._queue.put_nowait((fn, args, kwargs, time.monotonic() if timed else None))
+        except queue.Full:
+            self.counters.incr('dropped')
+            logger.warning(f"UploadQueue '{self.name}': queue full ({self.max_size}), dropping task")
+            return False
+
+        self.counters.incr('submitted')
+        return True
+
+    def stats(self) -> dict[str, int]:
+        stats = self.counters.snapshot()
+        stats['depth'] = self.depth
+        stats['latency_ms'] = round(self.latency_ms)
+        return stats
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+
+                fn, args, kwargs, submitted_at = task
+                if submitted_at is not None:
+                    self._record_latency((time.monotonic() - submitted_at) * 1000)
+                try:
+                    fn(*args, **kwargs)
+                    self.counters.incr('completed')
+                except Exception as ex:
+                    self.counters.incr('failed')
+                    logger.warning(f"UploadQueue '{self.name}': task failed: {ex}")
+            finally:
+                self._queue.task_done()
+
+    def _record_latency(self, latency_ms: float):
+        with self._latency_lock:
+            now = time.monotonic()
+            average = self._decayed_latency_ms(now)
+            self._latency_ms = average + self.LATENCY_SMOOTHING * (latency_ms - average)
+            self._latency_at = now
+
+    def _decayed_latency_ms(self, now: float) -> float:
+        # Caller holds self._latency_lock
+        return self._latency_ms * 0.5 ** ((now - self._latency_at) / self.LATENCY_HALF_LIFE_SEC)
+
+    def join(self):
+        """Block until every queued task has been processed. Mostly useful in tests."""
+        self._queue.join()
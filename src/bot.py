@@ -1,7 +1,10 @@
 import logging
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
+from typing import Callable
 
 import schedule
 from meshtastic.protobuf.mesh_pb2 import MeshPacket
@@ -9,11 +12,18 @@ from pubsub import pub
 from requests import HTTPError
 
 from src.api.StorageAPI import StorageAPIWrapper
+from src.api.deadline import Deadline
+from src.api.packet_serializer import PreparedPacket
+from src.api.serializers import MeshNodeSerializer
 from src.commands.factory import CommandFactory
 from src.data_classes import MeshNode
 from src.helpers import pretty_print_last_heard, safe_encode_node_name
+from src.packet_dedup import PacketDeduplicator
+from src.packet_filters import PacketFilter
+from src.load_shedder import LoadShedder
+from src.packet_lanes import PacketLanes
 from src.persistence.commands_logger import AbstractCommandLogger
-from src.persistence.node_db import AbstractNodeDB
+from src.persistence.node_db import AbstractNodeDB, CachingNodeDB
 from src.persistence.node_info import AbstractNodeInfoStore
 from src.persistence.packet_dump import dump_packet
 from src.persistence.user_prefs import AbstractUserPrefsPersistence
@@ -21,13 +31,12 @@ from src.responders.responder_factory import ResponderFactory
 from src.tcp_interface import (AutoReconnectTcpInterface,
                                SupportsMessageReactionInterface)
 from src.traceroute import on_traceroute_command
+from src.utils.batcher import Batcher
 
 
 class MeshtasticBot:
     admin_nodes: list[str]
-    ignore_portnums: (
-        frozenset  # Portnums to skip when submitting to API (from IGNORE_PORTNUMS env)
-    )
+    packet_filter: PacketFilter  # Packets matching these rules aren't submitted to the API
 
     interface: SupportsMessageReactionInterface
     init_complete: bool
@@ -41,13 +50,19 @@ class MeshtasticBot:
     user_prefs_persistence: AbstractUserPrefsPersistence
 
     storage_apis: list[StorageAPIWrapper]
+    packet_lanes: PacketLanes | None  # When set, packet work runs off the receive thread, in lanes by portnum
+    load_shedder: LoadShedder | None  # When set (with packet_lanes), low-value packets are thinned out under backpressure
+    upload_deadline_sec: float | None  # Overall time budget for uploading one packet/node to every storage API
+    fanout_executor: ThreadPoolExecutor  # Runs the calls to each storage API in parallel
+    packet_dedup: PacketDeduplicator | None  # When set, copies of already-received packets are dropped
+    node_update_coalescer: Batcher[MeshNode] | None  # When set, node updates are stored/uploaded in coalesced batches
     ws_client: object | None  # MeshflowWSClient when configured
 
     def __init__(self, address: str):
         self.address = address
 
         self.admin_nodes = []
-        self.ignore_portnums = frozenset()
+        self.packet_filter = PacketFilter(PacketFilter.default_rules())
 
         self.interface = None
         self.init_complete = False
@@ -59,6 +74,12 @@ class MeshtasticBot:
         self.command_logger = None
         self.user_prefs_persistence = None
         self.storage_apis = []
+        self.packet_lanes = None
+        self.load_shedder = None
+        self.upload_deadline_sec = None
+        self.fanout_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='storage-fanout')
+        self.packet_dedup = None
+        self.node_update_coalescer = None
         self.ws_client = None
 
         pub.subscribe(self.on_receive, "meshtastic.receive")
@@ -134,6 +155,13 @@ class MeshtasticBot:
     def on_receive_text(self, packet: MeshPacket, interface):
         """Callback function triggered when a text message is received."""
 
+        if self.packet_lanes is not None:
+            # Commands have a lane of their own, so replies don't wait behind uploads (including this message's)
+            self.packet_lanes.submit_command(self._handle_text_packet, packet)
+        else:
+            self._handle_text_packet(packet)
+
+    def _handle_text_packet(self, packet: MeshPacket):
         to_id = packet["toId"]
 
         if to_id == self.my_id:
@@ -188,38 +216,28 @@ class MeshtasticBot:
         # dump the packet to disk (if enabled)
         dump_packet(packet)
 
+        # The same packet often arrives several times (multiple paths, rebroadcasts). Only the first copy is uploaded
+        # and counted
+        if self.packet_dedup is not None and self.packet_dedup.is_duplicate(packet):
+            logging.debug(f"Ignoring duplicate packet {packet.get('id')} from {packet.get('fromId')}")
+            return
+
         portnum = packet.get("decoded", {}).get("portnum", "unknown")
         portnum_key = str(portnum).upper()
-        has_decoded = "decoded" in packet or "decrypted" in packet
-
-        # Skip device metrics from self - node sends 1/min to connected clients;
-        # another bot will capture when broadcast over the air
         sender = packet.get("fromId")
-        skip_self_device_metrics = (
-            sender == self.my_id
-            and portnum_key == "TELEMETRY_APP"
-            and "deviceMetrics" in (packet.get("decoded", {}).get("telemetry") or {})
-        )
 
-        if self.ignore_portnums and portnum_key in self.ignore_portnums:
-            logging.info(
-                f"Skipping API submission for packet with portnum {portnum} (in IGNORE_PORTNUMS)"
-            )
-            # Continue with node_info etc. below, just skip storage API
-        elif not has_decoded:
-            pass  # Skip API submission for packets with no decoded data
-        elif skip_self_device_metrics:
-            pass  # Skip device metrics from self - another bot will capture over the air
+        # Continue with node_info etc. below for filtered packets, just skip storage API
+        filter_rule = self.packet_filter.match(packet, self.my_id)
+        if filter_rule:
+            logging.debug(f"Skipping API submission for {portnum_key} packet {packet.get('id')} "
+                          f"(filter '{filter_rule.name}')")
+        elif self._should_shed(portnum_key):
+            logging.debug(f"Load shedding: not uploading {portnum_key} packet {packet.get('id')}")
+        elif self.packet_lanes is not None:
+            # Shallow copy: the upload happens on a worker thread, after this callback has returned
+            self.packet_lanes.submit(portnum_key, self._store_packet, dict(packet))
         else:
-            for storage_api in self.storage_apis:
-                try:
-                    storage_api.store_raw_packet(packet)
-                except HTTPError as ex:
-                    logging.warning(f"Error storing packet: {ex.response.text}")
-                    pass
-                except Exception as ex:
-                    logging.warning(f"Error storing packet in API: {ex}")
-                    pass
+            self._store_packet(packet)
 
         node = self.node_db.get_by_id(sender)
         if not node:
@@ -244,6 +262,111 @@ class MeshtasticBot:
                 f"Received packet from self: {recipient.long_name if recipient else recipient_id} (port {portnum})"
             )
 
+    def _should_shed(self, portnum: str) -> bool:
+        """
+        Whether to skip uploading a packet because uploads are falling behind
+        """
+        if self.load_shedder is None or self.packet_lanes is None:
+            return False
+        return self.load_shedder.should_shed(portnum, self.packet_lanes.depth(), self.packet_lanes.latency_ms())
+
+    def _store_packet(self, packet: MeshPacket):
+        # Each upload format is built once, then shared by every API
+        payload = PreparedPacket(packet)
+
+        def on_expired(storage_api: StorageAPIWrapper, deadline: Deadline):
+            # Out of time: don't make this API wait, hand the packet to its retry path instead
+            storage_api.defer_packet(payload, f"upload deadline of {deadline.seconds}s exceeded")
+
+        self._fan_out(lambda storage_api, deadline: storage_api.store_prepared_packet(payload, deadline=deadline),
+                      on_expired, f"packet {packet.get('id')}")
+
+    def _store_node(self, mesh_node: MeshNode):
+        node_data = MeshNodeSerializer.to_api_dict(mesh_node)
+
+        def on_expired(storage_api: StorageAPIWrapper, deadline: Deadline):
+            # Nodes are re-sent on their next update, so there's nothing to retry here
+            logging.warning(f"Upload deadline exceeded, skipping node {mesh_node.user.id} for {storage_api.base_url}")
+
+        self._fan_out(lambda storage_api, deadline: storage_api.store_node_data(node_data, deadline=deadline),
+                      on_expired, f"node {mesh_node.user.id}")
+
+    def store_node_batch(self, nodes: list[MeshNode]):
+        """
+        Store a batch of node updates (at most one per node) in the node DB and the storage APIs
+        """
+        self.node_db.store_nodes(nodes)
+        if not self.storage_apis:
+            return
+
+        node_data = [MeshNodeSerializer.to_api_dict(mesh_node) for mesh_node in nodes]
+
+        def on_expired(storage_api: StorageAPIWrapper, deadline: Deadline):
+            logging.warning(f"Upload deadline exceeded, skipping {len(nodes)} nodes for {storage_api.base_url}")
+
+        self._fan_out(lambda storage_api, deadline: storage_api.store_nodes(node_data, deadline=deadline),
+                      on_expired, f"{len(nodes)} nodes")
+
+    def _fan_out(self, call: Callable[[StorageAPIWrapper, Deadline], None],
+                 on_expired: Callable[[StorageAPIWrapper, Deadline], None], description: str):
+        """
+        Make the same call against every storage API in parallel, so the slowest API (rather than the sum of all of
+        them) sets the latency. The whole fan-out shares one upload deadline.
+        """
+        deadline = Deadline(self.upload_deadline_sec)
+        # Each API is claimed once: by its worker (which either starts the call or, if the deadline has passed, defers
+        # it), or by the dispatcher giving up on a call which never started. Only the claimant counts the expiry
+        started_in_time: dict[StorageAPIWrapper, bool] = {}
+        claim_lock = threading.Lock()
+
+        def claim(storage_api: StorageAPIWrapper, in_time: bool) -> bool:
+            with claim_lock:
+                if storage_api in started_in_time:
+                    return False
+                started_in_time[storage_api] = in_time
+                return True
+
+        def expire(storage_api: StorageAPIWrapper):
+            storage_api.counters.incr('deadline_exceeded')
+            on_expired(storage_api, deadline)
+
+        def call_api(storage_api: StorageAPIWrapper):
+            in_time = not deadline.expired()
+            if not claim(storage_api, in_time):
+                # The dispatcher has already given up on this call and deferred it
+                return
+            if not in_time:
+                expire(storage_api)
+                return
+
+            try:
+                call(storage_api, deadline)
+            except HTTPError as ex:
+                storage_api.counters.incr('errors')
+                logging.warning(f"Error storing {description} in {storage_api.base_url}: {ex.response.text}")
+            except Exception as ex:
+                storage_api.counters.incr('errors')
+                logging.warning(f"Error storing {description} in {storage_api.base_url}: {ex}")
+
+        if len(self.storage_apis) == 1:
+            call_api(self.storage_apis[0])
+            return
+
+        futures = {self.fanout_executor.submit(call_api, storage_api): storage_api
+                   for storage_api in self.storage_apis}
+        _, not_done = wait(futures, timeout=deadline.remaining())
+        for future in not_done:
+            storage_api = futures[future]
+            future.cancel()
+            if claim(storage_api, False):
+                # Never started, so it's ours to hand to the retry path
+                expire(storage_api)
+            elif started_in_time[storage_api]:
+                # Already in flight. Its timeouts are clamped to the deadline, so it will give up (and spool) shortly
+                storage_api.counters.incr('deadline_overrun')
+                logging.warning(f"Upload deadline exceeded storing {description} in {storage_api.base_url}")
+            # Otherwise its worker found the deadline had passed, and deferred it itself
+
     def on_node_updated(self, node, interface):
         if interface.localNode and self.my_nodenum is None:
             self.my_nodenum = interface.localNode.nodeNum
@@ -254,18 +377,14 @@ class MeshtasticBot:
             mesh_node = MeshNode.from_dict(node)
             last_heard_int = node.get("lastHeard", 0)
             last_heard = datetime.fromtimestamp(last_heard_int, tz=timezone.utc)
-            self.node_db.store_node(mesh_node)
             self.node_info.update_last_heard(mesh_node.user.id, last_heard)
 
-            for storage_api in self.storage_apis:
-                try:
-                    storage_api.store_node(mesh_node)
-                except HTTPError as ex:
-                    logging.warning(f"Error storing node: {ex.response.text}")
-                    pass
-                except Exception as ex:
-                    logging.warning(f"Error storing node: {ex}")
-                    pass
+            if self.node_update_coalescer is not None:
+                # On connect we get an update for every node in the device's DB. Collapse these into bulk writes
+                self.node_update_coalescer.add(mesh_node)
+            else:
+                self.node_db.store_node(mesh_node)
+                self._store_node(mesh_node)
 
             if self.init_complete:
                 last_heard_str = pretty_print_last_heard(last_heard)
@@ -281,10 +400,13 @@ class MeshtasticBot:
         # print all nodes, sorted by last heard descending
         logging.info(f"Online nodes: ({len(online_nodes)})")
         sorted_nodes = sorted(online_nodes, key=lambda x: online_nodes[x], reverse=True)
+        nodes = self.node_db.get_by_ids(sorted_nodes)
         for node_id in sorted_nodes:
             if node_id == self.my_id:
                 continue
-            node = self.node_db.get_by_id(node_id)
+            node = nodes.get(node_id)
+            if not node:
+                continue
             last_heard = self.node_info.get_last_heard(node_id)
             last_heard = pretty_print_last_heard(last_heard)
             encoded_name = safe_encode_node_name(node.long_name)
@@ -299,8 +421,27 @@ class MeshtasticBot:
             "offline_nodes": self.node_info.get_offline_nodes(),
         }
 
+    def log_upload_stats(self):
+        if self.packet_dedup is not None:
+            logging.info(f"Packet dedup: {self.packet_dedup.counters.snapshot()}")
+        logging.info(f"Packet filters: {self.packet_filter.counters.snapshot()}")
+        if self.packet_lanes is not None:
+            logging.info(f"Packet lanes: {self.packet_lanes.stats()}")
+        if self.load_shedder is not None:
+            logging.info(f"Load shedding: {self.load_shedder.counters.snapshot()}")
+        if isinstance(self.node_db, CachingNodeDB):
+            logging.info(f"Node cache ({len(self.node_db)} nodes): {self.node_db.counters.snapshot()}")
+        # The APIs share one spool
+        spool = next((storage_api.spool for storage_api in self.storage_apis if storage_api.spool is not None), None)
+        if spool is not None:
+            logging.info(f"Upload spool ({spool.count()} pending): {spool.counters.snapshot()}")
+        for storage_api in self.storage_apis:
+            logging.info(f"Storage API {storage_api.base_url} (circuit {storage_api.breaker.state}): "
+                         f"{storage_api.counters.snapshot()}")
+
     def start_scheduler(self):
         schedule.every().day.at("00:00").do(self.node_info.reset_packets_today)
+        schedule.every(15).minutes.do(self.log_upload_stats)
         while True:
             schedule.run_pending()
             try:
@@ -309,7 +450,4 @@ class MeshtasticBot:
                 return
 
     def get_node_by_short_name(self, short_name: str) -> MeshNode.User | None:
-        for node in self.node_db.list_nodes():
-            if node.short_name.lower() == short_name.lower():
-                return node
-        return None
+        return self.node_db.get_by_short_name(short_name)
@@ -116,9 +116,10 @@ class AdminCommand(AbstractCommandWithSubcommands):
             user_id
         ))
 
+        nodes = self.bot.node_db.get_by_ids(user_ids)
         response = f"Users: {len(user_ids)}\n"
         for user_id in user_ids:
-            node = self.bot.node_db.get_by_id(user_id)
+            node = nodes.get(user_id)
             user_name = node.short_name if node else f"Unknown user {user_id}"
 
             known_requests = command_history[command_history['sender_id'] == user_id]
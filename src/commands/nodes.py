@@ -50,8 +50,8 @@ class NodesCommand(AbstractCommandWithSubcommands):
             self.send_busy_node_list(sender)
         elif args[0] == 'detailed':
             busy_nodes = self.get_busy_nodes()
-            for i, node in enumerate(busy_nodes[:self.max_node_count_detailed]):
-                self.send_detailed_nodeinfo(sender, node.id)
+            for node in busy_nodes[:self.max_node_count_detailed]:
+                self.send_detailed_nodeinfo(sender, node)
         else:
             node = self.bot.node_db.get_by_short_name(args[0])
 
@@ -59,7 +59,7 @@ class NodesCommand(AbstractCommandWithSubcommands):
                 response = f"Unknown command: !nodes busy '{' '.join(args)}' - valid args are 'detailed' or (node ID)"
                 return self.reply(packet, response)
 
-            self.send_detailed_nodeinfo(sender, node.id)
+            self.send_detailed_nodeinfo(sender, node)
 
     def send_busy_node_list(self, sender: str):
         online_nodes = self.bot.node_info.get_online_nodes()
@@ -78,12 +78,7 @@ class NodesCommand(AbstractCommandWithSubcommands):
         response += f"(last reset at {self.bot.node_info.packet_counter_reset_time.strftime('%H:%M:%S')})"
         self.reply_to(sender, response)
 
-    def send_detailed_nodeinfo(self, sender: str, node_id: str):
-        node = self.bot.node_db.get_by_id(node_id)
-
-        if not node:
-            return
-
+    def send_detailed_nodeinfo(self, sender: str, node: MeshNode.User):
         packets_today = self.bot.node_info.get_node_packets_today(node.id)
         packet_breakdown_today = self.bot.node_info.get_node_packets_today_breakdown(node.id)
         last_heard = self.bot.node_info.get_last_heard(node.id)
@@ -1,6 +1,6 @@
 import string
 import urllib.parse
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 
 def pretty_print_last_heard(last_heard_timestamp: int | datetime | None) -> str:
@@ -30,6 +30,35 @@ def pretty_print_last_heard(last_heard_timestamp: int | datetime | None) -> str:
         return f"{delta.seconds}s ago"
 
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MS = timedelta(milliseconds=1)
+
+
+def to_epoch_ms(value: datetime | str | int | None) -> int | None:
+    """
+    Convert a datetime (or ISO 8601 string) to milliseconds since the Unix epoch. Naive datetimes are taken to be UTC.
+    None and 0 (an unset time) give None; other numbers are assumed to already be epoch milliseconds
+    """
+    if value is None or value == 0 or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _ONE_MS
+
+
+def from_epoch_ms(value: int | None) -> datetime | None:
+    """
+    Convert milliseconds since the Unix epoch to a UTC datetime
+    """
+    if value is None:
+        return None
+    return _EPOCH + timedelta(milliseconds=value)
+
+
 _safe_chars = string.ascii_letters + string.digits + r" ()@\/.,-:\"'"
 
 
@@ -0,0 +1,82 @@
+import logging
+import threading
+
+from src.utils.counters import Counters
+
+logger = logging.getLogger(__name__)
+
+
+class LoadShedder:
+    """
+    Thins out low-value packets while uploads are falling behind, so that the packets we care about (e.g. text
+    messages) still get through.
+
+    Under pressure - the upload backlog reaching `depth_watermark`, or uploads waiting `latency_watermark_ms` on
+    average to be picked up - only a fraction of each sampled portnum is kept, e.g. {'TELEMETRY_APP': 0.25} keeps
+    one telemetry packet in four. Portnums without a sample rate are never shed. Sampling is evenly spaced rather than
+    random, so a node's packets are thinned consistently.
+    """
+
+    DEFAULT_SAMPLE_RATES = 'TELEMETRY_APP=0.25,POSITION_APP=0.5'
+    DEFAULT_DEPTH_WATERMARK = 200
+    DEFAULT_LATENCY_WATERMARK_MS = 5000.0
+
+    def __init__(self, sample_rates: dict[str, float], depth_watermark: int = DEFAULT_DEPTH_WATERMARK,
+                 latency_watermark_ms: float = DEFAULT_LATENCY_WATERMARK_MS):
+        self.sample_rates = {portnum.upper(): min(max(rate, 0.0), 1.0) for portnum, rate in sample_rates.items()}
+        self.depth_watermark = depth_watermark
+        self.latency_watermark_ms = latency_watermark_ms
+        self.counters = Counters()
+
+        self._lock = threading.Lock()
+        self._credit: dict[str, float] = {}
+        self._under_pressure = False
+
+    @staticmethod
+    def parse_sample_rates(spec: str) -> dict[str, float]:
+        """
+        Parse "TELEMETRY_APP=0.25,POSITION_APP=0.5" into {'TELEMETRY_APP': 0.25, 'POSITION_APP': 0.5}
+        """
+        sample_rates = {}
+        for entry in spec.split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            portnum, _, rate = entry.partition('=')
+            try:
+                sample_rates[portnum.strip().upper()] = float(rate)
+            except ValueError:
+                raise ValueError(f"Invalid sample rate: {entry}")
+        return sample_rates
+
+    def under_pressure(self, depth: int, latency_ms: float) -> bool:
+        return (self.depth_watermark > 0 and depth >= self.depth_watermark) or \
+            (self.latency_watermark_ms > 0 and latency_ms >= self.latency_watermark_ms)
+
+    def should_shed(self, portnum: str, depth: int, latency_ms: float) -> bool:
+        """
+        Decide whether to drop a packet, given the current upload backlog and latency. Shed packets are counted
+        """
+        rate = self.sample_rates.get(portnum)
+        if rate is None:
+            return False
+
+        pressure = self.under_pressure(depth, latency_ms)
+        with self._lock:
+            if pressure != self._under_pressure:
+                self._under_pressure = pressure
+                self._credit.clear()
+                logger.warning(f"Load shedding {'started' if pressure else 'stopped'} "
+                               f"(backlog {depth}, latency {latency_ms:.0f}ms)")
+            if not pressure:
+                return False
+
+            # Keep `rate` of the packets, evenly spaced: each packet earns `rate` credit, and one credit buys a keep
+            credit = self._credit.get(portnum, 0.0) + rate
+            if credit >= 1.0:
+                self._credit[portnum] = credit - 1.0
+                return False
+            self._credit[portnum] = credit
+
+        self.counters.incr(f"shed_{portnum}")
+        return True
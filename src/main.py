@@ -20,12 +20,25 @@ logging.getLogger('mesh_interface').setLevel(logging.WARNING)
 
 # Now we can import the rest of our local files
 from src.api.StorageAPI import StorageAPIWrapper
+from src.api.circuit_breaker import CircuitBreaker
+from src.api.compression import BodyCompressor
+from src.api.node_fingerprint import NodeFingerprintCache
+from src.api.retry_policy import RetryPolicy
+from src.api.spool_replayer import SpoolReplayer
+from src.api.upload_queue import UploadQueue
 from src.bot import MeshtasticBot
+from src.packet_dedup import PacketDeduplicator
+from src.packet_filters import PacketFilter
+from src.load_shedder import LoadShedder
+from src.packet_lanes import PacketLanes
 from src.ws_client import MeshflowWSClient
+from src.persistence import BaseSqlitePersistenceStore
 from src.persistence.commands_logger import SqliteCommandLogger
 from src.persistence.node_info import InMemoryNodeInfoStore
-from src.persistence.node_db import SqliteNodeDB
+from src.persistence.node_db import CachingNodeDB, SqliteNodeDB
+from src.persistence.upload_spool import SqliteUploadSpool
 from src.persistence.user_prefs import SqliteUserPrefsPersistence
+from src.utils.batcher import Batcher
 
 # Get the IP address and admin nodes from environment variables
 MESHTASTIC_IP = os.getenv("MESHTASTIC_IP")
@@ -37,6 +50,64 @@ STORAGE_API_VERSION = int(os.getenv("STORAGE_API_VERSION", 1))
 STORAGE_API_2_ROOT = os.getenv("STORAGE_API_2_ROOT")
 STORAGE_API_2_TOKEN = os.getenv("STORAGE_API_2_TOKEN", None)
 STORAGE_API_2_VERSION = int(os.getenv("STORAGE_API_2_VERSION", 1))
+# Batch packets into one request to the bulk ingest endpoint (API v2 only). 0 disables batching.
+STORAGE_API_BATCH_SIZE = int(os.getenv("STORAGE_API_BATCH_SIZE", 0))
+STORAGE_API_BATCH_INTERVAL_MS = int(os.getenv("STORAGE_API_BATCH_INTERVAL_MS", 1000))
+# Upload packets as JSON, or as the protobuf received from the radio (API v2 only)
+STORAGE_API_UPLOAD_FORMAT = os.getenv("STORAGE_API_UPLOAD_FORMAT", StorageAPIWrapper.UPLOAD_FORMAT_JSON)
+# Compress request bodies (gzip or zstd) of at least STORAGE_API_COMPRESSION_MIN_BYTES
+STORAGE_API_COMPRESSION = os.getenv("STORAGE_API_COMPRESSION") or None
+STORAGE_API_COMPRESSION_MIN_BYTES = int(os.getenv("STORAGE_API_COMPRESSION_MIN_BYTES", BodyCompressor.DEFAULT_MIN_BYTES))
+# Keep-alive connections held open to each storage API
+STORAGE_API_POOL_SIZE = int(os.getenv("STORAGE_API_POOL_SIZE", StorageAPIWrapper.DEFAULT_POOL_SIZE))
+# Timeouts (seconds) for each call to a storage API, and the overall budget for uploading one packet to all of them.
+# When the budget runs out, the packet is handed to the retry path for the remaining APIs. 0 = no overall budget
+STORAGE_API_CONNECT_TIMEOUT = float(os.getenv("STORAGE_API_CONNECT_TIMEOUT", StorageAPIWrapper.DEFAULT_CONNECT_TIMEOUT))
+STORAGE_API_READ_TIMEOUT = float(os.getenv("STORAGE_API_READ_TIMEOUT", StorageAPIWrapper.DEFAULT_READ_TIMEOUT))
+_upload_deadline_sec = float(os.getenv("UPLOAD_DEADLINE_SEC", 15))
+UPLOAD_DEADLINE_SEC = _upload_deadline_sec if _upload_deadline_sec > 0 else None
+# After this many consecutive failures, stop calling a storage API and spool its packets instead,
+# letting one probe request through every STORAGE_API_BREAKER_PROBE_SEC until it recovers
+STORAGE_API_BREAKER_THRESHOLD = int(os.getenv("STORAGE_API_BREAKER_THRESHOLD", CircuitBreaker.DEFAULT_FAILURE_THRESHOLD))
+STORAGE_API_BREAKER_PROBE_SEC = float(os.getenv("STORAGE_API_BREAKER_PROBE_SEC", CircuitBreaker.DEFAULT_PROBE_INTERVAL_SEC))
+# Page cache (KiB) and memory-mapped I/O size (MiB) for each SQLite connection
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", BaseSqlitePersistenceStore.DEFAULT_CACHE_SIZE_KB))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", BaseSqlitePersistenceStore.DEFAULT_MMAP_SIZE_BYTES // (1024 * 1024)))
+# Queue node DB writes and commit them in one transaction per NODE_DB_WRITE_BATCH_SIZE rows, or every
+# NODE_DB_WRITE_INTERVAL_MS (0 = commit every write)
+NODE_DB_WRITE_BATCH_SIZE = int(os.getenv("NODE_DB_WRITE_BATCH_SIZE", 200))
+NODE_DB_WRITE_INTERVAL_MS = int(os.getenv("NODE_DB_WRITE_INTERVAL_MS", 1000))
+# Node users looked up by ID are cached in memory, for up to NODE_CACHE_SIZE nodes (0 = no cache)
+NODE_CACHE_SIZE = int(os.getenv("NODE_CACHE_SIZE", CachingNodeDB.DEFAULT_MAX_ENTRIES))
+# Packet uploads failing with a retryable error (timeout, connection error, 5xx) are retried in the background, backing
+# off exponentially with jitter, before going to the spool (1 = spool on the first failure)
+STORAGE_API_RETRY_ATTEMPTS = int(os.getenv("STORAGE_API_RETRY_ATTEMPTS", RetryPolicy.DEFAULT_MAX_ATTEMPTS))
+STORAGE_API_RETRY_BASE_SEC = float(os.getenv("STORAGE_API_RETRY_BASE_SEC", RetryPolicy.DEFAULT_BASE_DELAY_SEC))
+STORAGE_API_RETRY_MAX_SEC = float(os.getenv("STORAGE_API_RETRY_MAX_SEC", RetryPolicy.DEFAULT_MAX_DELAY_SEC))
+# Node updates which don't change anything aren't uploaded, unless the node hasn't been uploaded for this long (0 = upload every update)
+NODE_UPLOAD_MAX_STALENESS_SEC = float(os.getenv("NODE_UPLOAD_MAX_STALENESS_SEC", NodeFingerprintCache.DEFAULT_MAX_STALENESS_SEC))
+# Max packets/sec replayed from the upload spool once an API recovers
+SPOOL_REPLAY_RATE = float(os.getenv("SPOOL_REPLAY_RATE", SpoolReplayer.DEFAULT_RATE_PER_SEC))
+# Spooled packets are deleted once they're SPOOL_MAX_AGE_DAYS old, or the spool holds more than SPOOL_MAX_ROWS
+# (oldest and rejected packets first). 0 = no limit
+SPOOL_MAX_ROWS = int(os.getenv("SPOOL_MAX_ROWS", SqliteUploadSpool.DEFAULT_MAX_ROWS))
+SPOOL_MAX_AGE_DAYS = float(os.getenv("SPOOL_MAX_AGE_DAYS", SqliteUploadSpool.DEFAULT_MAX_AGE_SEC / (24 * 60 * 60)))
+# Uploads and commands run on worker threads, so a slow API never stalls the radio reader. Uploads are split into lanes
+# by portnum (PACKET_LANES, highest priority first), each with its own queue of UPLOAD_QUEUE_SIZE and workers.
+# Other portnums share a default lane with UPLOAD_WORKERS workers, and commands have a lane of their own. Set
+# UPLOAD_WORKERS=0 to do everything on the receive thread.
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", UploadQueue.DEFAULT_MAX_SIZE))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", UploadQueue.DEFAULT_WORKERS))
+PACKET_LANES = os.getenv("PACKET_LANES", PacketLanes.DEFAULT_SPEC)
+# When the upload backlog reaches SHED_QUEUE_DEPTH packets, or uploads wait SHED_LATENCY_MS on average in any lane's
+# queue, only upload the given fraction of these portnums. Empty disables load shedding
+SHED_SAMPLE_RATES = LoadShedder.parse_sample_rates(os.getenv("SHED_SAMPLE_RATES", LoadShedder.DEFAULT_SAMPLE_RATES))
+SHED_QUEUE_DEPTH = int(os.getenv("SHED_QUEUE_DEPTH", LoadShedder.DEFAULT_DEPTH_WATERMARK))
+SHED_LATENCY_MS = float(os.getenv("SHED_LATENCY_MS", LoadShedder.DEFAULT_LATENCY_WATERMARK_MS))
+# Collect node updates for up to NODE_UPDATE_COALESCE_MS (keeping the latest per node), then store and upload them
+# in bulk. 0 stores each update as it arrives
+NODE_UPDATE_COALESCE_MS = int(os.getenv("NODE_UPDATE_COALESCE_MS", 2000))
+NODE_UPDATE_BATCH_SIZE = int(os.getenv("NODE_UPDATE_BATCH_SIZE", 200))
 MESHFLOW_WS_URL = os.getenv("MESHFLOW_WS_URL")  # e.g. ws://localhost:8000; derived from storage API if unset
 
 # Comma-separated portnums to skip when submitting to API (e.g. 345,ROUTING_APP)
@@ -44,6 +115,13 @@ _ignore_portnums_raw = os.getenv("IGNORE_PORTNUMS", "")
 IGNORE_PORTNUMS = frozenset(
     p.strip().upper() for p in _ignore_portnums_raw.split(",") if p.strip()
 )
+# More packet filters, as a JSON list of rules (see PacketFilterRule.compile), from a file and/or the environment
+PACKET_FILTERS_FILE = os.getenv("PACKET_FILTERS_FILE")
+PACKET_FILTERS = os.getenv("PACKET_FILTERS")
+# Drop copies of packets already received in the last PACKET_DEDUP_TTL_SEC (0 disables), remembering at most
+# PACKET_DEDUP_MAX_ENTRIES packets
+PACKET_DEDUP_TTL_SEC = float(os.getenv("PACKET_DEDUP_TTL_SEC", PacketDeduplicator.DEFAULT_TTL_SEC))
+PACKET_DEDUP_MAX_ENTRIES = int(os.getenv("PACKET_DEDUP_MAX_ENTRIES", PacketDeduplicator.DEFAULT_MAX_ENTRIES))
 
 
 def main():
@@ -55,21 +133,63 @@ def main():
     command_log_file = data_dir / 'user_cmds.sqlite'
     node_db_file = data_dir / 'node_db.sqlite'
     node_info_file = data_dir / 'node_info.json'
-    failed_packets_dir = data_dir / 'failed_packets'
+    upload_spool_file = data_dir / 'upload_spool.sqlite'
 
     # Connect to the Meshtastic node over WiFi
     bot = MeshtasticBot(MESHTASTIC_IP)
-    bot.ignore_portnums = IGNORE_PORTNUMS
+    packet_filter_rules = PacketFilter.default_rules(IGNORE_PORTNUMS)
+    if PACKET_FILTERS_FILE:
+        packet_filter_rules += PacketFilter.load_rules(PACKET_FILTERS_FILE)
+    if PACKET_FILTERS:
+        packet_filter_rules += PacketFilter.parse_rules(PACKET_FILTERS)
+    bot.packet_filter = PacketFilter(packet_filter_rules)
+    if PACKET_DEDUP_TTL_SEC > 0:
+        bot.packet_dedup = PacketDeduplicator(PACKET_DEDUP_TTL_SEC, PACKET_DEDUP_MAX_ENTRIES)
     bot.admin_nodes = ADMIN_NODES
-    bot.user_prefs_persistence = SqliteUserPrefsPersistence(str(user_prefs_file))
-    bot.command_logger = SqliteCommandLogger(str(command_log_file))
-    bot.node_db = SqliteNodeDB(str(node_db_file))
+    sqlite_options = dict(cache_size_kb=SQLITE_CACHE_SIZE_KB, mmap_size_bytes=SQLITE_MMAP_SIZE_MB * 1024 * 1024)
+    bot.user_prefs_persistence = SqliteUserPrefsPersistence(str(user_prefs_file), **sqlite_options)
+    bot.command_logger = SqliteCommandLogger(str(command_log_file), **sqlite_options)
+    node_db = SqliteNodeDB(str(node_db_file), write_batch_size=NODE_DB_WRITE_BATCH_SIZE,
+                           write_interval_ms=NODE_DB_WRITE_INTERVAL_MS, **sqlite_options)
+    bot.node_db = CachingNodeDB(node_db, NODE_CACHE_SIZE) if NODE_CACHE_SIZE > 0 else node_db
     node_info = InMemoryNodeInfoStore()
     bot.node_info = node_info
+    upload_spool = SqliteUploadSpool(str(upload_spool_file), max_rows=SPOOL_MAX_ROWS,
+                                     max_age_sec=SPOOL_MAX_AGE_DAYS * 24 * 60 * 60, **sqlite_options)
+    sqlite_stores = [bot.user_prefs_persistence, bot.command_logger, node_db, upload_spool]
+    storage_api_options = dict(
+        spool=upload_spool,
+        upload_format=STORAGE_API_UPLOAD_FORMAT,
+        batch_size=STORAGE_API_BATCH_SIZE,
+        batch_interval_ms=STORAGE_API_BATCH_INTERVAL_MS,
+        compression=STORAGE_API_COMPRESSION,
+        compression_min_bytes=STORAGE_API_COMPRESSION_MIN_BYTES,
+        pool_size=STORAGE_API_POOL_SIZE,
+        connect_timeout=STORAGE_API_CONNECT_TIMEOUT,
+        read_timeout=STORAGE_API_READ_TIMEOUT,
+        breaker_failure_threshold=STORAGE_API_BREAKER_THRESHOLD,
+        breaker_probe_interval_sec=STORAGE_API_BREAKER_PROBE_SEC,
+        node_max_staleness_sec=NODE_UPLOAD_MAX_STALENESS_SEC,
+        retry_attempts=STORAGE_API_RETRY_ATTEMPTS,
+        retry_base_delay_sec=STORAGE_API_RETRY_BASE_SEC,
+        retry_max_delay_sec=STORAGE_API_RETRY_MAX_SEC,
+    )
     if STORAGE_API_ROOT:
-        bot.storage_apis.append(StorageAPIWrapper(bot, STORAGE_API_ROOT, STORAGE_API_TOKEN, STORAGE_API_VERSION, failed_packets_dir))
+        bot.storage_apis.append(StorageAPIWrapper(bot, STORAGE_API_ROOT, STORAGE_API_TOKEN, STORAGE_API_VERSION,
+                                                  **storage_api_options))
     if STORAGE_API_2_ROOT:
-        bot.storage_apis.append(StorageAPIWrapper(bot, STORAGE_API_2_ROOT, STORAGE_API_2_TOKEN, STORAGE_API_2_VERSION, failed_packets_dir))
+        bot.storage_apis.append(StorageAPIWrapper(bot, STORAGE_API_2_ROOT, STORAGE_API_2_TOKEN, STORAGE_API_2_VERSION,
+                                                  **storage_api_options))
+    bot.upload_deadline_sec = UPLOAD_DEADLINE_SEC
+    spool_replayers = [SpoolReplayer(storage_api, upload_spool, rate_per_sec=SPOOL_REPLAY_RATE)
+                       for storage_api in bot.storage_apis]
+    if UPLOAD_WORKERS > 0:
+        bot.packet_lanes = PacketLanes.from_spec(PACKET_LANES, max_size=UPLOAD_QUEUE_SIZE, default_workers=UPLOAD_WORKERS)
+        if SHED_SAMPLE_RATES:
+            bot.load_shedder = LoadShedder(SHED_SAMPLE_RATES, SHED_QUEUE_DEPTH, SHED_LATENCY_MS)
+    if NODE_UPDATE_COALESCE_MS > 0:
+        bot.node_update_coalescer = Batcher(bot.store_node_batch, NODE_UPDATE_BATCH_SIZE, NODE_UPDATE_COALESCE_MS,
+                                            name='node-updates', key_fn=lambda mesh_node: mesh_node.user.id)
 
     # WebSocket client for receiving commands (e.g. traceroute)
     ws_url = MESHFLOW_WS_URL
@@ -91,6 +211,10 @@ def main():
 
     try:
         node_info.load_from_file(str(node_info_file))
+        if bot.packet_lanes is not None:
+            bot.packet_lanes.start()
+        for replayer in spool_replayers:
+            replayer.start()
         bot.connect()
         bot.start_scheduler()
 
@@ -100,6 +224,18 @@ def main():
         if bot.ws_client:
             bot.ws_client.stop()
         bot.disconnect()
+        for replayer in spool_replayers:
+            replayer.stop()
+        if bot.node_update_coalescer is not None:
+            bot.node_update_coalescer.close()
+        if bot.packet_lanes is not None:
+            bot.packet_lanes.stop()
+            bot.log_upload_stats()
+        bot.fanout_executor.shutdown(wait=True)
+        for storage_api in bot.storage_apis:
+            storage_api.close()
+        for store in sqlite_stores:
+            store.close()
         node_info.persist_to_file(str(node_info_file))
 
 
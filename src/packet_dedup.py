@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.utils.counters import Counters
+
+
+class SeenPacket:
+    """
+    What we know about a packet we've already had: how many copies arrived, and how far they travelled
+    """
+    __slots__ = ('first_seen', 'copies', 'hops', 'snrs')
+
+    # How many duplicates' hops/SNR to keep per packet
+    MAX_DUPLICATES_RECORDED = 8
+
+    def __init__(self, first_seen: float):
+        self.first_seen = first_seen
+        self.copies = 1
+        self.hops: list[int | None] = []
+        self.snrs: list[float | None] = []
+
+    def record_duplicate(self, hops: int | None, snr: float | None):
+        self.copies += 1
+        if len(self.hops) < self.MAX_DUPLICATES_RECORDED:
+            self.hops.append(hops)
+            self.snrs.append(snr)
+
+
+class PacketDeduplicator:
+    """
+    Recognises copies of a packet we've already received, e.g. via another path or a rebroadcast.
+
+    Packets are keyed on (from, id) and remembered for `ttl_sec`, up to `max_entries` packets. The entries are kept in
+    arrival order, so expiring and evicting always happen at the front, and every operation is O(1).
+    """
+
+    DEFAULT_TTL_SEC = 600.0
+    DEFAULT_MAX_ENTRIES = 10_000
+
+    def __init__(self, ttl_sec: float = DEFAULT_TTL_SEC, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self.counters = Counters()
+
+        self._lock = threading.Lock()
+        self._seen: OrderedDict[tuple[int, int], SeenPacket] = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
+
+    def is_duplicate(self, packet: dict) -> bool:
+        """
+        Record the packet, returning True if it's a copy of one seen within the TTL
+        """
+        key = self._key(packet)
+        if key is None:
+            # Can't tell copies apart without an ID, so never treat these as duplicates
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            seen = self._seen.get(key)
+            if seen is not None:
+                hops = self._hops(packet)
+                snr = packet.get('rxSnr')
+                seen.record_duplicate(hops, snr)
+                self.counters.incr('duplicates')
+                if hops is not None:
+                    self.counters.incr(f"duplicates_hops_{hops}")
+                return True
+
+            self._seen[key] = SeenPacket(now)
+            self.counters.incr('unique')
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+                self.counters.incr('evicted')
+            return False
+
+    def get(self, from_num: int, packet_id: int) -> SeenPacket | None:
+        with self._lock:
+            return self._seen.get((from_num, packet_id))
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl_sec
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if seen.first_seen > cutoff:
+                return
+            del self._seen[key]
+            self.counters.incr('expired')
+
+    @staticmethod
+    def _key(packet: dict) -> tuple[int, int] | None:
+        from_num = packet.get('from')
+        packet_id = packet.get('id')
+        if from_num is None or not packet_id:
+            return None
+        return from_num, packet_id
+
+    @staticmethod
+    def _hops(packet: dict) -> int | None:
+        hop_start = packet.get('hopStart')
+        hop_limit = packet.get('hopLimit')
+        if hop_start is None or hop_limit is None:
+            return None
+        return hop_start - hop_limit
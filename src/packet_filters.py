@@ -0,0 +1,150 @@
+import json
+import logging
+from typing import Callable
+
+from src.utils.counters import Counters
+
+logger = logging.getLogger(__name__)
+
+# (packet, my_id) -> bool
+Predicate = Callable[[dict, str | None], bool]
+
+
+class PacketFilterRule:
+    """
+    A compiled rule: a packet matches when every one of the rule's conditions does
+    """
+
+    def __init__(self, name: str, predicates: list[Predicate]):
+        self.name = name
+        self.predicates = predicates
+
+    def matches(self, packet: dict, my_id: str | None) -> bool:
+        for predicate in self.predicates:
+            if not predicate(packet, my_id):
+                return False
+        return True
+
+    @classmethod
+    def compile(cls, spec: dict) -> 'PacketFilterRule':
+        """
+        Compile a rule from its config, e.g.
+
+            {"name": "no-range-tests", "portnum": ["RANGE_TEST_APP"], "from_self": false}
+
+        Supported conditions (all optional, all must match):
+        - portnum: a portnum or list of portnums (names, or numbers for unknown ports)
+        - sender: a node ID or list of node IDs, e.g. "!12345678"
+        - from_self: true/false - whether the packet was sent by our own node
+        - channel: a channel index or list of indexes
+        - has: a field path or list of paths which must all be present, e.g. "decoded.telemetry.deviceMetrics"
+        - missing: a field path or list of paths which must all be absent
+        """
+        spec = dict(spec)
+        name = spec.pop('name', None) or json.dumps(spec, sort_keys=True)
+        predicates = []
+
+        if 'portnum' in spec:
+            portnums = frozenset(str(portnum).upper() for portnum in _as_list(spec.pop('portnum')))
+            predicates.append(lambda packet, my_id: _portnum_key(packet) in portnums)
+        if 'sender' in spec:
+            senders = frozenset(_as_list(spec.pop('sender')))
+            predicates.append(lambda packet, my_id: packet.get('fromId') in senders)
+        if 'from_self' in spec:
+            from_self = bool(spec.pop('from_self'))
+            predicates.append(lambda packet, my_id: (my_id is not None and packet.get('fromId') == my_id) == from_self)
+        if 'channel' in spec:
+            channels = frozenset(int(channel) for channel in _as_list(spec.pop('channel')))
+            # The channel is left out of packets when it's 0
+            predicates.append(lambda packet, my_id: packet.get('channel', 0) in channels)
+        if 'has' in spec:
+            paths = [_compile_path(path) for path in _as_list(spec.pop('has'))]
+            predicates.append(lambda packet, my_id: all(_has_field(packet, path) for path in paths))
+        if 'missing' in spec:
+            paths = [_compile_path(path) for path in _as_list(spec.pop('missing'))]
+            predicates.append(lambda packet, my_id: not any(_has_field(packet, path) for path in paths))
+
+        if spec:
+            raise ValueError(f"Packet filter '{name}': unknown conditions {sorted(spec)}")
+        if not predicates:
+            raise ValueError(f"Packet filter '{name}' has no conditions, and would match every packet")
+
+        return cls(name, predicates)
+
+
+class PacketFilter:
+    """
+    An ordered list of rules for packets which should not be uploaded. Each rule counts its hits
+    """
+
+    def __init__(self, rules: list[PacketFilterRule]):
+        self.rules = rules
+        self.counters = Counters()
+
+    def match(self, packet: dict, my_id: str | None) -> PacketFilterRule | None:
+        """
+        @return: The first rule matching the packet, if any
+        """
+        for rule in self.rules:
+            if rule.matches(packet, my_id):
+                self.counters.incr(rule.name)
+                return rule
+        return None
+
+    @classmethod
+    def default_rules(cls, ignore_portnums: frozenset[str] = frozenset()) -> list[PacketFilterRule]:
+        """
+        The bot's built-in filters
+        """
+        rules = []
+        if ignore_portnums:
+            rules.append(PacketFilterRule.compile({'name': 'ignore-portnums', 'portnum': sorted(ignore_portnums)}))
+        rules += [
+            # Nothing useful to store
+            PacketFilterRule.compile({'name': 'not-decoded', 'missing': ['decoded', 'decrypted']}),
+            # The node sends its device metrics to connected clients every minute; another bot will capture them
+            # when they're broadcast over the air
+            PacketFilterRule.compile({'name': 'self-device-metrics', 'from_self': True, 'portnum': 'TELEMETRY_APP',
+                                      'has': 'decoded.telemetry.deviceMetrics'}),
+        ]
+        return rules
+
+    @classmethod
+    def parse_rules(cls, text: str) -> list[PacketFilterRule]:
+        """
+        Compile rules from a JSON list of rule specs (see PacketFilterRule.compile)
+        """
+        specs = json.loads(text)
+        if not isinstance(specs, list):
+            raise ValueError("Packet filters must be a JSON list of rules")
+        return [PacketFilterRule.compile(spec) for spec in specs]
+
+    @classmethod
+    def load_rules(cls, path: str) -> list[PacketFilterRule]:
+        with open(path) as f:
+            rules = cls.parse_rules(f.read())
+        logger.info(f"Loaded {len(rules)} packet filters from {path}")
+        return rules
+
+
+def _as_list(value) -> list:
+    return list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+
+
+def _portnum_key(packet: dict) -> str:
+    return str(packet.get('decoded', {}).get('portnum', 'unknown')).upper()
+
+
+def _compile_path(path: str) -> tuple[str, ...]:
+    return tuple(path.split('.'))
+
+
+def _has_field(packet: dict, path: tuple[str, ...]) -> bool:
+    value = packet
+    for key in path:
+        if not isinstance(value, dict):
+            return False
+        value = value.get(key)
+        if value is None:
+            return False
+    return True
@@ -0,0 +1,104 @@
+import logging
+from typing import Callable
+
+from src.api.upload_queue import UploadQueue
+
+logger = logging.getLogger(__name__)
+
+
+class PacketLanes:
+    """
+    Splits packet work into lanes by portnum, each with its own bounded queue and worker threads, so a burst of one
+    kind of packet (e.g. telemetry) can't hold up another (e.g. text commands).
+
+    Lanes are kept in priority order, highest first. Portnums without a lane of their own share the default lane,
+    which always comes last. Commands have a lane of their own, so replies never wait behind uploads - not even
+    uploads of the text messages which carry the commands.
+    """
+
+    DEFAULT_LANE = 'default'
+    COMMAND_LANE = 'commands'
+    # Highest priority first
+    DEFAULT_SPEC = 'TEXT_MESSAGE_APP=1,TRACEROUTE_APP=1,POSITION_APP=1,TELEMETRY_APP=1'
+
+    def __init__(self, max_size: int = UploadQueue.DEFAULT_MAX_SIZE, default_workers: int = UploadQueue.DEFAULT_WORKERS):
+        self.max_size = max_size
+        self.lanes: dict[str, UploadQueue] = {}
+        self._routes: dict[str, UploadQueue] = {}
+        self.default = UploadQueue(max_size, default_workers, name=f"lane-{self.DEFAULT_LANE}")
+        # A single worker, so commands are handled in the order they arrive
+        self.commands = UploadQueue(max_size, 1, name=f"lane-{self.COMMAND_LANE}")
+
+    @classmethod
+    def from_spec(cls, spec: str, max_size: int = UploadQueue.DEFAULT_MAX_SIZE,
+                  default_workers: int = UploadQueue.DEFAULT_WORKERS) -> 'PacketLanes':
+        """
+        Build lanes from a spec like "TEXT_MESSAGE_APP=1,POSITION_APP+NODEINFO_APP=2": comma-separated lanes in
+        priority order, each being the '+'-separated portnums it handles and its number of workers
+        """
+        packet_lanes = cls(max_size, default_workers)
+        for lane_spec in spec.split(','):
+            lane_spec = lane_spec.strip()
+            if not lane_spec:
+                continue
+
+            portnums, _, workers = lane_spec.partition('=')
+            portnums = [portnum.strip().upper() for portnum in portnums.split('+') if portnum.strip()]
+            try:
+                packet_lanes.add_lane(portnums[0].lower(), portnums, int(workers or 1))
+            except (IndexError, ValueError):
+                raise ValueError(f"Invalid packet lane: {lane_spec}")
+
+        return packet_lanes
+
+    def add_lane(self, name: str, portnums: list[str], workers: int) -> UploadQueue:
+        """
+        Add a lane below all the existing ones
+        """
+        lane = UploadQueue(self.max_size, workers, name=f"lane-{name}")
+        self.lanes[name] = lane
+        for portnum in portnums:
+            self._routes[portnum.upper()] = lane
+        return lane
+
+    def upload_lanes(self) -> list[UploadQueue]:
+        return [*self.lanes.values(), self.default]
+
+    def all_lanes(self) -> list[UploadQueue]:
+        return [self.commands, *self.upload_lanes()]
+
+    def lane_for(self, portnum: str) -> UploadQueue:
+        return self._routes.get(str(portnum).upper(), self.default)
+
+    def submit(self, portnum: str, fn: Callable, *args, **kwargs) -> bool:
+        """
+        Queue `fn(*args, **kwargs)` on the lane for this portnum. Returns False if that lane is full
+        """
+        return self.lane_for(portnum).submit(fn, *args, **kwargs)
+
+    def submit_command(self, fn: Callable, *args, **kwargs) -> bool:
+        """
+        Queue `fn(*args, **kwargs)` on the command lane. Returns False if that lane is full
+
+        Commands aren't uploads, so don't count towards depth() or latency_ms()
+        """
+        return self.commands.submit(fn, *args, timed=False, **kwargs)
+
+    def start(self):
+        for lane in self.all_lanes():
+            lane.start()
+
+    def stop(self, timeout: float = 10.0):
+        for lane in self.all_lanes():
+            lane.stop(timeout)
+
+    def depth(self) -> int:
+        """Uploads waiting across every lane"""
+        return sum(lane.depth for lane in self.upload_lanes())
+
+    def latency_ms(self) -> float:
+        """Average queue wait of uploads in the slowest lane"""
+        return max(lane.latency_ms for lane in self.upload_lanes())
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {lane.name: lane.stats() for lane in self.all_lanes()}
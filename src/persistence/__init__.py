@@ -1,20 +1,109 @@
 import abc
 import logging
+import sqlite3
+import threading
+import weakref
 from pathlib import Path
 
+from src.persistence.migrations import Migration, is_new_db, migrate, stamp_schema_version
+
 
 class BaseSqlitePersistenceStore(abc.ABC):
+    """
+    Base for SQLite-backed stores. Each thread gets its own long-lived connection, opened on first use, in WAL mode
+    so readers don't block the writer. Connections left behind by threads which have exited are closed the next time
+    a connection is opened. Call close() on shutdown.
+
+    _initialize_db creates the latest schema. A new DB is created with it, and recorded as being at the latest
+    MIGRATIONS version. An existing DB has any pending MIGRATIONS applied in order, then _initialize_db creates
+    whatever tables and indexes it's still missing - so _initialize_db must only use CREATE ... IF NOT EXISTS.
+    """
+
     db_path: Path
+    MIGRATIONS: list[Migration] = []
 
-    def __init__(self, db_path: str):
+    # Negative values are KiB, as per SQLite's PRAGMA cache_size
+    DEFAULT_CACHE_SIZE_KB = 8 * 1024
+    DEFAULT_MMAP_SIZE_BYTES = 64 * 1024 * 1024
+    STATEMENT_CACHE_SIZE = 128
+
+    def __init__(self, db_path: str, cache_size_kb: int = DEFAULT_CACHE_SIZE_KB,
+                 mmap_size_bytes: int = DEFAULT_MMAP_SIZE_BYTES):
+        """
+        @param cache_size_kb: Page cache per connection
+        @param mmap_size_bytes: How much of the DB file to memory-map for reads. 0 disables memory-mapping
+        """
         self.db_path = Path(db_path)
-        self._initialize_db()
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_bytes = mmap_size_bytes
+        self._local = threading.local()
+        # Every open connection, with (a weak reference to) the thread it belongs to
+        self._connections: list[tuple[weakref.ref, sqlite3.Connection]] = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._connection()
+        if is_new_db(conn):
+            self._initialize_db()
+            schema_version = stamp_schema_version(conn, self.MIGRATIONS)
+        else:
+            schema_version = migrate(conn, self.MIGRATIONS)
+            self._initialize_db()
         if self.db_path.is_relative_to(Path.cwd()):
             path_string = self.db_path.relative_to(Path.cwd())
         else:
             path_string = self.db_path
-        logging.info(f"Connected to {self.__class__.__name__} DB at {path_string}")
+        logging.info(f"Connected to {self.__class__.__name__} DB at {path_string} (schema version {schema_version})")
 
     @abc.abstractmethod
     def _initialize_db(self):
         pass
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        The calling thread's connection. Like a fresh connection, it can be used as a context manager to commit (or
+        roll back) a transaction, but it isn't closed afterwards
+        """
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            local.conn = conn
+            with self._connections_lock:
+                live, exited = [], []
+                for entry in self._connections:
+                    thread = entry[0]()
+                    (live if thread is not None and thread.is_alive() else exited).append(entry)
+                live.append((weakref.ref(threading.current_thread()), conn))
+                self._connections = live
+            for _, old in exited:
+                self._close_connection(old)
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        # Only used by the thread which opened it, but close() may be called from any thread
+        conn = sqlite3.connect(self.db_path, cached_statements=self.STATEMENT_CACHE_SIZE, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode, only checkpoints need to fsync. A power cut may lose the last few commits, but can't corrupt
+        # the DB
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size_bytes)}')
+        return conn
+
+    def close(self):
+        """
+        Close every thread's connection. Threads which use the store again afterwards get a new one
+        """
+        with self._connections_lock:
+            connections = [conn for _, conn in self._connections]
+            self._connections = []
+            # Drops every thread's reference to its (now closed) connection
+            self._local = threading.local()
+        for conn in connections:
+            self._close_connection(conn)
+
+    def _close_connection(self, conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error as ex:
+            logging.warning(f"Error closing {self.__class__.__name__} DB connection: {ex}")
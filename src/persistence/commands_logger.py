@@ -1,10 +1,11 @@
 import abc
-import sqlite3
 from datetime import datetime, timezone
 
 import pandas as pd
 
+from src.helpers import to_epoch_ms
 from src.persistence import BaseSqlitePersistenceStore
+from src.persistence.migrations import Migration, rebuild_table, register_epoch_ms_function
 
 
 class AbstractCommandLogger(abc.ABC):
@@ -34,10 +35,46 @@ class AbstractCommandLogger(abc.ABC):
         pass
 
 
+def _timestamps_to_epoch_ms(conn):
+    register_epoch_ms_function(conn)
+    rebuild_table(conn, 'command_log', '''
+        CREATE TABLE {table} (
+            sender_id TEXT,
+            base_command TEXT,
+            sub_commands TEXT,
+            args TEXT,
+            timestamp INTEGER,
+            handler_class TEXT
+        )
+    ''', 'SELECT sender_id, base_command, sub_commands, args, epoch_ms(timestamp), handler_class FROM {table}')
+    rebuild_table(conn, 'unknown_requests', '''
+        CREATE TABLE {table} (
+            sender_id TEXT,
+            message TEXT,
+            timestamp INTEGER
+        )
+    ''', 'SELECT sender_id, message, epoch_ms(timestamp) FROM {table}')
+    rebuild_table(conn, 'responder_log', '''
+        CREATE TABLE {table} (
+            sender_id TEXT,
+            message TEXT,
+            timestamp INTEGER,
+            responder_class TEXT
+        )
+    ''', 'SELECT sender_id, message, epoch_ms(timestamp), responder_class FROM {table}')
+
+
 class SqliteCommandLogger(AbstractCommandLogger, BaseSqlitePersistenceStore):
+    """
+    Timestamps are stored as epoch milliseconds, and returned as UTC datetimes
+    """
+
+    MIGRATIONS = [
+        Migration(1, 'Store timestamps as epoch milliseconds', _timestamps_to_epoch_ms),
+    ]
 
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS command_log (
@@ -45,7 +82,7 @@ class SqliteCommandLogger(AbstractCommandLogger, BaseSqlitePersistenceStore):
                     base_command TEXT,
                     sub_commands TEXT,
                     args TEXT,
-                    timestamp TEXT,
+                    timestamp INTEGER,
                     handler_class TEXT
                 )
             ''')
@@ -53,95 +90,104 @@ class SqliteCommandLogger(AbstractCommandLogger, BaseSqlitePersistenceStore):
                 CREATE TABLE IF NOT EXISTS unknown_requests (
                     sender_id TEXT,
                     message TEXT,
-                    timestamp TEXT
+                    timestamp INTEGER
                 )
             ''')
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS responder_log (
                     sender_id TEXT,
                     message TEXT,
-                    timestamp TEXT,
+                    timestamp INTEGER,
                     responder_class TEXT
                 )
             ''')
+            # History is queried by time, optionally for a single sender
+            for table in ('command_log', 'unknown_requests', 'responder_log'):
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table} (timestamp)')
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_sender_time ON {table} (sender_id, timestamp)')
             conn.commit()
 
     def log_command(self, sender_id: str, command_instance, message: str) -> None:
         base_cmd, subcommands, args = command_instance.get_command_for_logging(message)
         subcommands_str = ' '.join(subcommands) if subcommands else None
 
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO command_log (sender_id, base_command, sub_commands, args, timestamp, handler_class)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', (sender_id, base_cmd, subcommands_str, args, datetime.now(timezone.utc).isoformat(),
+            ''', (sender_id, base_cmd, subcommands_str, args, to_epoch_ms(datetime.now(timezone.utc)),
                   command_instance.__class__.__name__))
             conn.commit()
 
     def log_responder_handled(self, sender_id: str, responder_instance, message_text: str) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO responder_log (sender_id, message, timestamp, responder_class)
                 VALUES (?, ?, ?, ?)
-            ''', (sender_id, message_text, datetime.now(timezone.utc).isoformat(), responder_instance.__class__.__name__))
+            ''', (sender_id, message_text, to_epoch_ms(datetime.now(timezone.utc)), responder_instance.__class__.__name__))
             conn.commit()
 
     def log_unknown_request(self, sender_id: str, message: str) -> None:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO unknown_requests (sender_id, message, timestamp)
                 VALUES (?, ?, ?)
-            ''', (sender_id, message, datetime.now(timezone.utc).isoformat()))
+            ''', (sender_id, message, to_epoch_ms(datetime.now(timezone.utc))))
             conn.commit()
 
     def get_command_history(self, since: datetime, sender_id: str = None) -> pd.DataFrame:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             if sender_id:
                 cursor.execute('''
                     SELECT sender_id, base_command, timestamp FROM command_log
                     WHERE sender_id = ? AND timestamp >= ?
-                ''', (sender_id, since.isoformat()))
+                ''', (sender_id, to_epoch_ms(since)))
             else:
                 cursor.execute('''
                     SELECT sender_id, base_command, timestamp FROM command_log
                     WHERE timestamp >= ?
-                ''', (since.isoformat(),))
+                ''', (to_epoch_ms(since),))
             rows = cursor.fetchall()
-            return pd.DataFrame(rows, columns=['sender_id', 'base_command', 'timestamp'])
+            return _history_frame(rows, ['sender_id', 'base_command', 'timestamp'])
 
     def get_unknown_command_history(self, since: datetime, sender_id: str = None) -> pd.DataFrame:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             if sender_id:
                 cursor.execute('''
                     SELECT sender_id, message, timestamp FROM unknown_requests
                     WHERE sender_id = ? AND timestamp >= ?
-                ''', (sender_id, since.isoformat()))
+                ''', (sender_id, to_epoch_ms(since)))
             else:
                 cursor.execute('''
                     SELECT sender_id, message, timestamp FROM unknown_requests
                     WHERE timestamp >= ?
-                ''', (since.isoformat(),))
+                ''', (to_epoch_ms(since),))
             rows = cursor.fetchall()
-            return pd.DataFrame(rows, columns=['sender_id', 'message', 'timestamp'])
+            return _history_frame(rows, ['sender_id', 'message', 'timestamp'])
 
     def get_responder_history(self, since: datetime, sender_id: str = None) -> pd.DataFrame:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             if sender_id:
                 cursor.execute('''
                     SELECT sender_id, responder_class, timestamp FROM responder_log
                     WHERE sender_id = ? AND timestamp >= ?
-                ''', (sender_id, since.isoformat()))
+                ''', (sender_id, to_epoch_ms(since)))
             else:
                 cursor.execute('''
                     SELECT sender_id, responder_class, timestamp FROM responder_log
                     WHERE timestamp >= ?
-                ''', (since.isoformat(),))
+                ''', (to_epoch_ms(since),))
             rows = cursor.fetchall()
-            return pd.DataFrame(rows, columns=['sender_id', 'responder_class', 'timestamp'])
+            return _history_frame(rows, ['sender_id', 'responder_class', 'timestamp'])
+
 
+def _history_frame(rows: list[tuple], columns: list[str]) -> pd.DataFrame:
+    history = pd.DataFrame(rows, columns=columns)
+    history['timestamp'] = pd.to_datetime(history['timestamp'], unit='ms', utc=True)
+    return history
@@ -0,0 +1,137 @@
+import logging
+import sqlite3
+import time
+from typing import Callable
+
+from src.helpers import to_epoch_ms
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+
+class Migration:
+    """
+    One step in a DB's schema history. Migrations are applied in version order, each in its own transaction, and
+    each only once
+    """
+
+    def __init__(self, version: int, description: str, apply: Callable[[sqlite3.Connection], None]):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """
+    @return: The version of the last migration applied, or 0 if none have been
+    """
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at INTEGER
+        )
+    ''')
+    return conn.execute(f'SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE}').fetchone()[0]
+
+
+def is_new_db(conn: sqlite3.Connection) -> bool:
+    """
+    Whether the DB has no tables yet (other than the schema version table)
+    """
+    return conn.execute(f"""
+        SELECT COUNT(*) FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name != '{SCHEMA_VERSION_TABLE}'
+    """).fetchone()[0] == 0
+
+
+def stamp_schema_version(conn: sqlite3.Connection, migrations: list[Migration]) -> int:
+    """
+    Record a DB which was just created with the latest schema as being at the last migration's version, without
+    applying any migrations
+
+    @return: The DB's schema version
+    """
+    version = get_schema_version(conn)
+    if migrations and migrations[-1].version > version:
+        version = migrations[-1].version
+        conn.execute(f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (?, ?, ?)',
+                     (version, 'Created with the latest schema', int(time.time() * 1000)))
+    conn.commit()
+    return version
+
+
+def migrate(conn: sqlite3.Connection, migrations: list[Migration]) -> int:
+    """
+    Apply any migrations newer than the DB's schema version
+
+    @return: The DB's schema version afterwards
+    """
+    versions = [migration.version for migration in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError(f"Migration versions must be unique and in order: {versions}")
+
+    version = get_schema_version(conn)
+    conn.commit()
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+
+        logging.info(f"Migrating DB to version {migration.version}: {migration.description}")
+        # DDL doesn't start a transaction implicitly, so start one ourselves to make the whole migration atomic
+        conn.execute('BEGIN')
+        try:
+            migration.apply(conn)
+            conn.execute(f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (?, ?, ?)',
+                         (migration.version, migration.description, int(time.time() * 1000)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = migration.version
+
+    return version
+
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def rebuild_table(conn: sqlite3.Connection, table: str, create_sql: str, select_sql: str):
+    """
+    Replace a table with a new definition - SQLite can't change a column's type in place. The table's indexes are
+    recreated afterwards. Tables which don't exist are skipped: the store's _initialize_db creates them after the
+    migrations have run
+
+    @param create_sql: CREATE TABLE statement for the new table, with '{table}' in place of its name
+    @param select_sql: SELECT from the old table (as '{table}') giving the new table's rows
+    """
+    if not table_exists(conn, table):
+        return
+
+    indexes = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+
+    new_table = f"{table}_new"
+    conn.execute(create_sql.format(table=new_table))
+    conn.execute(f"INSERT INTO {new_table} {select_sql.format(table=table)}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    for index_sql in indexes:
+        conn.execute(index_sql)
+
+
+def register_epoch_ms_function(conn: sqlite3.Connection):
+    """
+    Add an epoch_ms(value) SQL function, converting the ISO 8601 / datetime adapter strings we used to store times as
+    to epoch milliseconds. Unparseable values become NULL
+    """
+
+    def epoch_ms(value):
+        try:
+            return to_epoch_ms(value)
+        except ValueError:
+            logging.warning(f"Can't convert {value!r} to a timestamp, discarding it")
+            return None
+
+    conn.create_function('epoch_ms', 1, epoch_ms, deterministic=True)
@@ -1,9 +1,14 @@
 import abc
+import threading
+from collections import OrderedDict
 from datetime import datetime
-import sqlite3
 
 from src.data_classes import MeshNode
+from src.helpers import from_epoch_ms, to_epoch_ms
 from src.persistence import BaseSqlitePersistenceStore
+from src.persistence.migrations import Migration, rebuild_table, register_epoch_ms_function, table_exists
+from src.utils.batcher import Batcher
+from src.utils.counters import Counters
 
 
 class AbstractNodeDB(abc.ABC):
@@ -15,10 +20,27 @@ class AbstractNodeDB(abc.ABC):
         if hasattr(node, 'device_metrics') and node.device_metrics:
             self.store_device_metrics(node.user.id, node.device_metrics)
 
+    def store_nodes(self, nodes: list[MeshNode]):
+        for node in nodes:
+            self.store_node(node)
+
     @abc.abstractmethod
     def get_by_id(self, node_id: str) -> MeshNode.User | None:
         pass
 
+    def get_by_ids(self, node_ids: list[str]) -> dict[str, MeshNode.User]:
+        """
+        Look up several nodes at once
+
+        @return: The users found, by node ID. Unknown IDs are left out
+        """
+        users = {}
+        for node_id in node_ids:
+            user = self.get_by_id(node_id)
+            if user is not None:
+                users[node_id] = user
+        return users
+
     @abc.abstractmethod
     def get_by_short_name(self, short_name: str) -> MeshNode.User | None:
         pass
@@ -65,9 +87,26 @@ class InMemoryNodeDB(AbstractNodeDB):
         self.nodes = {}
         self.positions = dict[str, list[MeshNode.Position]]()
         self.device_metrics = dict[str, list[MeshNode.DeviceMetrics]]()
+        # Casefolded short name -> the nodes using it (by ID, in the order they were first stored)
+        self._by_short_name: dict[str, dict[str, MeshNode.User]] = {}
 
     def store_user(self, node_user: MeshNode.User):
+        previous = self.nodes.get(node_user.id)
+        if previous is not None:
+            self._unindex_short_name(previous)
         self.nodes[node_user.id] = node_user
+        if node_user.short_name:
+            self._by_short_name.setdefault(node_user.short_name.casefold(), {})[node_user.id] = node_user
+
+    def _unindex_short_name(self, node_user: MeshNode.User):
+        if not node_user.short_name:
+            return
+        key = node_user.short_name.casefold()
+        nodes = self._by_short_name.get(key)
+        if nodes is not None:
+            nodes.pop(node_user.id, None)
+            if not nodes:
+                del self._by_short_name[key]
 
     def store_position(self, node_id: str, position: MeshNode.Position):
         if node_id not in self.positions:
@@ -82,11 +121,12 @@ class InMemoryNodeDB(AbstractNodeDB):
     def get_by_id(self, node_id: str) -> MeshNode.User | None:
         return self.nodes.get(node_id)
 
+    def get_by_ids(self, node_ids: list[str]) -> dict[str, MeshNode.User]:
+        return {node_id: self.nodes[node_id] for node_id in node_ids if node_id in self.nodes}
+
     def get_by_short_name(self, short_name: str) -> MeshNode.User | None:
-        for node in self.nodes.values():
-            if node.short_name.lower() == short_name.lower():
-                return node
-        return None
+        nodes = self._by_short_name.get(short_name.casefold())
+        return next(iter(nodes.values())) if nodes else None
 
     def list_nodes(self) -> list[MeshNode.User]:
         return list(self.nodes.values())
@@ -114,15 +154,121 @@ class InMemoryNodeDB(AbstractNodeDB):
         return []
 
 
+_INSERT_USER_SQL = '''
+    INSERT OR REPLACE INTO nodes (id, short_name, short_name_folded, long_name, macaddr, hw_model, public_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_POSITION_SQL = '''
+    INSERT INTO positions (node_id, logged_time, reported_time, latitude, longitude, altitude, location_source)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_DEVICE_METRICS_SQL = '''
+    INSERT INTO device_metrics (node_id, logged_time, battery_level, voltage, channel_utilization, air_util_tx, uptime_seconds)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _user_row(node_user: MeshNode.User) -> tuple:
+    return (node_user.id, node_user.short_name, _fold_short_name(node_user.short_name), node_user.long_name,
+            node_user.macaddr, node_user.hw_model, node_user.public_key)
+
+
+def _fold_short_name(short_name: str | None) -> str | None:
+    # SQLite's NOCASE only folds ASCII, and short names are often emoji or accented
+    return short_name.casefold() if short_name else None
+
+
+def _position_row(node_id: str, position: MeshNode.Position) -> tuple:
+    return (node_id, to_epoch_ms(position.logged_time), to_epoch_ms(position.reported_time), position.latitude,
+            position.longitude, position.altitude, position.location_source)
+
+
+def _device_metrics_row(node_id: str, device_metrics: MeshNode.DeviceMetrics) -> tuple:
+    return (node_id, to_epoch_ms(device_metrics.logged_time), device_metrics.battery_level, device_metrics.voltage,
+            device_metrics.channel_utilization, device_metrics.air_util_tx, device_metrics.uptime_seconds)
+
+
+def _times_to_epoch_ms(conn):
+    register_epoch_ms_function(conn)
+    rebuild_table(conn, 'positions', '''
+        CREATE TABLE {table} (
+            node_id TEXT,
+            logged_time INTEGER,
+            reported_time INTEGER,
+            latitude REAL,
+            longitude REAL,
+            altitude REAL,
+            location_source TEXT,
+            FOREIGN KEY(node_id) REFERENCES nodes(id)
+        )
+    ''', '''
+        SELECT node_id, epoch_ms(logged_time), epoch_ms(reported_time), latitude, longitude, altitude, location_source
+        FROM {table}
+    ''')
+    rebuild_table(conn, 'device_metrics', '''
+        CREATE TABLE {table} (
+            node_id TEXT,
+            logged_time INTEGER,
+            battery_level INTEGER,
+            voltage REAL,
+            channel_utilization REAL,
+            air_util_tx REAL,
+            uptime_seconds INTEGER,
+            FOREIGN KEY(node_id) REFERENCES nodes(id)
+        )
+    ''', '''
+        SELECT node_id, epoch_ms(logged_time), battery_level, voltage, channel_utilization, air_util_tx, uptime_seconds
+        FROM {table}
+    ''')
+
+
+def _add_short_name_folded(conn):
+    if not table_exists(conn, 'nodes'):
+        return
+    conn.execute('ALTER TABLE nodes ADD COLUMN short_name_folded TEXT')
+    conn.create_function('fold_short_name', 1, _fold_short_name, deterministic=True)
+    conn.execute('UPDATE nodes SET short_name_folded = fold_short_name(short_name)')
+    conn.execute('DROP INDEX IF EXISTS idx_nodes_short_name')
+    conn.execute('CREATE INDEX idx_nodes_short_name_folded ON nodes (short_name_folded)')
+
+
 class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
+    """
+    With `write_batch_size` > 1, writes are queued and committed together from a background thread, in one
+    transaction per batch of up to `write_batch_size` rows or every `write_interval_ms`. get_by_id sees queued users
+    straight away; other reads flush the queue first. close() flushes anything still queued.
+
+    Times are stored as epoch milliseconds, and returned as UTC datetimes.
+    """
+
+    MIGRATIONS = [
+        Migration(1, 'Store position and device metrics times as epoch milliseconds', _times_to_epoch_ms),
+        Migration(2, 'Index casefolded short names', _add_short_name_folded),
+    ]
+
+    # Bound parameters per IN (...) query. Older SQLite builds allow at most 999
+    MAX_IDS_PER_QUERY = 500
+
+    def __init__(self, db_path: str, write_batch_size: int = 0, write_interval_ms: int = 1000, **kwargs):
+        """
+        @param write_batch_size: If > 1, queue writes and commit them in batches of up to this many rows
+        @param write_interval_ms: The longest a queued write waits to be committed
+        """
+        super().__init__(db_path, **kwargs)
+        self._pending_users: dict[str, MeshNode.User] = {}
+        self._pending_lock = threading.Lock()
+        self._write_batcher = None
+        if write_batch_size > 1:
+            self._write_batcher = Batcher(self._write_batch, write_batch_size, write_interval_ms, name='node-db-writes')
 
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS nodes (
                     id TEXT PRIMARY KEY,
                     short_name TEXT,
+                    short_name_folded TEXT,
                     long_name TEXT,
                     macaddr TEXT,
                     hw_model TEXT,
@@ -132,8 +278,8 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS positions (
                     node_id TEXT,
-                    logged_time DATETIME,
-                    reported_time DATETIME,
+                    logged_time INTEGER,
+                    reported_time INTEGER,
                     latitude REAL,
                     longitude REAL,
                     altitude REAL,
@@ -144,7 +290,7 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS device_metrics (
                     node_id TEXT,
-                    logged_time DATETIME,
+                    logged_time INTEGER,
                     battery_level INTEGER,
                     voltage REAL,
                     channel_utilization REAL,
@@ -153,40 +299,103 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
                     FOREIGN KEY(node_id) REFERENCES nodes(id)
                 )
             ''')
+            # Short name lookups (e.g. from admin commands) are case-insensitive
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_nodes_short_name_folded ON nodes (short_name_folded)
+            ''')
+            # A node's latest entry, and its entries in a time range, are read straight from these
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_positions_node_time ON positions (node_id, logged_time)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_device_metrics_node_time ON device_metrics (node_id, logged_time)
+            ''')
             conn.commit()
 
+    def close(self):
+        """
+        Commit any queued writes, then close the DB connections
+        """
+        if self._write_batcher is not None:
+            self._write_batcher.close()
+        super().close()
+
+    def flush(self):
+        """
+        Commit any queued writes now
+        """
+        if self._write_batcher is not None:
+            self._write_batcher.flush()
+
+    def store_nodes(self, nodes: list[MeshNode]):
+        """
+        Store many nodes in a single transaction
+        """
+        users = [_user_row(node.user) for node in nodes]
+        positions = [_position_row(node.user.id, node.position)
+                     for node in nodes if getattr(node, 'position', None)]
+        device_metrics = [_device_metrics_row(node.user.id, node.device_metrics)
+                          for node in nodes if getattr(node, 'device_metrics', None)]
+
+        # Already one transaction; just make sure it lands after anything queued before it
+        self.flush()
+        self._execute_writes(users, positions, device_metrics)
+
     def store_user(self, node_user: MeshNode.User):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO nodes (id, short_name, long_name, macaddr, hw_model, public_key)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (node_user.id, node_user.short_name, node_user.long_name, node_user.macaddr, node_user.hw_model,
-                  node_user.public_key))
-            conn.commit()
+        if self._write_batcher is not None:
+            with self._pending_lock:
+                self._pending_users[node_user.id] = node_user
+            self._write_batcher.add((_INSERT_USER_SQL, node_user))
+            return
+        self._execute_writes(users=[_user_row(node_user)])
 
     def store_position(self, node_id: str, position: MeshNode.Position):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO positions (node_id, logged_time, reported_time, latitude, longitude, altitude, location_source)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, position.logged_time, position.reported_time, position.latitude, position.longitude,
-                  position.altitude, position.location_source))
-            conn.commit()
+        if self._write_batcher is not None:
+            self._write_batcher.add((_INSERT_POSITION_SQL, _position_row(node_id, position)))
+            return
+        self._execute_writes(positions=[_position_row(node_id, position)])
 
     def store_device_metrics(self, node_id: str, device_metrics: MeshNode.DeviceMetrics):
-        with sqlite3.connect(self.db_path) as conn:
+        if self._write_batcher is not None:
+            self._write_batcher.add((_INSERT_DEVICE_METRICS_SQL, _device_metrics_row(node_id, device_metrics)))
+            return
+        self._execute_writes(device_metrics=[_device_metrics_row(node_id, device_metrics)])
+
+    def _execute_writes(self, users: list[tuple] = (), positions: list[tuple] = (), device_metrics: list[tuple] = ()):
+        with self._connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO device_metrics (node_id, logged_time, battery_level, voltage, channel_utilization, air_util_tx, uptime_seconds)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, device_metrics.logged_time, device_metrics.battery_level, device_metrics.voltage,
-                  device_metrics.channel_utilization, device_metrics.air_util_tx, device_metrics.uptime_seconds))
+            if users:
+                cursor.executemany(_INSERT_USER_SQL, users)
+            if positions:
+                cursor.executemany(_INSERT_POSITION_SQL, positions)
+            if device_metrics:
+                cursor.executemany(_INSERT_DEVICE_METRICS_SQL, device_metrics)
             conn.commit()
 
+    def _write_batch(self, writes: list[tuple[str, object]]):
+        """
+        Commit a batch of queued writes in one transaction
+        """
+        users = [node_user for sql, node_user in writes if sql is _INSERT_USER_SQL]
+        try:
+            self._execute_writes(users=[_user_row(node_user) for node_user in users],
+                                 positions=[row for sql, row in writes if sql is _INSERT_POSITION_SQL],
+                                 device_metrics=[row for sql, row in writes if sql is _INSERT_DEVICE_METRICS_SQL])
+        finally:
+            with self._pending_lock:
+                for node_user in users:
+                    # Unless it's been replaced by a newer update, still queued
+                    if self._pending_users.get(node_user.id) is node_user:
+                        del self._pending_users[node_user.id]
+
     def get_by_id(self, node_id: str) -> MeshNode.User | None:
-        with sqlite3.connect(self.db_path) as conn:
+        if self._write_batcher is not None:
+            with self._pending_lock:
+                pending = self._pending_users.get(node_id)
+            if pending is not None:
+                return pending
+
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT id, short_name, long_name, macaddr, hw_model, public_key FROM nodes WHERE id = ?',
                            (node_id,))
@@ -196,12 +405,35 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
                                      hw_model=row[4], public_key=row[5])
             return None
 
+    def get_by_ids(self, node_ids: list[str]) -> dict[str, MeshNode.User]:
+        users = {}
+        # dict.fromkeys drops duplicates, keeping the order
+        node_ids = list(dict.fromkeys(node_ids))
+        if self._write_batcher is not None:
+            with self._pending_lock:
+                users = {node_id: self._pending_users[node_id] for node_id in node_ids
+                         if node_id in self._pending_users}
+            node_ids = [node_id for node_id in node_ids if node_id not in users]
+
+        with self._connection() as conn:
+            for i in range(0, len(node_ids), self.MAX_IDS_PER_QUERY):
+                chunk = node_ids[i:i + self.MAX_IDS_PER_QUERY]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor = conn.execute(
+                    f'SELECT id, short_name, long_name, macaddr, hw_model, public_key FROM nodes WHERE id IN ({placeholders})',
+                    chunk)
+                for row in cursor:
+                    users[row[0]] = MeshNode.User(node_id=row[0], short_name=row[1], long_name=row[2], macaddr=row[3],
+                                                  hw_model=row[4], public_key=row[5])
+        return users
+
     def get_by_short_name(self, short_name: str) -> MeshNode.User | None:
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                'SELECT id, short_name, long_name, macaddr, hw_model, public_key FROM nodes WHERE short_name = ? COLLATE NOCASE',
-                (short_name,))
+            cursor.execute('''
+                SELECT id, short_name, long_name, macaddr, hw_model, public_key FROM nodes WHERE short_name_folded = ?
+            ''', (_fold_short_name(short_name),))
             row = cursor.fetchone()
             if row:
                 return MeshNode.User(node_id=row[0], short_name=row[1], long_name=row[2], macaddr=row[3],
@@ -209,7 +441,8 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
             return None
 
     def list_nodes(self) -> list[MeshNode.User]:
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT id, short_name, long_name, macaddr, hw_model, public_key FROM nodes')
             rows = cursor.fetchall()
@@ -217,7 +450,8 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
                                   hw_model=row[4], public_key=row[5]) for row in rows]
 
     def get_last_position(self, node_id: str) -> MeshNode.Position | None:
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT logged_time, reported_time, latitude, longitude, altitude, location_source
@@ -228,26 +462,29 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
             ''', (node_id,))
             row = cursor.fetchone()
             if row:
-                return MeshNode.Position(logged_time=row[0], reported_time=row[1], latitude=row[2], longitude=row[3],
-                                         altitude=row[4], location_source=row[5])
+                return MeshNode.Position(logged_time=from_epoch_ms(row[0]), reported_time=from_epoch_ms(row[1]),
+                                         latitude=row[2], longitude=row[3], altitude=row[4], location_source=row[5])
             return None
 
     def get_position_log(self, node_id: str, start: datetime, end: datetime) -> list[
         MeshNode.Position]:
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT logged_time, reported_time, latitude, longitude, altitude, location_source
                 FROM positions
                 WHERE node_id = ? AND logged_time BETWEEN ? AND ?
                 ORDER BY logged_time
-            ''', (node_id, start, end))
+            ''', (node_id, to_epoch_ms(start), to_epoch_ms(end)))
             rows = cursor.fetchall()
-            return [MeshNode.Position(logged_time=row[0], reported_time=row[1], latitude=row[2], longitude=row[3],
-                                      altitude=row[4], location_source=row[5]) for row in rows]
+            return [MeshNode.Position(logged_time=from_epoch_ms(row[0]), reported_time=from_epoch_ms(row[1]),
+                                      latitude=row[2], longitude=row[3], altitude=row[4], location_source=row[5])
+                    for row in rows]
 
     def get_last_device_metrics(self, node_id: str) -> MeshNode.DeviceMetrics | None:
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT logged_time, battery_level, voltage, channel_utilization, air_util_tx, uptime_seconds
@@ -258,21 +495,142 @@ class SqliteNodeDB(BaseSqlitePersistenceStore, AbstractNodeDB):
             ''', (node_id,))
             row = cursor.fetchone()
             if row:
-                return MeshNode.DeviceMetrics(logged_time=row[0], battery_level=row[1], voltage=row[2],
+                return MeshNode.DeviceMetrics(logged_time=from_epoch_ms(row[0]), battery_level=row[1], voltage=row[2],
                                               channel_utilization=row[3], air_util_tx=row[4], uptime_seconds=row[5])
             return None
 
     def get_device_metrics_log(self, node_id: str, start: datetime, end: datetime) -> list[
         MeshNode.DeviceMetrics]:
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT logged_time, battery_level, voltage, channel_utilization, air_util_tx, uptime_seconds
                 FROM device_metrics
                 WHERE node_id = ? AND logged_time BETWEEN ? AND ?
                 ORDER BY logged_time
-            ''', (node_id, start, end))
+            ''', (node_id, to_epoch_ms(start), to_epoch_ms(end)))
             rows = cursor.fetchall()
-            return [MeshNode.DeviceMetrics(logged_time=row[0], battery_level=row[1], voltage=row[2],
+            return [MeshNode.DeviceMetrics(logged_time=from_epoch_ms(row[0]), battery_level=row[1], voltage=row[2],
                                            channel_utilization=row[3], air_util_tx=row[4], uptime_seconds=row[5]) for
                     row in rows]
+
+
+class CachingNodeDB(AbstractNodeDB):
+    """
+    Read-through LRU cache of users in front of another node DB, for get_by_id - called several times for every packet
+    received, almost always for the same few hundred nodes.
+
+    Unknown node IDs are cached too (as None), so packets from senders we've never had a NODEINFO for don't each cost
+    a query. Storing a user invalidates its entry. Everything else is passed straight through.
+    """
+
+    DEFAULT_MAX_ENTRIES = 2000
+
+    def __init__(self, node_db: AbstractNodeDB, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.node_db = node_db
+        self.max_entries = max(1, max_entries)
+        self.counters = Counters()
+        self._lock = threading.Lock()
+        self._users: OrderedDict[str, MeshNode.User | None] = OrderedDict()
+        # Bumped on every invalidation, so a lookup racing with a write doesn't cache what it read before the write
+        self._generation = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users)
+
+    def get_by_id(self, node_id: str) -> MeshNode.User | None:
+        with self._lock:
+            if node_id in self._users:
+                self._users.move_to_end(node_id)
+                user = self._users[node_id]
+                self.counters.incr('hits' if user is not None else 'negative_hits')
+                return user
+            generation = self._generation
+
+        self.counters.incr('misses')
+        user = self.node_db.get_by_id(node_id)
+        with self._lock:
+            if generation == self._generation:
+                self._cache_user(node_id, user)
+        return user
+
+    def get_by_ids(self, node_ids: list[str]) -> dict[str, MeshNode.User]:
+        users = {}
+        missing = []
+        with self._lock:
+            for node_id in dict.fromkeys(node_ids):
+                if node_id in self._users:
+                    self._users.move_to_end(node_id)
+                    user = self._users[node_id]
+                    self.counters.incr('hits' if user is not None else 'negative_hits')
+                    if user is not None:
+                        users[node_id] = user
+                else:
+                    missing.append(node_id)
+            generation = self._generation
+
+        if not missing:
+            return users
+
+        self.counters.incr('misses', len(missing))
+        found = self.node_db.get_by_ids(missing)
+        users.update(found)
+        with self._lock:
+            if generation == self._generation:
+                for node_id in missing:
+                    self._cache_user(node_id, found.get(node_id))
+        return users
+
+    def _cache_user(self, node_id: str, user: MeshNode.User | None):
+        # Caller holds self._lock
+        self._users[node_id] = user
+        self._users.move_to_end(node_id)
+        if len(self._users) > self.max_entries:
+            self._users.popitem(last=False)
+            self.counters.incr('evicted')
+
+    def invalidate(self, node_id: str = None):
+        """
+        Drop a node's entry, or (with no node_id) every entry
+        """
+        with self._lock:
+            self._generation += 1
+            if node_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(node_id, None)
+
+    def store_user(self, node_user: MeshNode.User):
+        self.node_db.store_user(node_user)
+        self.invalidate(node_user.id)
+
+    def store_nodes(self, nodes: list[MeshNode]):
+        self.node_db.store_nodes(nodes)
+        for node in nodes:
+            self.invalidate(node.user.id)
+
+    def store_position(self, node_id: str, position: MeshNode.Position):
+        self.node_db.store_position(node_id, position)
+
+    def store_device_metrics(self, node_id: str, device_metrics: MeshNode.DeviceMetrics):
+        self.node_db.store_device_metrics(node_id, device_metrics)
+
+    def get_by_short_name(self, short_name: str) -> MeshNode.User | None:
+        return self.node_db.get_by_short_name(short_name)
+
+    def list_nodes(self) -> list[MeshNode.User]:
+        return self.node_db.list_nodes()
+
+    def get_last_position(self, node_id: str) -> MeshNode.Position | None:
+        return self.node_db.get_last_position(node_id)
+
+    def get_position_log(self, node_id: str, start: datetime, end: datetime) -> list[MeshNode.Position]:
+        return self.node_db.get_position_log(node_id, start, end)
+
+    def get_last_device_metrics(self, node_id: str) -> MeshNode.DeviceMetrics | None:
+        return self.node_db.get_last_device_metrics(node_id)
+
+    def get_device_metrics_log(self, node_id: str, start: datetime, end: datetime) -> list[MeshNode.DeviceMetrics]:
+        return self.node_db.get_device_metrics_log(node_id, start, end)
@@ -0,0 +1,201 @@
+import abc
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+
+from src.helpers import to_epoch_ms
+from src.persistence import BaseSqlitePersistenceStore
+from src.persistence.migrations import Migration, rebuild_table, register_epoch_ms_function
+from src.utils.counters import Counters
+
+
+class SpoolEntry:
+    def __init__(self, entry_id: int, endpoint: str, payload: dict, attempts: int):
+        self.id = entry_id
+        self.endpoint = endpoint
+        self.payload = payload
+        self.attempts = attempts
+
+
+class AbstractUploadSpool(abc.ABC):
+    """
+    Durable queue of packets which failed to upload, waiting to be replayed to their storage API
+    """
+
+    @abc.abstractmethod
+    def append(self, endpoint: str, payload: dict, error: str = None, dead: bool = False) -> None:
+        """
+        Add a packet to the spool
+
+        @param endpoint: The storage API the packet is destined for
+        @param error: Why the upload failed
+        @param dead: The packet was rejected by the API and shouldn't be replayed. It's kept for inspection only
+        """
+        pass
+
+    @abc.abstractmethod
+    def peek(self, endpoint: str, limit: int) -> list[SpoolEntry]:
+        """
+        Get the oldest packets still waiting to be replayed to an endpoint, without removing them
+        """
+        pass
+
+    @abc.abstractmethod
+    def remove(self, entry_id: int) -> None:
+        pass
+
+    @abc.abstractmethod
+    def record_failure(self, entry_id: int, error: str, dead: bool = False) -> None:
+        pass
+
+    @abc.abstractmethod
+    def count(self, endpoint: str = None) -> int:
+        """
+        Number of packets waiting to be replayed (optionally, to a single endpoint)
+        """
+        pass
+
+    @abc.abstractmethod
+    def purge(self) -> int:
+        """
+        Delete packets past the spool's retention limits, dead or not
+
+        @return: Number of packets deleted
+        """
+        pass
+
+
+def _created_at_to_epoch_ms(conn):
+    register_epoch_ms_function(conn)
+    rebuild_table(conn, 'upload_spool', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            endpoint TEXT,
+            payload TEXT,
+            error TEXT,
+            attempts INTEGER DEFAULT 0,
+            dead INTEGER DEFAULT 0,
+            created_at INTEGER
+        )
+    ''', 'SELECT id, endpoint, payload, error, attempts, dead, epoch_ms(created_at) FROM {table}')
+
+
+class SqliteUploadSpool(AbstractUploadSpool, BaseSqlitePersistenceStore):
+    """
+    Append-only spool backed by SQLite. Each append is its own committed transaction, so a packet is either fully
+    in the spool or not at all, even if the bot is killed mid-write.
+
+    So an API which is down (or rejecting everything) for weeks can't fill the disk, packets older than `max_age_sec`
+    are purged, as are the oldest packets beyond `max_rows` - dead ones first. Purges run on startup, and whenever
+    purge() is called.
+
+    created_at is stored as epoch milliseconds.
+    """
+
+    MIGRATIONS = [
+        Migration(1, 'Store created_at as epoch milliseconds', _created_at_to_epoch_ms),
+    ]
+
+    DEFAULT_MAX_ROWS = 100_000
+    DEFAULT_MAX_AGE_SEC = 7 * 24 * 60 * 60
+
+    def __init__(self, db_path: str, max_rows: int = DEFAULT_MAX_ROWS, max_age_sec: float = DEFAULT_MAX_AGE_SEC,
+                 **kwargs):
+        """
+        @param max_rows: Most packets kept in the spool (0 = no limit)
+        @param max_age_sec: Longest a packet is kept in the spool (0 = no limit)
+        """
+        self.max_rows = max_rows
+        self.max_age_sec = max_age_sec
+        self.counters = Counters()
+        super().__init__(db_path, **kwargs)
+        self.purge()
+
+    def _initialize_db(self):
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS upload_spool (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    endpoint TEXT,
+                    payload TEXT,
+                    error TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    dead INTEGER DEFAULT 0,
+                    created_at INTEGER
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_upload_spool_pending ON upload_spool (endpoint, dead, id)
+            ''')
+            conn.commit()
+
+    def append(self, endpoint: str, payload: dict, error: str = None, dead: bool = False) -> None:
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO upload_spool (endpoint, payload, error, dead, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (endpoint, json.dumps(payload), error, int(dead), to_epoch_ms(datetime.now(timezone.utc))))
+            conn.commit()
+
+    def peek(self, endpoint: str, limit: int) -> list[SpoolEntry]:
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, endpoint, payload, attempts FROM upload_spool
+                WHERE endpoint = ? AND dead = 0
+                ORDER BY id
+                LIMIT ?
+            ''', (endpoint, limit))
+            rows = cursor.fetchall()
+            return [SpoolEntry(entry_id=row[0], endpoint=row[1], payload=json.loads(row[2]), attempts=row[3])
+                    for row in rows]
+
+    def remove(self, entry_id: int) -> None:
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM upload_spool WHERE id = ?', (entry_id,))
+            conn.commit()
+
+    def record_failure(self, entry_id: int, error: str, dead: bool = False) -> None:
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE upload_spool SET attempts = attempts + 1, error = ?, dead = ?
+                WHERE id = ?
+            ''', (error, int(dead), entry_id))
+            conn.commit()
+
+    def count(self, endpoint: str = None) -> int:
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            if endpoint:
+                cursor.execute('SELECT COUNT(*) FROM upload_spool WHERE endpoint = ? AND dead = 0', (endpoint,))
+            else:
+                cursor.execute('SELECT COUNT(*) FROM upload_spool WHERE dead = 0')
+            return cursor.fetchone()[0]
+
+    def purge(self) -> int:
+        expired = overflow = 0
+        with self._connection() as conn:
+            if self.max_age_sec:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.max_age_sec)
+                expired = conn.execute('DELETE FROM upload_spool WHERE created_at < ?',
+                                       (to_epoch_ms(cutoff),)).rowcount
+            if self.max_rows:
+                excess = conn.execute('SELECT COUNT(*) FROM upload_spool').fetchone()[0] - self.max_rows
+                if excess > 0:
+                    overflow = conn.execute('''
+                        DELETE FROM upload_spool WHERE id IN (
+                            SELECT id FROM upload_spool ORDER BY dead DESC, id LIMIT ?
+                        )
+                    ''', (excess,)).rowcount
+
+        if expired:
+            self.counters.incr('purged_expired', expired)
+        if overflow:
+            self.counters.incr('purged_overflow', overflow)
+        if expired or overflow:
+            logging.warning(f"Purged {expired} expired and {overflow} excess packets from the upload spool")
+        return expired + overflow
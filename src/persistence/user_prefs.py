@@ -1,8 +1,9 @@
 import abc
-import sqlite3
 from datetime import datetime, timezone
 
+from src.helpers import from_epoch_ms, to_epoch_ms
 from src.persistence import BaseSqlitePersistenceStore
+from src.persistence.migrations import Migration, rebuild_table, register_epoch_ms_function
 
 
 class UserPrefs:
@@ -48,17 +49,34 @@ class AbstractUserPrefsPersistence(abc.ABC):
         pass
 
 
+def _time_set_to_epoch_ms(conn):
+    register_epoch_ms_function(conn)
+    rebuild_table(conn, 'user_prefs', '''
+        CREATE TABLE {table} (
+            user_id TEXT,
+            setting_name TEXT,
+            setting_value TEXT,
+            time_set INTEGER,
+            num_changes INTEGER,
+            PRIMARY KEY (user_id, setting_name)
+        )
+    ''', 'SELECT user_id, setting_name, setting_value, epoch_ms(time_set), num_changes FROM {table}')
+
+
 class SqliteUserPrefsPersistence(AbstractUserPrefsPersistence, BaseSqlitePersistenceStore):
+    MIGRATIONS = [
+        Migration(1, 'Store time_set as epoch milliseconds', _time_set_to_epoch_ms),
+    ]
 
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS user_prefs (
                     user_id TEXT,
                     setting_name TEXT,
                     setting_value TEXT,
-                    time_set TEXT,
+                    time_set INTEGER,
                     num_changes INTEGER,
                     PRIMARY KEY (user_id, setting_name)
                 )
@@ -66,7 +84,7 @@ class SqliteUserPrefsPersistence(AbstractUserPrefsPersistence, BaseSqlitePersist
             conn.commit()
 
     def get_user_prefs(self, user_id: str) -> UserPrefs:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             # Fetch the data
             cursor = conn.cursor()
             cursor.execute('''
@@ -82,7 +100,7 @@ class SqliteUserPrefsPersistence(AbstractUserPrefsPersistence, BaseSqlitePersist
                 setting_name, setting_value, time_set, num_changes = row
                 preference = UserPrefs.Preference.from_values(
                     value=True if setting_value == 'True' else False if setting_value == 'False' else setting_value,
-                    time_set=datetime.fromisoformat(time_set),
+                    time_set=from_epoch_ms(time_set),
                     num_changes=num_changes
                 )
                 setattr(user_prefs, setting_name, preference)
@@ -91,7 +109,7 @@ class SqliteUserPrefsPersistence(AbstractUserPrefsPersistence, BaseSqlitePersist
             return user_prefs
 
     def persist_user_prefs(self, user_id: str, user_prefs: UserPrefs) -> UserPrefs:
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.cursor()
             for key, preference in user_prefs.__dict__.items():
                 if key == 'user_id':
@@ -124,7 +142,7 @@ class SqliteUserPrefsPersistence(AbstractUserPrefsPersistence, BaseSqlitePersist
                         setting_value=excluded.setting_value,
                         time_set=excluded.time_set,
                         num_changes=excluded.num_changes
-                ''', (user_id, key, str(preference.value), time_set.isoformat(), num_changes))
+                ''', (user_id, key, str(preference.value), to_epoch_ms(time_set), num_changes))
 
             # Commit all values
             conn.commit()
@@ -0,0 +1,190 @@
+"""
+Re-upload the packets older versions of the bot dumped to data/failed_packets when a storage API upload failed.
+
+    python -m src.replay_failed_packets --my-nodenum 1234567890 [--concurrency 8] [--rate 50]
+
+The storage API is configured from the same environment variables as src.main (STORAGE_API_ROOT, STORAGE_API_TOKEN,
+STORAGE_API_VERSION), or the --api-root/--api-token/--api-version options. Packets which upload are moved (with
+their _error/_raw companion files) to an archive directory, and packets the API rejects to a rejected directory, so
+the tool can be re-run until the directory is empty.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+from src.api.StorageAPI import StorageAPIWrapper
+from src.api.errors import is_retryable_error
+from src.utils.counters import Counters
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = 'failed_packet_'
+# Written alongside each packet, for debugging - not packets themselves
+COMPANION_SUFFIXES = ('_error', '_raw')
+
+
+class RateLimiter:
+    """
+    Spaces calls, from any number of threads, at least 1/rate_per_sec apart. A rate of 0 is unlimited
+    """
+
+    def __init__(self, rate_per_sec: float):
+        self.min_interval = 1 / rate_per_sec if rate_per_sec > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.min_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class FailedPacketReplayer:
+    """
+    Uploads every packet file in `directory` through a storage API, `concurrency` at a time and no faster than
+    `rate_per_sec`. Files whose upload fails with a retryable error are left where they are, to be tried again
+    """
+
+    DEFAULT_CONCURRENCY = 8
+    DEFAULT_RATE_PER_SEC = 50.0
+
+    def __init__(self, storage_api: StorageAPIWrapper, directory: str | Path, archive_dir: str | Path = None,
+                 rejected_dir: str | Path = None, concurrency: int = DEFAULT_CONCURRENCY,
+                 rate_per_sec: float = DEFAULT_RATE_PER_SEC):
+        """
+        @param archive_dir: Where uploaded packets are moved. Defaults to `directory`/archive
+        @param rejected_dir: Where packets the API rejected are moved. Defaults to `directory`/rejected
+        """
+        self.storage_api = storage_api
+        self.directory = Path(directory)
+        self.archive_dir = Path(archive_dir) if archive_dir else self.directory / 'archive'
+        self.rejected_dir = Path(rejected_dir) if rejected_dir else self.directory / 'rejected'
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate_per_sec)
+        self.counters = Counters()
+
+    def pending_files(self) -> list[Path]:
+        """
+        The packet files waiting to be replayed, oldest first
+        """
+        files = [path for path in self.directory.glob(f"{FILE_PREFIX}*.json")
+                 if not path.stem.endswith(COMPANION_SUFFIXES)]
+        # File names end in a timestamp, so sort in the order the packets failed
+        return sorted(files)
+
+    def run(self) -> dict[str, int]:
+        """
+        Replay every pending file
+
+        @return: Counts of the files replayed, rejected, failed, and unreadable
+        """
+        files = self.pending_files()
+        logger.info(f"Replaying {len(files)} failed packets from {self.directory} to {self.storage_api.base_url}")
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='replay') as executor:
+            for done, _ in enumerate(executor.map(self.replay_file, files), start=1):
+                if done % 1000 == 0:
+                    self._log_progress(done, len(files), started)
+
+        self._log_progress(len(files), len(files), started)
+        return self.counters.snapshot()
+
+    def replay_file(self, path: Path):
+        try:
+            with open(path) as f:
+                packet = json.load(f)
+        except (OSError, ValueError) as ex:
+            logger.warning(f"Skipping unreadable packet file {path.name}: {ex}")
+            self.counters.incr('unreadable')
+            return
+
+        self.rate_limiter.wait()
+        try:
+            self.storage_api.replay_packet(packet)
+        except Exception as ex:
+            if is_retryable_error(ex):
+                logger.debug(f"Failed to replay {path.name}: {ex}")
+                self.counters.incr('failed')
+                return
+
+            logger.warning(f"{self.storage_api.base_url} rejected {path.name}: {ex}")
+            self._move(path, self.rejected_dir)
+            self.counters.incr('rejected')
+            return
+
+        self._move(path, self.archive_dir)
+        self.counters.incr('replayed')
+
+    @staticmethod
+    def _move(path: Path, destination: Path):
+        destination.mkdir(parents=True, exist_ok=True)
+        for suffix in ('', *COMPANION_SUFFIXES):
+            file = path.with_name(f"{path.stem}{suffix}{path.suffix}")
+            if file.exists():
+                shutil.move(file, destination / file.name)
+
+    def _log_progress(self, done: int, total: int, started: float):
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed > 0 else 0
+        counts = ', '.join(f"{name} {count}" for name, count in sorted(self.counters.snapshot().items()))
+        logger.info(f"Processed {done}/{total} packets in {elapsed:.1f}s ({rate:.1f}/s): {counts or 'nothing to do'}")
+
+
+def main(argv: list[str] = None):
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - [%(levelname)s] %(module)s.%(funcName)s - %(message)s',
+                        stream=sys.stdout)
+
+    parser = argparse.ArgumentParser(description="Re-upload packets from the failed_packets directory")
+    parser.add_argument('--dir', default=os.path.join(os.getenv('DATA_DIR', 'data'), 'failed_packets'),
+                        help="Directory of failed_packet_*.json files")
+    parser.add_argument('--archive-dir', help="Where uploaded packets are moved (default: DIR/archive)")
+    parser.add_argument('--api-root', default=os.getenv('STORAGE_API_ROOT'))
+    parser.add_argument('--api-token', default=os.getenv('STORAGE_API_TOKEN'))
+    parser.add_argument('--api-version', type=int, default=int(os.getenv('STORAGE_API_VERSION', 1)))
+    parser.add_argument('--my-nodenum', type=int,
+                        help="Node number of the radio which received the packets (required for API v2)")
+    parser.add_argument('--concurrency', type=int, default=FailedPacketReplayer.DEFAULT_CONCURRENCY,
+                        help="Uploads in flight at once")
+    parser.add_argument('--rate', type=float, default=FailedPacketReplayer.DEFAULT_RATE_PER_SEC,
+                        help="Max packets uploaded per second (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    if not args.api_root:
+        parser.error("--api-root (or STORAGE_API_ROOT) is required")
+    if args.api_version != 1 and args.my_nodenum is None:
+        parser.error(f"--my-nodenum is required for API v{args.api_version}")
+
+    # The API only needs the bot for its node number. Failures are left in place to be re-run, not spooled or retried
+    bot = SimpleNamespace(my_nodenum=args.my_nodenum, my_id=None)
+    storage_api = StorageAPIWrapper(bot, args.api_root, args.api_token, args.api_version,
+                                    pool_size=args.concurrency, retry_attempts=1)
+    try:
+        replayer = FailedPacketReplayer(storage_api, args.dir, archive_dir=args.archive_dir,
+                                        concurrency=args.concurrency, rate_per_sec=args.rate)
+        counts = replayer.run()
+    finally:
+        storage_api.close()
+
+    return 1 if counts.get('failed') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Generic, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class Batcher(Generic[T]):
+    """
+    Collects items and hands them to `flush_fn` in batches.
+
+    A batch is flushed when it reaches `max_items`, or when its oldest item has been waiting for
+    `max_delay_ms`, whichever comes first. Flushing happens on a background thread, so `add` never
+    blocks on the flush itself.
+
+    If `key_fn` is given, the batcher coalesces: an item replaces any pending item with the same key
+    (keeping its place in the batch), so a burst of updates to one thing is flushed once, as the latest.
+    """
+
+    def __init__(self, flush_fn: Callable[[list[T]], None], max_items: int, max_delay_ms: int, name: str = 'batcher',
+                 key_fn: Callable[[T], Hashable] = None):
+        self.flush_fn = flush_fn
+        self.max_items = max(1, max_items)
+        self.max_delay = max(0, max_delay_ms) / 1000
+        self.name = name
+        self.key_fn = key_fn
+        self.coalesced = 0
+
+        # Pending items by key, in arrival order. Without a key_fn every item gets a key of its own
+        self._items: dict[Hashable, T] = {}
+        self._sequence = itertools.count()
+        self._oldest: float | None = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"{name}-flusher", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def add(self, item: T):
+        with self._cond:
+            if not self._items:
+                # Wake the flusher so it starts the delay timer for this batch
+                self._oldest = time.monotonic()
+                self._cond.notify()
+
+            key = self.key_fn(item) if self.key_fn else next(self._sequence)
+            if key in self._items:
+                self.coalesced += 1
+            self._items[key] = item
+            if len(self._items) >= self.max_items:
+                self._cond.notify()
+
+    def flush(self):
+        """Flush all pending items on the calling thread, in batches of at most `max_items`."""
+        while self._flush_once():
+            pass
+
+    def close(self):
+        """Stop the background thread, flushing anything still pending."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def _take(self) -> list[T]:
+        keys = list(itertools.islice(self._items, self.max_items))
+        items = [self._items.pop(key) for key in keys]
+        self._oldest = time.monotonic() if self._items else None
+        return items
+
+    def _flush_once(self) -> bool:
+        with self._flush_lock:
+            with self._cond:
+                items = self._take()
+            if not items:
+                return False
+
+            try:
+                self.flush_fn(items)
+            except Exception as ex:
+                logger.error(f"Batcher '{self.name}': failed to flush {len(items)} items: {ex}")
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if len(self._items) >= self.max_items:
+                        break
+                    if self._items:
+                        wait = self._oldest + self.max_delay - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+
+                if not self._running:
+                    return
+
+            self._flush_once()
@@ -0,0 +1,29 @@
+import threading
+
+
+class Counters:
+    """
+    A small thread-safe set of named integer counters, used for reporting pipeline health
+    (queue drops, failures, etc) from components that are touched by several threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, int] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        """Return a point-in-time copy of all counters."""
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
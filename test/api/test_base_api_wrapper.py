@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.api.BaseAPIWrapper import BaseAPIWrapper
+
+
+class DummyAPIWrapper(BaseAPIWrapper):
+    pass
+
+
+class TestBaseAPIWrapper(unittest.TestCase):
+    def setUp(self):
+        self.api = DummyAPIWrapper('http://localhost:8000/', 'token', pool_size=8, get_retries=2)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_session_headers_built_once(self):
+        self.assertEqual(self.api.session.headers['Authorization'], 'Token token')
+        self.assertEqual(self.api.session.headers['Content-Type'], 'application/json')
+
+    def test_adapter_pool_and_retries(self):
+        adapter = self.api.session.get_adapter('https://example.com')
+        self.assertEqual(adapter._pool_maxsize, 8)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertIn('GET', adapter.max_retries.allowed_methods)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+
+    def test_requests_go_through_session(self):
+        with patch.object(self.api.session, 'post', return_value=MagicMock()) as mock_post:
+            self.api._post('/api/things/', json={'a': 1})
+        mock_post.assert_called_once_with('http://localhost:8000/api/things/', json={'a': 1}, timeout=self.api.timeout)
+
+        with patch.object(self.api.session, 'get', return_value=MagicMock()) as mock_get:
+            self.api._get('api/things/')
+        mock_get.assert_called_once_with('http://localhost:8000/api/things/', timeout=self.api.timeout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import gzip
+import unittest
+from unittest.mock import patch
+
+from src.api import compression
+from src.api.compression import BodyCompressor
+
+
+class TestBodyCompressor(unittest.TestCase):
+    def test_gzip(self):
+        data = b'{"id":1,"decoded":{"portnum":"TEXT_MESSAGE_APP"}}' * 50
+        compressed = BodyCompressor('gzip', min_bytes=100).compress(data)
+
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(gzip.decompress(compressed), data)
+
+    def test_small_bodies_are_not_compressed(self):
+        self.assertIsNone(BodyCompressor('gzip', min_bytes=100).compress(b'{"id":1}'))
+
+    def test_incompressible_bodies_are_not_compressed(self):
+        data = bytes(range(256)) * 2
+        with patch('src.api.compression.gzip.compress', return_value=data + b'overhead'):
+            self.assertIsNone(BodyCompressor('gzip', min_bytes=0).compress(data))
+
+    def test_zstd_falls_back_to_gzip_without_zstandard(self):
+        with patch.object(compression, 'zstandard', None):
+            self.assertEqual(BodyCompressor('zstd').encoding, 'gzip')
+
+    @unittest.skipIf(compression.zstandard is None, "zstandard not installed")
+    def test_zstd(self):
+        data = b'{"id":1}' * 200
+        compressed = BodyCompressor('zstd', min_bytes=0).compress(data)
+
+        self.assertEqual(compression.zstandard.ZstdDecompressor().decompress(compressed), data)
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            BodyCompressor('brotli')
+
+
+if __name__ == '__main__':
+    unittest.main()
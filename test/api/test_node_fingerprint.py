@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from src.api.node_fingerprint import NodeFingerprintCache
+
+
+def _node_data(long_name='Node 1', latitude=55.9, logged_time='2025-03-18 12:00:00Z'):
+    return {
+        'id': '!12345678',
+        'user': {'long_name': long_name, 'short_name': 'N1'},
+        'position': {'logged_time': logged_time, 'reported_time': logged_time, 'latitude': latitude},
+        'device_metrics': {'logged_time': logged_time, 'reported_time': logged_time, 'battery_level': 90},
+    }
+
+
+class TestNodeFingerprintCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = NodeFingerprintCache(max_staleness_sec=600)
+
+    def test_timestamps_are_ignored(self):
+        self.assertEqual(NodeFingerprintCache.fingerprint(_node_data()),
+                         NodeFingerprintCache.fingerprint(_node_data(logged_time='2025-03-18 13:00:00Z')))
+
+    def test_changes_are_detected(self):
+        fingerprint = NodeFingerprintCache.fingerprint(_node_data())
+        self.assertNotEqual(fingerprint, NodeFingerprintCache.fingerprint(_node_data(long_name='Node 2')))
+        self.assertNotEqual(fingerprint, NodeFingerprintCache.fingerprint(_node_data(latitude=56.0)))
+
+    def test_unknown_node_is_changed(self):
+        self.assertFalse(self.cache.is_unchanged('!12345678', b'abc'))
+
+    @patch('src.api.node_fingerprint.time.monotonic')
+    def test_unchanged_until_stale(self, mock_monotonic):
+        mock_monotonic.return_value = 1000
+        self.cache.record('!12345678', b'abc')
+
+        mock_monotonic.return_value = 1599
+        self.assertTrue(self.cache.is_unchanged('!12345678', b'abc'))
+        self.assertFalse(self.cache.is_unchanged('!12345678', b'def'))
+
+        mock_monotonic.return_value = 1600
+        self.assertFalse(self.cache.is_unchanged('!12345678', b'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from src.api.packet_serializer import PacketSerializer, PreparedPacket
+
+
+class TestPacketSerializer(unittest.TestCase):
+    def setUp(self):
+        self.packet = {
+            'id': 1,
+            'from': 3662961784,
+            'rxSnr': -6.75,
+            'raw': MagicMock(),
+            'decoded': {
+                'portnum': 'NODEINFO_APP',
+                'payload': b'\x01\x02hi',
+                'user': {'id': '!da545c78', 'raw': MagicMock()},
+            },
+            'hops': [{'id': 1, 'raw': MagicMock()}, b'\xff', 2, None],
+        }
+
+    def test_to_api_dict(self):
+        self.assertEqual(PacketSerializer.to_api_dict(self.packet), {
+            'id': 1,
+            'from': 3662961784,
+            'rxSnr': -6.75,
+            'decoded': {
+                'portnum': 'NODEINFO_APP',
+                'payload': 'AQJoaQ==',
+                'user': {'id': '!da545c78'},
+            },
+            'hops': [{'id': 1}, '/w==', 2, None],
+        })
+
+    def test_to_api_dict_does_not_modify_packet(self):
+        PacketSerializer.to_api_dict(self.packet)
+
+        self.assertIn('raw', self.packet)
+        self.assertIn('raw', self.packet['decoded']['user'])
+        self.assertEqual(self.packet['decoded']['payload'], b'\x01\x02hi')
+
+    def test_to_json_bytes(self):
+        data = PacketSerializer.to_json_bytes(self.packet)
+
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(json.loads(data), PacketSerializer.to_api_dict(self.packet))
+        self.assertNotIn(b' ', data)
+
+    def test_dumps_keeps_unicode(self):
+        self.assertEqual(PacketSerializer.dumps({'text': 'héllo 📡'}), '{"text":"héllo 📡"}'.encode('utf-8'))
+
+
+class TestPreparedPacket(unittest.TestCase):
+    def test_api_dict_is_built_once_across_threads(self):
+        packet = PreparedPacket({'id': 1, 'decoded': {'payload': b'hi'}})
+        barrier = threading.Barrier(8, timeout=5)
+        to_api_dict = PacketSerializer.to_api_dict
+
+        def slow_to_api_dict(p):
+            # Give the other threads time to find the dict hasn't been built yet
+            time.sleep(0.01)
+            return to_api_dict(p)
+
+        def read_api_dict(_):
+            barrier.wait()
+            return packet.api_dict
+
+        with patch.object(PacketSerializer, 'to_api_dict', side_effect=slow_to_api_dict) as mock_to_api_dict, \
+                ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(read_api_dict, range(8)))
+
+        mock_to_api_dict.assert_called_once()
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(results[0], {'id': 1, 'decoded': {'payload': 'aGk='}})
+
+
+if __name__ == '__main__':
+    unittest.main()
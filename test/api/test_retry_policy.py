@@ -0,0 +1,63 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.api.retry_policy import RetryPolicy, RetryScheduler
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_should_retry_until_attempts_run_out(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(1))
+        self.assertTrue(policy.should_retry(2))
+        self.assertFalse(policy.should_retry(3))
+
+    def test_single_attempt_never_retries(self):
+        self.assertFalse(RetryPolicy(max_attempts=1).should_retry(1))
+        self.assertFalse(RetryPolicy(max_attempts=0).should_retry(1))
+
+    def test_backoff_doubles_up_to_max(self):
+        policy = RetryPolicy(base_delay_sec=1, max_delay_sec=5)
+        with patch('src.api.retry_policy.random.uniform', side_effect=lambda low, high: high) as mock_uniform:
+            self.assertEqual([policy.backoff(attempt) for attempt in range(1, 6)], [1, 2, 4, 5, 5])
+        # Full jitter: anywhere from no wait up to the cap
+        self.assertEqual(mock_uniform.call_args.args[0], 0)
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = RetryScheduler(name='test')
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def test_runs_callbacks_in_due_order(self):
+        calls = []
+        done = threading.Event()
+        self.scheduler.schedule(0.05, lambda: (calls.append('late'), done.set()))
+        self.scheduler.schedule(0.01, lambda: calls.append('early'))
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(calls, ['early', 'late'])
+
+    def test_failing_callback_does_not_stop_scheduler(self):
+        done = threading.Event()
+        self.scheduler.schedule(0, MagicMock(side_effect=ValueError()))
+        self.scheduler.schedule(0.01, done.set)
+
+        self.assertTrue(done.wait(2))
+
+    def test_close_cancels_pending_callbacks(self):
+        fn, on_cancel = MagicMock(), MagicMock()
+        self.scheduler.schedule(60, fn, on_cancel=on_cancel)
+        self.scheduler.close()
+
+        fn.assert_not_called()
+        on_cancel.assert_called_once()
+
+    def test_schedule_after_close_cancels(self):
+        self.scheduler.close()
+        on_cancel = MagicMock()
+        self.scheduler.schedule(0, MagicMock(), on_cancel=on_cancel)
+
+        on_cancel.assert_called_once()
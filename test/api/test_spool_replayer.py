@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import MagicMock
+
+from requests import ConnectionError, HTTPError
+
+from src.api.spool_replayer import SpoolReplayer
+from src.persistence.upload_spool import SpoolEntry
+
+
+def _http_error(status_code: int) -> HTTPError:
+    response = MagicMock()
+    response.status_code = status_code
+    return HTTPError(response=response)
+
+
+class TestSpoolReplayer(unittest.TestCase):
+    def setUp(self):
+        self.storage_api = MagicMock()
+        self.storage_api.base_url = 'http://api1'
+        self.storage_api.api_version = 2
+        self.storage_api.bot.my_nodenum = 1234
+        self.spool = MagicMock()
+        self.spool.count.return_value = 0
+        self.replayer = SpoolReplayer(self.storage_api, self.spool, rate_per_sec=0, idle_interval_sec=5)
+
+    def test_purges_spool_periodically(self):
+        self.spool.peek.return_value = []
+        self.replayer.purge_interval_sec = 60
+        self.replayer._next_purge = 0
+
+        self.replayer.replay_once()
+        self.replayer.replay_once()
+
+        # Not due again for another minute
+        self.spool.purge.assert_called_once_with()
+
+    def test_replayed_packets_are_removed(self):
+        self.spool.peek.return_value = [SpoolEntry(1, 'http://api1', {'id': 1}, 0),
+                                        SpoolEntry(2, 'http://api1', {'id': 2}, 0)]
+
+        wait = self.replayer.replay_once()
+
+        self.assertEqual(wait, 0)
+        self.assertEqual(self.storage_api.replay_packet.call_count, 2)
+        self.spool.remove.assert_any_call(1)
+        self.spool.remove.assert_any_call(2)
+        self.assertEqual(self.replayer.counters.get('replayed'), 2)
+
+    def test_backs_off_while_api_unhealthy(self):
+        self.spool.peek.return_value = [SpoolEntry(1, 'http://api1', {'id': 1}, 0),
+                                        SpoolEntry(2, 'http://api1', {'id': 2}, 0)]
+        self.storage_api.replay_packet.side_effect = ConnectionError()
+
+        first_wait = self.replayer.replay_once()
+        second_wait = self.replayer.replay_once()
+
+        # Only the first packet is tried each time, as a probe
+        self.assertEqual(self.storage_api.replay_packet.call_count, 2)
+        self.spool.remove.assert_not_called()
+        self.spool.record_failure.assert_called_with(1, repr(ConnectionError()))
+        self.assertEqual(first_wait, 5)
+        self.assertEqual(second_wait, 10)
+
+    def test_rejected_packets_are_marked_dead(self):
+        self.spool.peek.return_value = [SpoolEntry(1, 'http://api1', {'id': 1}, 0)]
+        self.storage_api.replay_packet.side_effect = _http_error(400)
+
+        self.replayer.replay_once()
+
+        self.assertTrue(self.spool.record_failure.call_args.kwargs['dead'])
+        self.assertEqual(self.replayer.counters.get('rejected'), 1)
+
+    def test_waits_for_node_number(self):
+        self.storage_api.bot.my_nodenum = None
+
+        self.assertEqual(self.replayer.replay_once(), 5)
+        self.spool.peek.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,447 @@
+import gzip
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from meshtastic.protobuf.mesh_pb2 import MeshPacket
+from meshtastic.protobuf.mqtt_pb2 import ServiceEnvelope
+from requests import ConnectionError, HTTPError, Timeout
+
+from src.api.StorageAPI import IDEMPOTENCY_KEY_HEADER, StorageAPIWrapper
+from src.api.deadline import Deadline
+from src.api.errors import DeadlineExceededError
+from src.api.packet_serializer import PacketSerializer, PreparedPacket
+
+
+def _http_error(status_code: int) -> HTTPError:
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = 'error'
+    return HTTPError(response=response)
+
+
+class TestStorageAPIWrapperBatching(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', 'token', api_version=2,
+                                     batch_size=3, batch_interval_ms=60_000)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_packets_are_sent_to_bulk_endpoint(self):
+        with patch.object(self.api, '_post') as mock_post:
+            for i in range(3):
+                self.api.store_raw_packet({'id': i, 'decoded': {'payload': b'hi'}})
+            self.api.close()
+
+        mock_post.assert_called_once_with('/api/packets/1234/ingest/bulk/', data=PacketSerializer.dumps([
+            {'id': 0, 'decoded': {'payload': 'aGk='}},
+            {'id': 1, 'decoded': {'payload': 'aGk='}},
+            {'id': 2, 'decoded': {'payload': 'aGk='}},
+        ]))
+
+    def test_falls_back_to_single_posts_when_bulk_unsupported(self):
+        def post(url, json=None, timeout=None, data=None, headers=None):
+            if url.endswith('/bulk/'):
+                raise _http_error(404)
+            return MagicMock()
+
+        with patch.object(self.api, '_post', side_effect=post) as mock_post:
+            self.api.store_raw_packet({'id': 1, 'from': 5})
+            self.api.store_raw_packet({'id': 2, 'from': 5})
+            self.api.close()
+
+            self.assertFalse(self.api.bulk_supported)
+            single_calls = [c for c in mock_post.call_args_list if c.args[0] == '/api/packets/1234/ingest/']
+            self.assertEqual([c.kwargs['headers'] for c in single_calls],
+                             [{IDEMPOTENCY_KEY_HEADER: '5-1'}, {IDEMPOTENCY_KEY_HEADER: '5-2'}])
+            self.assertEqual(self.api.counters.get('packets_stored'), 2)
+            self.assertEqual(self.api.counters.get('packets_failed'), 0)
+
+            # Once bulk is known to be unsupported, packets are posted straight away
+            mock_post.reset_mock()
+            self.api.store_raw_packet({'id': 3})
+            mock_post.assert_called_once_with('/api/packets/1234/ingest/', data=b'{"id":3}', timeout=None,
+                                              headers=None)
+
+    def test_batching_disabled_for_api_v1(self):
+        api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=1, batch_size=10)
+        with patch.object(api, '_post') as mock_post:
+            api.store_raw_packet({'id': 1})
+        mock_post.assert_called_once_with('/api/raw-packet/', data=b'{"id":1}', timeout=None, headers=None)
+
+
+class TestStorageAPIWrapperTimeouts(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2,
+                                     connect_timeout=2, read_timeout=20)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_deadline_clamps_request_timeout(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_raw_packet({'id': 1}, deadline=Deadline(5))
+
+        connect, read = mock_post.call_args.kwargs['timeout']
+        self.assertEqual(connect, 2)
+        self.assertLessEqual(read, 5)
+
+    def test_expired_deadline_raises_instead_of_zero_timeout(self):
+        with self.assertRaises(DeadlineExceededError):
+            Deadline(0).clamp_timeout((2, 20))
+
+    def test_expired_deadline_is_counted_and_retried(self):
+        self.api.spool = MagicMock()
+        with patch.object(self.api, '_post') as mock_post, \
+                patch.object(self.api._retry_scheduler, 'schedule') as mock_schedule:
+            self.api.store_raw_packet({'id': 1}, deadline=Deadline(0))
+
+        mock_post.assert_not_called()
+        mock_schedule.assert_called_once()
+        self.assertEqual(self.api.counters.get('deadline_exceeded'), 1)
+        self.assertEqual(self.api.counters.get('timeouts'), 0)
+
+    def test_expired_deadline_skips_node_upload(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.assertIsNone(self.api.store_node_data({'id': '!12345678'}, deadline=Deadline(0)))
+            self.assertIsNone(self.api.store_nodes([{'id': '!12345678'}, {'id': '!87654321'}], deadline=Deadline(0)))
+
+        mock_post.assert_not_called()
+        self.assertEqual(self.api.counters.get('deadline_exceeded'), 2)
+
+    def test_timeouts_are_counted(self):
+        with patch.object(self.api, '_post', side_effect=Timeout()):
+            self.api.store_raw_packet({'id': 1})
+
+        self.assertEqual(self.api.counters.get('timeouts'), 1)
+
+
+class TestStorageAPIWrapperSpool(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.spool = MagicMock()
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2, spool=self.spool,
+                                     retry_attempts=1)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_retryable_failure_is_spooled(self):
+        with patch.object(self.api, '_post', side_effect=_http_error(503)):
+            self.api.store_raw_packet({'id': 1, 'decoded': {'payload': b'hi'}})
+
+        self.spool.append.assert_called_once_with('http://localhost:8000', {'id': 1, 'decoded': {'payload': 'aGk='}},
+                                                  'HTTP 503: error', dead=False)
+
+    def test_rejected_packet_is_spooled_as_dead(self):
+        with patch.object(self.api, '_post', side_effect=_http_error(400)):
+            self.api.store_raw_packet({'id': 1})
+
+        self.assertTrue(self.spool.append.call_args.kwargs['dead'])
+        self.assertEqual(self.api.counters.get('spooled_dead'), 1)
+
+    def test_deferred_packet_is_spooled(self):
+        self.api.defer_packet(PreparedPacket({'id': 1, 'raw': MagicMock(channel=2)}), 'deadline exceeded')
+
+        self.spool.append.assert_called_once_with('http://localhost:8000', {'id': 1, 'channel': 2},
+                                                  'deadline exceeded', dead=False)
+
+
+class TestStorageAPIWrapperRetries(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.spool = MagicMock()
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2, spool=self.spool,
+                                     retry_attempts=3, retry_base_delay_sec=0.01, retry_max_delay_sec=0.01)
+
+    def tearDown(self):
+        self.api.close()
+
+    def _wait_for_retries(self):
+        for _ in range(200):
+            if len(self.api._retry_scheduler) == 0 and self.spool.append.called:
+                return
+            time.sleep(0.01)
+
+    def test_packet_carries_idempotency_key(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_raw_packet({'from': 305419896, 'id': 7})
+
+        self.assertEqual(mock_post.call_args.kwargs['headers'], {'Idempotency-Key': '305419896-7'})
+
+    def test_retryable_failure_is_retried_then_spooled(self):
+        with patch.object(self.api, '_post', side_effect=_http_error(503)) as mock_post:
+            self.api.store_raw_packet({'from': 1, 'id': 7})
+            self._wait_for_retries()
+
+        self.assertEqual(mock_post.call_count, 3)
+        # Every attempt carries the same key
+        self.assertEqual({call.kwargs['headers']['Idempotency-Key'] for call in mock_post.call_args_list}, {'1-7'})
+        self.spool.append.assert_called_once()
+        self.assertEqual(self.api.counters.get('retries'), 2)
+        self.assertEqual(self.api.counters.get('packets_failed'), 1)
+
+    def test_retry_succeeds(self):
+        with patch.object(self.api, '_post', side_effect=[Timeout(), MagicMock()]) as mock_post:
+            self.api.store_raw_packet({'from': 1, 'id': 7})
+            for _ in range(200):
+                if self.api.counters.get('packets_stored'):
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(self.api.counters.get('packets_stored'), 1)
+        self.spool.append.assert_not_called()
+
+    def test_rejected_packet_is_not_retried(self):
+        with patch.object(self.api, '_post', side_effect=_http_error(400)) as mock_post:
+            self.api.store_raw_packet({'from': 1, 'id': 7})
+
+        mock_post.assert_called_once()
+        self.assertTrue(self.spool.append.call_args.kwargs['dead'])
+
+    def test_pending_retries_are_spooled_on_close(self):
+        api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2, spool=self.spool,
+                                retry_base_delay_sec=60, retry_max_delay_sec=60)
+        with patch('src.api.retry_policy.random.uniform', return_value=60), \
+                patch.object(api, '_post', side_effect=Timeout()) as mock_post:
+            api.store_raw_packet({'from': 1, 'id': 7})
+            api.close()
+
+        mock_post.assert_called_once()
+        self.spool.append.assert_called_once_with('http://localhost:8000', {'from': 1, 'id': 7},
+                                                  'shut down before retry', dead=False)
+
+
+class TestStorageAPIWrapperCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.spool = MagicMock()
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2, spool=self.spool,
+                                     breaker_failure_threshold=2, breaker_probe_interval_sec=60, retry_attempts=1)
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_open_breaker_spools_without_calling_api(self):
+        with patch.object(self.api.session, 'post', side_effect=ConnectionError()) as mock_post:
+            for i in range(5):
+                self.api.store_raw_packet({'id': i})
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(self.spool.append.call_count, 5)
+        self.assertEqual(self.api.counters.get('short_circuited'), 3)
+
+    def test_rejected_requests_do_not_open_breaker(self):
+        response = MagicMock()
+        response.raise_for_status.side_effect = _http_error(400)
+        with patch.object(self.api.session, 'post', return_value=response) as mock_post:
+            for i in range(5):
+                self.api.store_raw_packet({'id': i})
+
+        self.assertEqual(mock_post.call_count, 5)
+
+    def test_open_breaker_skips_nodes(self):
+        with patch.object(self.api.session, 'post', side_effect=ConnectionError()):
+            for i in range(2):
+                self.api.store_raw_packet({'id': i})
+        node = MagicMock()
+
+        with patch('src.api.StorageAPI.MeshNodeSerializer.to_api_dict', return_value={'id': '!12345678'}):
+            self.assertIsNone(self.api.store_node(node))
+
+
+class TestStorageAPIWrapperNodes(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2)
+        self.node_data = {'id': '!12345678', 'user': {'long_name': 'Node 1', 'short_name': 'N1'}}
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_unchanged_node_is_skipped(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_node_data(self.node_data)
+            self.api.store_node_data(dict(self.node_data))
+
+        mock_post.assert_called_once()
+        self.assertEqual(self.api.counters.get('nodes_unchanged'), 1)
+
+    def test_changed_node_is_sent(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_node_data(self.node_data)
+            self.api.store_node_data({**self.node_data, 'user': {'long_name': 'Node 2', 'short_name': 'N1'}})
+
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_failed_node_is_resent(self):
+        with patch.object(self.api, '_post', side_effect=[_http_error(503), MagicMock()]) as mock_post:
+            with self.assertRaises(HTTPError):
+                self.api.store_node_data(self.node_data)
+            self.api.store_node_data(self.node_data)
+
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_nodes_are_sent_in_bulk(self):
+        nodes = [{'id': f'!0000000{i}', 'user': {}} for i in range(3)]
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_nodes(nodes)
+            self.api.store_nodes(nodes)
+
+        mock_post.assert_called_once_with('/api/packets/1234/nodes/bulk/', json=nodes, timeout=None)
+        self.assertEqual(self.api.counters.get('nodes_stored'), 3)
+        self.assertEqual(self.api.counters.get('nodes_unchanged'), 3)
+
+    def test_nodes_fall_back_to_single_posts_when_bulk_unsupported(self):
+        nodes = [{'id': f'!0000000{i}', 'user': {}} for i in range(3)]
+
+        def post(url, json=None, timeout=None):
+            if url.endswith('/bulk/'):
+                raise _http_error(404)
+            if json['id'] == '!00000001':
+                raise _http_error(400)
+            return MagicMock()
+
+        with patch.object(self.api, '_post', side_effect=post) as mock_post:
+            self.api.store_nodes(nodes)
+
+        self.assertFalse(self.api.nodes_bulk_supported)
+        self.assertEqual(mock_post.call_count, 4)
+        self.assertEqual(self.api.counters.get('nodes_stored'), 2)
+        self.assertEqual(self.api.counters.get('errors'), 1)
+
+    def test_change_detection_disabled(self):
+        api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2, node_max_staleness_sec=0)
+        with patch.object(api, '_post') as mock_post:
+            api.store_node_data(self.node_data)
+            api.store_node_data(self.node_data)
+
+        self.assertEqual(mock_post.call_count, 2)
+
+
+class TestStorageAPIWrapperProtobuf(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.bot.my_id = '!000004d2'
+        self.spool = MagicMock()
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2, spool=self.spool,
+                                     upload_format=StorageAPIWrapper.UPLOAD_FORMAT_PROTOBUF, retry_attempts=1)
+        raw = MeshPacket(id=7, channel=2, rx_snr=-6.75, rx_rssi=-109)
+        raw.decoded.payload = b'hi'
+        self.packet = {'id': 7, 'decoded': {'payload': b'hi'}, 'raw': raw}
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_sends_protobuf_envelope(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_raw_packet(self.packet)
+
+        self.assertEqual(mock_post.call_args.args[0], '/api/packets/1234/ingest/protobuf/')
+        self.assertEqual(mock_post.call_args.kwargs['headers'], {'Content-Type': 'application/x-protobuf'})
+        envelope = ServiceEnvelope.FromString(mock_post.call_args.kwargs['data'])
+        self.assertEqual(envelope.gateway_id, '!000004d2')
+        self.assertEqual(envelope.packet, self.packet['raw'])
+
+    def test_packets_without_protobuf_are_sent_as_json(self):
+        with patch.object(self.api, '_post') as mock_post:
+            self.api.store_raw_packet({'id': 1})
+
+        mock_post.assert_called_once_with('/api/packets/1234/ingest/', data=b'{"id":1}', timeout=None, headers=None)
+
+    def test_falls_back_to_json_when_unsupported(self):
+        def post(url, json=None, timeout=None, data=None, headers=None):
+            if headers:
+                raise _http_error(415)
+            return MagicMock()
+
+        with patch.object(self.api, '_post', side_effect=post) as mock_post:
+            self.api.store_raw_packet(self.packet)
+
+        self.assertFalse(self.api.protobuf_supported)
+        mock_post.assert_called_with('/api/packets/1234/ingest/',
+                                     data=b'{"id":7,"decoded":{"payload":"aGk="},"channel":2}', timeout=None,
+                                     headers=None)
+        self.spool.append.assert_not_called()
+
+    def test_failed_protobuf_upload_is_spooled_as_json(self):
+        with patch.object(self.api, '_post', side_effect=_http_error(503)):
+            self.api.store_raw_packet(self.packet)
+
+        self.assertTrue(self.api.protobuf_supported)
+        self.spool.append.assert_called_once_with('http://localhost:8000',
+                                                  {'id': 7, 'decoded': {'payload': 'aGk='}, 'channel': 2},
+                                                  'HTTP 503: error', dead=False)
+
+    def test_protobuf_disabled_for_api_v1(self):
+        api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=1,
+                                upload_format=StorageAPIWrapper.UPLOAD_FORMAT_PROTOBUF)
+        self.assertFalse(api.protobuf_supported)
+
+
+class TestStorageAPIWrapperCompression(unittest.TestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.my_nodenum = 1234
+        self.api = StorageAPIWrapper(self.bot, 'http://localhost:8000', api_version=2,
+                                     compression='gzip', compression_min_bytes=100)
+        self.packet = {'id': 1, 'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'text': 'hello ' * 50}}
+
+    def tearDown(self):
+        self.api.close()
+
+    def test_large_bodies_are_compressed(self):
+        with patch.object(self.api.session, 'post', return_value=MagicMock()) as mock_post:
+            self.api.store_raw_packet(self.packet)
+
+        kwargs = mock_post.call_args.kwargs
+        self.assertEqual(kwargs['headers'], {'Content-Encoding': 'gzip'})
+        self.assertEqual(gzip.decompress(kwargs['data']), PacketSerializer.to_json_bytes(self.packet))
+        self.assertEqual(self.api.counters.get('compressed_requests'), 1)
+
+    def test_small_bodies_are_sent_uncompressed(self):
+        with patch.object(self.api.session, 'post', return_value=MagicMock()) as mock_post:
+            self.api.store_raw_packet({'id': 1})
+
+        self.assertNotIn('headers', mock_post.call_args.kwargs)
+        self.assertEqual(mock_post.call_args.kwargs['data'], b'{"id":1}')
+
+    def test_compression_disabled_when_server_rejects_it(self):
+        rejected = MagicMock()
+        rejected.raise_for_status.side_effect = _http_error(415)
+
+        with patch.object(self.api.session, 'post', side_effect=[rejected, MagicMock(), MagicMock()]) as mock_post:
+            self.api.store_raw_packet(self.packet)
+            self.api.store_raw_packet(self.packet)
+
+        self.assertIsNone(self.api.compressor)
+        self.assertEqual(mock_post.call_count, 3)
+        for call in mock_post.call_args_list[1:]:
+            self.assertNotIn('headers', call.kwargs)
+        self.assertEqual(self.api.counters.get('packets_stored'), 2)
+
+    def test_compression_kept_when_body_is_bad(self):
+        rejected = MagicMock()
+        rejected.raise_for_status.side_effect = _http_error(400)
+
+        with patch.object(self.api.session, 'post', return_value=rejected) as mock_post:
+            self.api.store_raw_packet(self.packet)
+
+        self.assertIsNotNone(self.api.compressor)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(self.api.counters.get('packets_failed'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
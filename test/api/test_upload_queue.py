@@ -0,0 +1,107 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.api.upload_queue import UploadQueue
+
+
+class TestUploadQueue(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('src.api.upload_queue.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = UploadQueue(max_size=10, workers=2, name='test')
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def test_submit_runs_task_on_worker(self):
+        results = []
+        self.queue.start()
+
+        self.assertTrue(self.queue.submit(results.append, 'packet'))
+        self.queue.join()
+
+        self.assertEqual(results, ['packet'])
+        self.assertEqual(self.queue.stats()['submitted'], 1)
+        self.assertEqual(self.queue.stats()['completed'], 1)
+
+    def test_full_queue_drops_and_counts(self):
+        # Not started, so nothing drains the queue
+        for _ in range(10):
+            self.assertTrue(self.queue.submit(lambda: None))
+
+        self.assertFalse(self.queue.submit(lambda: None))
+        stats = self.queue.stats()
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['depth'], 10)
+
+    def test_failed_task_is_counted(self):
+        def fail():
+            raise ValueError('boom')
+
+        self.queue.start()
+        self.queue.submit(fail)
+        self.queue.join()
+
+        self.assertEqual(self.queue.stats()['failed'], 1)
+
+    def test_latency_is_averaged(self):
+        self.queue._record_latency(100)
+        self.queue._record_latency(100)
+
+        self.assertAlmostEqual(self.queue.latency_ms, 36.0)
+        self.assertEqual(self.queue.stats()['latency_ms'], 36)
+
+    def test_latency_decays_while_idle(self):
+        self.queue._record_latency(1000)
+        self.assertAlmostEqual(self.queue.latency_ms, 200)
+
+        self.now += UploadQueue.LATENCY_HALF_LIFE_SEC
+        self.assertAlmostEqual(self.queue.latency_ms, 100)
+
+        self.now += 2 * UploadQueue.LATENCY_HALF_LIFE_SEC
+        self.assertAlmostEqual(self.queue.latency_ms, 25)
+
+    def _run_behind_slow_task(self, timed: bool):
+        """
+        Submit a task which waits 500ms in the queue behind a slow one
+        """
+        started, release = threading.Event(), threading.Event()
+        self.queue = UploadQueue(max_size=10, workers=1, name='test')
+        self.queue.start()
+
+        self.queue.submit(lambda: (started.set(), release.wait(5)), timed=timed)
+        self.assertTrue(started.wait(5))
+        self.queue.submit(lambda: None, timed=timed)
+        self.now += 0.5
+        release.set()
+        self.queue.join()
+
+    def test_latency_is_queue_wait_not_run_time(self):
+        # The slow task was picked up straight away, so only the second task's wait counts
+        self._run_behind_slow_task(timed=True)
+
+        self.assertAlmostEqual(self.queue.latency_ms, 500 * UploadQueue.LATENCY_SMOOTHING)
+
+    def test_untimed_tasks_are_not_counted(self):
+        self._run_behind_slow_task(timed=False)
+
+        self.assertEqual(self.queue.latency_ms, 0)
+
+    def test_stop_drains_queue(self):
+        done = threading.Event()
+        for _ in range(5):
+            self.queue.submit(lambda: None)
+        self.queue.submit(done.set)
+
+        self.queue.start()
+        self.queue.stop()
+
+        self.assertTrue(done.is_set())
+        self.assertEqual(self.queue.depth, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+from typing import Callable
+
+from src.persistence import BaseSqlitePersistenceStore
+
+
+def query_plans(store: BaseSqlitePersistenceStore, fn: Callable[[], object]) -> list[str]:
+    """
+    Run fn, and return the query plan of each SELECT it ran on the store's connection
+    """
+    conn = store._connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+
+    return [' '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}'))
+            for statement in statements if statement.lstrip().upper().startswith('SELECT')]
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+import time
+import unittest
+
+from src.persistence.upload_spool import SqliteUploadSpool
+
+
+class TestBaseSqlitePersistenceStore(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'test_base_store.sqlite'
+        self.store = SqliteUploadSpool(self.db_path, cache_size_kb=1024, mmap_size_bytes=0)
+
+    def tearDown(self):
+        self.store.close()
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_connection_is_reused_by_thread(self):
+        self.assertIs(self.store._connection(), self.store._connection())
+
+    def test_threads_get_their_own_connection(self):
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.store._connection()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(other[0], self.store._connection())
+
+    def test_exited_threads_connections_are_closed(self):
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.store._connection()))
+        thread.start()
+        thread.join()
+
+        # The next thread to open a connection tidies up after the one which exited
+        thread = threading.Thread(target=self.store._connection)
+        thread.start()
+        thread.join()
+
+        with self.assertRaises(sqlite3.ProgrammingError):
+            other[0].execute('SELECT 1')
+        self.assertEqual(len(self.store._connections), 2)
+
+    def test_close_closes_every_threads_connection(self):
+        other = []
+        release = threading.Event()
+
+        def use_store():
+            other.append(self.store._connection())
+            release.wait(5)
+
+        thread = threading.Thread(target=use_store)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        while not other:
+            time.sleep(0.01)
+        conn = self.store._connection()
+
+        self.store.close()
+
+        for closed in (conn, other[0]):
+            with self.assertRaises(sqlite3.ProgrammingError):
+                closed.execute('SELECT 1')
+        self.assertIsNot(self.store._connection(), conn)
+
+    def test_pragmas(self):
+        conn = self.store._connection()
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        # NORMAL
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(conn.execute('PRAGMA cache_size').fetchone()[0], -1024)
+
+    def test_usable_after_close(self):
+        self.store.append('http://api1', {'id': 1})
+        self.store.close()
+
+        self.assertEqual(self.store.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
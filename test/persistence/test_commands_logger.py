@@ -7,6 +7,7 @@ from unittest.mock import MagicMock
 from src.commands.command import AbstractCommand
 from src.persistence.commands_logger import SqliteCommandLogger
 from src.responders.responder import AbstractResponder
+from test.persistence import query_plans
 
 
 class TestSqliteCommandLogger(unittest.TestCase):
@@ -15,8 +16,10 @@ class TestSqliteCommandLogger(unittest.TestCase):
         self.logger = SqliteCommandLogger(self.db_path)
 
     def tearDown(self):
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        self.logger.close()
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_initialize_db(self):
         with sqlite3.connect(self.db_path) as conn:
@@ -98,6 +101,18 @@ class TestSqliteCommandLogger(unittest.TestCase):
         self.assertIn('responder_class', history.columns)
         self.assertIn('timestamp', history.columns)
 
+    def test_history_queries_use_indexes(self):
+        since = datetime.now(timezone.utc) - timedelta(days=1)
+        for table, get_history in (('command_log', self.logger.get_command_history),
+                                   ('unknown_requests', self.logger.get_unknown_command_history),
+                                   ('responder_log', self.logger.get_responder_history)):
+            with self.subTest(table=table):
+                [plan] = query_plans(self.logger, lambda: get_history(since=since))
+                self.assertIn(f'USING INDEX idx_{table}_time', plan)
+
+                [plan] = query_plans(self.logger, lambda: get_history(since=since, sender_id='sender1'))
+                self.assertIn(f'USING INDEX idx_{table}_sender_time', plan)
+
 
 if __name__ == '__main__':
     unittest.main()
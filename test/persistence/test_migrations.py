@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from src.persistence.commands_logger import SqliteCommandLogger
+from src.persistence.migrations import Migration, get_schema_version, is_new_db, migrate, rebuild_table, \
+    stamp_schema_version
+from src.persistence.node_db import SqliteNodeDB
+from src.persistence.upload_spool import SqliteUploadSpool
+from src.persistence.user_prefs import SqliteUserPrefsPersistence
+
+
+class TestMigrate(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.applied = []
+
+    def _migration(self, version: int, sql: str = None) -> Migration:
+        def apply(conn):
+            self.applied.append(version)
+            if sql:
+                conn.execute(sql)
+
+        return Migration(version, f"migration {version}", apply)
+
+    def test_applies_pending_migrations_in_order(self):
+        migrations = [self._migration(1), self._migration(2)]
+
+        self.assertEqual(migrate(self.conn, migrations), 2)
+        self.assertEqual(migrate(self.conn, migrations), 2)
+
+        self.assertEqual(self.applied, [1, 2])
+        self.assertEqual(get_schema_version(self.conn), 2)
+
+    def test_only_applies_new_migrations(self):
+        migrate(self.conn, [self._migration(1)])
+        migrate(self.conn, [self._migration(1), self._migration(2)])
+
+        self.assertEqual(self.applied, [1, 2])
+
+    def test_failed_migration_is_rolled_back(self):
+        migrations = [self._migration(1, 'CREATE TABLE a (x)'),
+                      self._migration(2, 'CREATE TABLE b (x)'),
+                      self._migration(3, 'NOT SQL')]
+
+        with self.assertRaises(sqlite3.OperationalError):
+            migrate(self.conn, migrations)
+
+        self.assertEqual(get_schema_version(self.conn), 2)
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({'a', 'b'} <= tables)
+
+    def test_failed_migration_leaves_no_partial_changes(self):
+        def apply(conn):
+            conn.execute('CREATE TABLE a (x)')
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            migrate(self.conn, [Migration(1, 'broken', apply)])
+
+        self.assertEqual(get_schema_version(self.conn), 0)
+        self.assertIsNone(self.conn.execute("SELECT name FROM sqlite_master WHERE name = 'a'").fetchone())
+
+    def test_versions_must_be_in_order(self):
+        with self.assertRaises(ValueError):
+            migrate(self.conn, [self._migration(2), self._migration(1)])
+
+    def test_rebuild_table_keeps_rows_and_indexes(self):
+        self.conn.execute('CREATE TABLE t (id TEXT, n TEXT)')
+        self.conn.execute('CREATE INDEX idx_t_id ON t (id)')
+        self.conn.execute("INSERT INTO t VALUES ('a', '1')")
+
+        rebuild_table(self.conn, 't', 'CREATE TABLE {table} (id TEXT, n INTEGER)',
+                      'SELECT id, CAST(n AS INTEGER) FROM {table}')
+
+        self.assertEqual(self.conn.execute('SELECT id, n FROM t').fetchall(), [('a', 1)])
+        self.assertIsNotNone(self.conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_t_id'").fetchone())
+
+    def test_rebuild_table_skips_missing_table(self):
+        rebuild_table(self.conn, 't', 'CREATE TABLE {table} (id TEXT)', 'SELECT id FROM {table}')
+
+        self.assertIsNone(self.conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 't%'").fetchone())
+
+    def test_stamp_new_db(self):
+        self.assertTrue(is_new_db(self.conn))
+
+        self.assertEqual(stamp_schema_version(self.conn, [self._migration(1), self._migration(2)]), 2)
+
+        # Recorded as up to date, without running anything
+        self.assertEqual(self.applied, [])
+        self.assertEqual(migrate(self.conn, [self._migration(1), self._migration(2)]), 2)
+        self.assertEqual(self.applied, [])
+        self.conn.execute('CREATE TABLE t (id TEXT)')
+        self.assertFalse(is_new_db(self.conn))
+
+
+class TestNewDBSchemas(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'test_new_schemas.sqlite'
+
+    def tearDown(self):
+        self._remove_db()
+
+    def _remove_db(self):
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_new_dbs_are_created_with_latest_schema(self):
+        for store_class, table, column in ((SqliteNodeDB, 'positions', 'logged_time'),
+                                           (SqliteNodeDB, 'device_metrics', 'logged_time'),
+                                           (SqliteCommandLogger, 'command_log', 'timestamp'),
+                                           (SqliteUserPrefsPersistence, 'user_prefs', 'time_set'),
+                                           (SqliteUploadSpool, 'upload_spool', 'created_at')):
+            with self.subTest(store=store_class.__name__, table=table):
+                store = store_class(self.db_path)
+                try:
+                    conn = store._connection()
+                    types = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({table})')}
+                    self.assertEqual(types[column], 'INTEGER')
+                    self.assertEqual(get_schema_version(conn), store_class.MIGRATIONS[-1].version)
+                    self.assertEqual(conn.execute('SELECT description FROM schema_version').fetchall(),
+                                     [('Created with the latest schema',)])
+                finally:
+                    store.close()
+                    self._remove_db()
+
+
+class TestEpochMsMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'test_migrations.sqlite'
+
+    def tearDown(self):
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_command_log_timestamps_are_converted(self):
+        logged = datetime.now(timezone.utc) - timedelta(hours=1)
+        with sqlite3.connect(self.db_path) as conn:
+            # As created by older versions
+            conn.execute('''
+                CREATE TABLE command_log (sender_id TEXT, base_command TEXT, sub_commands TEXT, args TEXT,
+                                          timestamp TEXT, handler_class TEXT)
+            ''')
+            conn.execute("INSERT INTO command_log VALUES ('!1', 'ping', NULL, NULL, ?, 'PingCommand')",
+                         (logged.isoformat(),))
+        conn.close()
+
+        logger = SqliteCommandLogger(self.db_path)
+        self.addCleanup(logger.close)
+
+        raw = logger._connection().execute('SELECT timestamp FROM command_log').fetchone()[0]
+        self.assertEqual(raw, (logged - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(milliseconds=1))
+        history = logger.get_command_history(since=logged - timedelta(minutes=1), sender_id='!1')
+        self.assertEqual(list(history['base_command']), ['ping'])
+        self.assertEqual(get_schema_version(logger._connection()), 1)
+
+    def test_node_db_times_are_converted(self):
+        logged = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE positions (node_id TEXT, logged_time DATETIME, reported_time DATETIME, latitude REAL,
+                                        longitude REAL, altitude REAL, location_source TEXT)
+            ''')
+            # str(datetime), as stored by sqlite3's default datetime adapter
+            conn.execute("INSERT INTO positions VALUES ('!1', ?, 0, 55.8, -4.2, 10, '')", (str(logged),))
+        conn.close()
+
+        db = SqliteNodeDB(self.db_path)
+        self.addCleanup(db.close)
+
+        position = db.get_last_position('!1')
+        self.assertEqual(position.logged_time, logged.replace(microsecond=123000))
+        self.assertIsNone(position.reported_time)
+        self.assertEqual(len(db.get_position_log('!1', logged - timedelta(days=1), logged + timedelta(days=1))), 1)
+        # The index dropped with the old table is back
+        self.assertIsNotNone(db._connection().execute(
+            "SELECT name FROM sqlite_master WHERE name = 'idx_positions_node_time'").fetchone())
+
+    def test_upload_spool_created_at_is_converted(self):
+        created = datetime.now(timezone.utc) - timedelta(hours=1)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE upload_spool (id INTEGER PRIMARY KEY AUTOINCREMENT, endpoint TEXT, payload TEXT,
+                                           error TEXT, attempts INTEGER DEFAULT 0, dead INTEGER DEFAULT 0,
+                                           created_at TEXT)
+            ''')
+            conn.execute("INSERT INTO upload_spool (id, endpoint, payload, created_at) VALUES (7, 'http://api1', "
+                         "'{\"id\": 1}', ?)", (created.isoformat(),))
+        conn.close()
+
+        spool = SqliteUploadSpool(self.db_path)
+        self.addCleanup(spool.close)
+        spool.append('http://api1', {'id': 2})
+
+        rows = spool._connection().execute('SELECT id, created_at FROM upload_spool ORDER BY id').fetchall()
+        created_ms = (created - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(milliseconds=1)
+        self.assertEqual(rows[0], (7, created_ms))
+        # Ids carry on from where they were
+        self.assertGreater(rows[1][0], 7)
+        self.assertIsInstance(rows[1][1], int)
+        self.assertEqual(get_schema_version(spool._connection()), 1)
+
+    def test_node_db_short_names_are_folded(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE nodes (id TEXT PRIMARY KEY, short_name TEXT, long_name TEXT, macaddr TEXT, hw_model TEXT,
+                                    public_key TEXT)
+            ''')
+            conn.execute('CREATE INDEX idx_nodes_short_name ON nodes (short_name COLLATE NOCASE)')
+            conn.execute("INSERT INTO nodes (id, short_name, long_name) VALUES ('!1', 'Ä1', 'Node 1')")
+        conn.close()
+
+        db = SqliteNodeDB(self.db_path)
+        self.addCleanup(db.close)
+
+        self.assertEqual(db.get_by_short_name('ä1').id, '!1')
+        indexes = {row[0] for row in db._connection().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('idx_nodes_short_name_folded', indexes)
+        self.assertNotIn('idx_nodes_short_name', indexes)
+        self.assertEqual(get_schema_version(db._connection()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,49 @@
 import os
+import sqlite3
+import time
 import unittest
+from unittest.mock import MagicMock
 from datetime import datetime, timezone, timedelta
 
 from src.data_classes import MeshNode
-from src.persistence.node_db import SqliteNodeDB, InMemoryNodeDB
+from src.persistence.node_db import AbstractNodeDB, CachingNodeDB, SqliteNodeDB, InMemoryNodeDB
+from test.persistence import query_plans
 
 
-class TestInMemoryNodeDB(unittest.TestCase):
+class ShortNameLookupTests:
+    # Run against each node DB implementation, which must agree
+    db: AbstractNodeDB
+    node_user: MeshNode.User
+
+    def test_get_by_short_name_ignores_case(self):
+        self.db.store_user(self.node_user)
+        self.assertEqual(self.db.get_by_short_name('NODE1').id, 'node1')
+        self.assertIsNone(self.db.get_by_short_name('Node2'))
+
+    def test_get_by_short_name_ignores_case_beyond_ascii(self):
+        self.db.store_user(MeshNode.User(node_id='node2', short_name='Ä1', long_name='Test Node 2'))
+        self.db.store_user(MeshNode.User(node_id='node3', short_name='Straße', long_name='Test Node 3'))
+
+        self.assertEqual(self.db.get_by_short_name('ä1').id, 'node2')
+        self.assertEqual(self.db.get_by_short_name('STRASSE').id, 'node3')
+
+    def test_get_by_short_name_follows_renames(self):
+        self.db.store_user(self.node_user)
+        self.db.store_user(MeshNode.User(node_id='node1', short_name='New1', long_name='Renamed'))
+
+        self.assertIsNone(self.db.get_by_short_name('Node1'))
+        self.assertEqual(self.db.get_by_short_name('new1').long_name, 'Renamed')
+
+    def test_get_by_short_name_returns_first_of_duplicates(self):
+        self.db.store_user(self.node_user)
+        self.db.store_user(MeshNode.User(node_id='node2', short_name='node1', long_name='Test Node 2'))
+        self.assertEqual(self.db.get_by_short_name('Node1').id, 'node1')
+
+        self.db.store_user(MeshNode.User(node_id='node1', short_name='Other', long_name='Test Node 1'))
+        self.assertEqual(self.db.get_by_short_name('Node1').id, 'node2')
+
+
+class TestInMemoryNodeDB(ShortNameLookupTests, unittest.TestCase):
     def setUp(self):
         self.db = InMemoryNodeDB()
         self.node_user = MeshNode.User(node_id='node1', short_name='Node1', long_name='Test Node 1')
@@ -56,8 +93,16 @@ class TestInMemoryNodeDB(unittest.TestCase):
         self.assertEqual(len(metrics), 1)
         self.assertEqual(metrics[0].battery_level, self.device_metrics.battery_level)
 
+    def test_get_by_ids(self):
+        self.db.store_user(self.node_user)
+        self.db.store_user(MeshNode.User(node_id='node2', short_name='Node2', long_name='Test Node 2'))
+
+        users = self.db.get_by_ids(['node2', 'unknown', 'node1'])
+        self.assertEqual({node_id: user.short_name for node_id, user in users.items()},
+                         {'node1': 'Node1', 'node2': 'Node2'})
 
-class TestSqliteNodeDB(unittest.TestCase):
+
+class TestSqliteNodeDB(ShortNameLookupTests, unittest.TestCase):
     def setUp(self):
         self.db_path = 'test_node_db.sqlite'
         self.db = SqliteNodeDB(self.db_path)
@@ -68,8 +113,10 @@ class TestSqliteNodeDB(unittest.TestCase):
                                                      battery_level=90)
 
     def tearDown(self):
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        self.db.close()
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_store_and_get_user(self):
         self.db.store_user(self.node_user)
@@ -112,6 +159,212 @@ class TestSqliteNodeDB(unittest.TestCase):
         self.assertEqual(len(metrics), 1)
         self.assertEqual(metrics[0].battery_level, self.device_metrics.battery_level)
 
+    def test_store_nodes(self):
+        node = MeshNode()
+        node.user = self.node_user
+        node.position = self.position
+        node.device_metrics = self.device_metrics
+        other = MeshNode()
+        other.user = MeshNode.User(node_id='node2', short_name='Node2', long_name='Test Node 2')
+        other.position = None
+        other.device_metrics = None
+
+        self.db.store_nodes([node, other])
+
+        self.assertEqual({user.id for user in self.db.list_nodes()}, {'node1', 'node2'})
+        self.assertEqual(self.db.get_last_position('node1').latitude, self.position.latitude)
+        self.assertEqual(self.db.get_last_device_metrics('node1').battery_level, self.device_metrics.battery_level)
+        self.assertIsNone(self.db.get_last_position('node2'))
+
+    def _store_users(self, count: int) -> list[str]:
+        nodes = []
+        for i in range(count):
+            node = MeshNode()
+            node.user = MeshNode.User(node_id=f'!{i:08x}', short_name=f'N{i}', long_name=f'Test Node {i}')
+            node.position = None
+            node.device_metrics = None
+            nodes.append(node)
+        self.db.store_nodes(nodes)
+        return [node.user.id for node in nodes]
+
+    def test_get_by_ids(self):
+        self.db.store_user(self.node_user)
+        self.db.store_user(MeshNode.User(node_id='node2', short_name='Node2', long_name='Test Node 2'))
+
+        users = self.db.get_by_ids(['node2', 'unknown', 'node1', 'node2'])
+        self.assertEqual({node_id: user.short_name for node_id, user in users.items()},
+                         {'node1': 'Node1', 'node2': 'Node2'})
+        self.assertEqual(self.db.get_by_ids([]), {})
+
+    def test_get_by_ids_is_one_query(self):
+        node_ids = self._store_users(500)
+
+        plans = query_plans(self.db, lambda: self.assertEqual(len(self.db.get_by_ids(node_ids)), 500))
+        self.assertEqual(len(plans), 1)
+
+    def test_get_by_ids_chunks_long_lists(self):
+        node_ids = self._store_users(1200)
+
+        plans = query_plans(self.db, lambda: self.assertEqual(len(self.db.get_by_ids(node_ids)), 1200))
+        self.assertEqual(len(plans), 3)
+
+    def test_short_name_lookup_uses_index(self):
+        [plan] = query_plans(self.db, lambda: self.db.get_by_short_name('node1'))
+        self.assertIn('USING INDEX idx_nodes_short_name_folded', plan)
+
+    def test_history_queries_use_indexes(self):
+        start_time = datetime.now(timezone.utc) - timedelta(days=1)
+        end_time = datetime.now(timezone.utc)
+        for index, fn in (
+                ('idx_positions_node_time', lambda: self.db.get_last_position('node1')),
+                ('idx_positions_node_time', lambda: self.db.get_position_log('node1', start_time, end_time)),
+                ('idx_device_metrics_node_time', lambda: self.db.get_last_device_metrics('node1')),
+                ('idx_device_metrics_node_time', lambda: self.db.get_device_metrics_log('node1', start_time, end_time)),
+        ):
+            with self.subTest(index=index):
+                [plan] = query_plans(self.db, fn)
+                self.assertIn(f'USING INDEX {index}', plan)
+                # Rows come out of the index already in order
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TestSqliteNodeDBWriteBehind(TestSqliteNodeDB):
+    # Runs all of TestSqliteNodeDB's tests with writes queued
+    def setUp(self):
+        super().setUp()
+        self.db.close()
+        self.db = SqliteNodeDB(self.db_path, write_batch_size=100, write_interval_ms=60_000)
+
+    def _count_rows(self, table: str) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_writes_are_queued(self):
+        self.db.store_user(self.node_user)
+        self.db.store_position(self.node_user.id, self.position)
+
+        self.assertEqual(self._count_rows('nodes'), 0)
+        self.assertEqual(self._count_rows('positions'), 0)
+
+    def test_get_by_id_reads_queued_user(self):
+        self.db.store_user(self.node_user)
+        updated = MeshNode.User(node_id='node1', short_name='New1', long_name='Renamed')
+        self.db.store_user(updated)
+
+        self.assertIs(self.db.get_by_id('node1'), updated)
+
+    def test_get_by_ids_reads_queued_users(self):
+        self._store_users(2)
+        self.db.store_user(self.node_user)
+
+        users = self.db.get_by_ids(['node1', '!00000001'])
+        self.assertIs(users['node1'], self.node_user)
+        self.assertEqual(users['!00000001'].short_name, 'N1')
+
+    def test_flushes_when_batch_is_full(self):
+        db = SqliteNodeDB(self.db_path, write_batch_size=2, write_interval_ms=60_000)
+        self.addCleanup(db.close)
+        db.store_user(self.node_user)
+        db.store_position(self.node_user.id, self.position)
+
+        for _ in range(100):
+            if self._count_rows('positions'):
+                break
+            time.sleep(0.01)
+        self.assertEqual(self._count_rows('nodes'), 1)
+        self.assertEqual(self._count_rows('positions'), 1)
+
+    def test_close_flushes_queued_writes(self):
+        self.db.store_user(self.node_user)
+        self.db.store_device_metrics(self.node_user.id, self.device_metrics)
+        self.db.close()
+
+        self.assertEqual(self._count_rows('nodes'), 1)
+        self.assertEqual(self._count_rows('device_metrics'), 1)
+
+    def test_flushed_users_are_read_from_db(self):
+        self.db.store_user(self.node_user)
+        self.db.flush()
+
+        self.assertEqual(self.db._pending_users, {})
+        self.assertEqual(self.db.get_by_id('node1').short_name, 'Node1')
+
+
+class TestCachingNodeDB(unittest.TestCase):
+    def setUp(self):
+        self.inner = InMemoryNodeDB()
+        self.inner.store_user(MeshNode.User(node_id='node1', short_name='Node1', long_name='Test Node 1'))
+        self.inner.get_by_id = MagicMock(wraps=self.inner.get_by_id)
+        self.db = CachingNodeDB(self.inner, max_entries=2)
+
+    def test_repeat_lookups_are_cached(self):
+        self.assertEqual(self.db.get_by_id('node1').short_name, 'Node1')
+        self.assertEqual(self.db.get_by_id('node1').short_name, 'Node1')
+
+        self.inner.get_by_id.assert_called_once_with('node1')
+        self.assertEqual(self.db.counters.snapshot(), {'misses': 1, 'hits': 1})
+
+    def test_unknown_nodes_are_cached(self):
+        self.assertIsNone(self.db.get_by_id('unknown'))
+        self.assertIsNone(self.db.get_by_id('unknown'))
+
+        self.inner.get_by_id.assert_called_once_with('unknown')
+        self.assertEqual(self.db.counters.get('negative_hits'), 1)
+
+    def test_store_user_invalidates(self):
+        self.assertIsNone(self.db.get_by_id('node2'))
+        self.db.store_user(MeshNode.User(node_id='node2', short_name='Node2', long_name='Test Node 2'))
+
+        self.assertEqual(self.db.get_by_id('node2').short_name, 'Node2')
+
+    def test_store_nodes_invalidates(self):
+        self.db.get_by_id('node1')
+        node = MeshNode()
+        node.user = MeshNode.User(node_id='node1', short_name='New1', long_name='Renamed')
+        node.position = None
+        node.device_metrics = None
+        self.db.store_nodes([node])
+
+        self.assertEqual(self.db.get_by_id('node1').short_name, 'New1')
+
+    def test_least_recently_used_is_evicted(self):
+        self.db.get_by_id('node1')
+        self.db.get_by_id('a')
+        self.db.get_by_id('node1')
+        self.db.get_by_id('b')
+
+        self.assertEqual(len(self.db), 2)
+        self.assertEqual(self.db.counters.get('evicted'), 1)
+        # 'a' was evicted, 'node1' is still cached
+        self.db.get_by_id('node1')
+        self.db.get_by_id('a')
+        self.assertEqual([call.args[0] for call in self.inner.get_by_id.call_args_list], ['node1', 'a', 'b', 'a'])
+
+    def test_get_by_ids_fetches_misses_together(self):
+        self.inner.get_by_ids = MagicMock(wraps=self.inner.get_by_ids)
+        self.db.get_by_id('node1')
+
+        users = self.db.get_by_ids(['node1', 'unknown'])
+        self.assertEqual(list(users), ['node1'])
+        self.inner.get_by_ids.assert_called_once_with(['unknown'])
+
+        # Both are cached now, including the unknown node
+        self.assertEqual(list(self.db.get_by_ids(['node1', 'unknown'])), ['node1'])
+        self.inner.get_by_ids.assert_called_once()
+        self.assertEqual(self.db.counters.snapshot(), {'misses': 2, 'hits': 2, 'negative_hits': 1})
+
+    def test_lookup_racing_a_write_is_not_cached(self):
+        def get_by_id(node_id):
+            # A write lands while the lookup is in flight
+            self.db.store_user(MeshNode.User(node_id='node1', short_name='New1', long_name='Renamed'))
+            return MeshNode.User(node_id='node1', short_name='Node1', long_name='Test Node 1')
+
+        self.inner.get_by_id.side_effect = get_by_id
+        self.db.get_by_id('node1')
+        self.inner.get_by_id.side_effect = None
+
+        self.assertEqual(self.db.get_by_id('node1').short_name, 'New1')
+
 
 if __name__ == '__main__':
     unittest.main()
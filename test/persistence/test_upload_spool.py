@@ -0,0 +1,111 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from src.helpers import to_epoch_ms
+from src.persistence.upload_spool import SqliteUploadSpool
+
+
+class TestSqliteUploadSpool(unittest.TestCase):
+    def setUp(self):
+        self.db_path = 'test_upload_spool.sqlite'
+        self.spool = SqliteUploadSpool(self.db_path)
+
+    def tearDown(self):
+        self.spool.close()
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_append_and_peek_in_order(self):
+        self.spool.append('http://api1', {'id': 1}, 'HTTP 503')
+        self.spool.append('http://api2', {'id': 2}, 'HTTP 503')
+        self.spool.append('http://api1', {'id': 3}, 'HTTP 503')
+
+        entries = self.spool.peek('http://api1', 10)
+        self.assertEqual([e.payload['id'] for e in entries], [1, 3])
+        self.assertEqual(self.spool.count(), 3)
+        self.assertEqual(self.spool.count('http://api1'), 2)
+
+    def test_remove(self):
+        self.spool.append('http://api1', {'id': 1})
+        entry = self.spool.peek('http://api1', 1)[0]
+
+        self.spool.remove(entry.id)
+
+        self.assertEqual(self.spool.count(), 0)
+
+    def test_dead_entries_are_not_replayed(self):
+        self.spool.append('http://api1', {'id': 1}, 'HTTP 400', dead=True)
+        self.spool.append('http://api1', {'id': 2})
+        entry = self.spool.peek('http://api1', 10)[0]
+        self.assertEqual(entry.payload['id'], 2)
+
+        self.spool.record_failure(entry.id, 'HTTP 400', dead=True)
+
+        self.assertEqual(self.spool.peek('http://api1', 10), [])
+        self.assertEqual(self.spool.count(), 0)
+
+    def test_record_failure_counts_attempts(self):
+        self.spool.append('http://api1', {'id': 1})
+        entry = self.spool.peek('http://api1', 1)[0]
+
+        self.spool.record_failure(entry.id, 'timeout')
+        self.spool.record_failure(entry.id, 'timeout')
+
+        self.assertEqual(self.spool.peek('http://api1', 1)[0].attempts, 2)
+
+    def _backdate(self, payload_id: int, age: timedelta):
+        with self.spool._connection() as conn:
+            conn.execute("UPDATE upload_spool SET created_at = ? WHERE json_extract(payload, '$.id') = ?",
+                         (to_epoch_ms(datetime.now(timezone.utc) - age), payload_id))
+
+    def test_purge_deletes_expired_packets(self):
+        self.spool.max_age_sec = 60 * 60
+        self.spool.append('http://api1', {'id': 1})
+        self.spool.append('http://api1', {'id': 2}, 'HTTP 400', dead=True)
+        self.spool.append('http://api1', {'id': 3})
+        self._backdate(1, timedelta(hours=2))
+        self._backdate(2, timedelta(hours=2))
+
+        self.assertEqual(self.spool.purge(), 2)
+
+        self.assertEqual([e.payload['id'] for e in self.spool.peek('http://api1', 10)], [3])
+        self.assertEqual(self.spool.counters.get('purged_expired'), 2)
+
+    def test_purge_caps_rows_dead_first(self):
+        self.spool.max_rows = 2
+        self.spool.append('http://api1', {'id': 1})
+        self.spool.append('http://api1', {'id': 2})
+        self.spool.append('http://api1', {'id': 3}, 'HTTP 400', dead=True)
+        self.spool.append('http://api1', {'id': 4})
+
+        self.assertEqual(self.spool.purge(), 2)
+
+        # The dead packet goes first, then the oldest pending one
+        self.assertEqual([e.payload['id'] for e in self.spool.peek('http://api1', 10)], [2, 4])
+        self.assertEqual(self.spool.counters.get('purged_overflow'), 2)
+
+    def test_purges_on_startup(self):
+        for i in range(3):
+            self.spool.append('http://api1', {'id': i})
+        self.spool.close()
+
+        reopened = SqliteUploadSpool(self.db_path, max_rows=1)
+        self.addCleanup(reopened.close)
+
+        self.assertEqual(reopened.count(), 1)
+        self.assertEqual(reopened.counters.get('purged_overflow'), 2)
+
+    def test_survives_reopen(self):
+        self.spool.append('http://api1', {'id': 1, 'decoded': {'payload': 'aGk='}})
+
+        self.spool.close()
+        reopened = SqliteUploadSpool(self.db_path)
+        self.addCleanup(reopened.close)
+
+        self.assertEqual(reopened.peek('http://api1', 1)[0].payload, {'id': 1, 'decoded': {'payload': 'aGk='}})
+
+
+if __name__ == '__main__':
+    unittest.main()
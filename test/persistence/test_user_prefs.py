@@ -1,7 +1,7 @@
 import os
 import sqlite3
 import unittest
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 from src.persistence.user_prefs import UserPrefs, SqliteUserPrefsPersistence
 
@@ -13,8 +13,10 @@ class TestSqliteUserPrefsPersistence(unittest.TestCase):
         self.persistence._initialize_db()
 
     def tearDown(self):
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        self.persistence.close()
+        for path in (self.db_path, f"{self.db_path}-wal", f"{self.db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_initialize_db(self):
         with sqlite3.connect(self.db_path) as conn:
@@ -67,10 +69,12 @@ class TestSqliteUserPrefsPersistence(unittest.TestCase):
     def test_field_change_does_not_update_others(self):
         user_id = 'test_user'
         user_prefs = UserPrefs(user_id)
+        # Times are stored to the millisecond
+        time_set = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=1)
         user_prefs.respond_to_testing = UserPrefs.Preference.from_values(
-            value=True, time_set=datetime.now(timezone.utc), num_changes=0)
+            value=True, time_set=time_set, num_changes=0)
         user_prefs.another_setting = UserPrefs.Preference.from_values(
-            value='value', time_set=datetime.now(timezone.utc), num_changes=0)
+            value='value', time_set=time_set, num_changes=0)
         original_time_set_testing = user_prefs.respond_to_testing.time_set
         original_time_set_another = user_prefs.another_setting.time_set
 
@@ -90,6 +94,16 @@ class TestSqliteUserPrefsPersistence(unittest.TestCase):
         self.assertEqual(retrieved_prefs.another_setting.num_changes, 0)
         self.assertEqual(retrieved_prefs.another_setting.time_set, original_time_set_another)
 
+    def test_time_set_is_stored_as_epoch_ms(self):
+        user_prefs = UserPrefs('test_user')
+        self.persistence.persist_user_prefs('test_user', user_prefs)
+
+        with sqlite3.connect(self.db_path) as conn:
+            time_set = conn.execute("SELECT time_set FROM user_prefs WHERE user_id = 'test_user'").fetchone()[0]
+        self.assertIsInstance(time_set, int)
+        self.assertEqual(self.persistence.get_user_prefs('test_user').respond_to_testing.time_set.tzinfo,
+                         timezone.utc)
+
 
 if __name__ == '__main__':
     unittest.main()
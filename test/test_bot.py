@@ -1,8 +1,15 @@
+import itertools
+import threading
 import unittest
 from unittest import skipIf
 from unittest.mock import MagicMock, patch
 
 from src.bot import MeshtasticBot
+from src.load_shedder import LoadShedder
+from src.packet_dedup import PacketDeduplicator
+from src.packet_filters import PacketFilter
+from src.packet_lanes import PacketLanes
+from src.utils.batcher import Batcher
 
 
 class TestMeshtasticBot(unittest.TestCase):
@@ -24,6 +31,253 @@ class TestMeshtasticBot(unittest.TestCase):
         self.bot.disconnect()
         self.bot.interface.close.assert_called_once()
 
+    def test_get_node_by_short_name_uses_node_db_index(self):
+        self.bot.node_db = MagicMock()
+
+        node = self.bot.get_node_by_short_name('ABCD')
+
+        self.bot.node_db.get_by_short_name.assert_called_once_with('ABCD')
+        self.bot.node_db.list_nodes.assert_not_called()
+        self.assertIs(node, self.bot.node_db.get_by_short_name.return_value)
+
+    def test_print_nodes_fetches_nodes_in_one_lookup(self):
+        self.bot.my_id = '!00000000'
+        self.bot.node_db = MagicMock()
+        self.bot.node_db.get_by_ids.return_value = {'!00000001': MagicMock(long_name='Node 1')}
+        self.bot.node_info = MagicMock()
+        self.bot.node_info.get_online_nodes.return_value = {'!00000001': 2, '!00000002': 1, '!00000000': 3}
+        self.bot.node_info.get_last_heard.return_value = None
+
+        # '!00000002' isn't in the node DB, so is skipped
+        self.bot.print_nodes()
+
+        self.bot.node_db.get_by_ids.assert_called_once_with(['!00000000', '!00000001', '!00000002'])
+        self.bot.node_db.get_by_id.assert_not_called()
+
+    def test_on_receive_uploads_synchronously_without_queue(self):
+        storage_api = MagicMock()
+        self.bot.storage_apis = [storage_api]
+        self.bot.node_db = MagicMock()
+        self.bot.node_db.get_by_id.return_value = None
+        packet = {'fromId': '!12345678', 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}}
+
+        self.bot.on_receive(packet, self.bot.interface)
+
+        storage_api.store_prepared_packet.assert_called_once()
+        self.assertIs(storage_api.store_prepared_packet.call_args.args[0].packet, packet)
+
+    @patch('src.api.deadline.time')
+    def test_expired_deadline_defers_remaining_apis(self, mock_time):
+        # The deadline starts at 0 and has passed by the time anything checks it
+        mock_time.monotonic.side_effect = itertools.chain([0], itertools.repeat(100))
+        slow_api, other_api = MagicMock(), MagicMock()
+        self.bot.storage_apis = [slow_api, other_api]
+        self.bot.upload_deadline_sec = 15
+        packet = {'id': 1, 'fromId': '!12345678', 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}}
+
+        self.bot._store_packet(packet)
+        self.bot.fanout_executor.shutdown(wait=True)
+
+        for storage_api in (slow_api, other_api):
+            storage_api.store_prepared_packet.assert_not_called()
+            storage_api.defer_packet.assert_called_once()
+            storage_api.counters.incr.assert_called_once_with('deadline_exceeded')
+
+    def test_expiry_deferred_by_worker_is_not_counted_as_overrun(self):
+        # Both workers find the deadline has passed and start deferring, then the dispatcher gives up waiting on them
+        deferring, release = threading.Barrier(3, timeout=5), threading.Event()
+
+        def remaining():
+            deferring.wait()
+            return 0
+
+        deadline = MagicMock()
+        deadline.expired.return_value = True
+        deadline.remaining.side_effect = remaining
+        on_expired = MagicMock(side_effect=lambda *args: (deferring.wait(), release.wait(timeout=5)))
+        apis = [MagicMock(), MagicMock()]
+        self.bot.storage_apis = apis
+
+        with patch('src.bot.Deadline', return_value=deadline):
+            self.bot._fan_out(MagicMock(), on_expired, 'packet 1')
+        release.set()
+        self.bot.fanout_executor.shutdown(wait=True)
+
+        self.assertEqual(on_expired.call_count, 2)
+        for storage_api in apis:
+            storage_api.counters.incr.assert_called_once_with('deadline_exceeded')
+
+    def test_calls_in_flight_past_deadline_are_counted_as_overruns(self):
+        calling, release = threading.Barrier(3, timeout=5), threading.Event()
+        apis = [MagicMock(), MagicMock()]
+        for api in apis:
+            api.store_node_data.side_effect = lambda *args, **kwargs: (calling.wait(), release.wait(timeout=5))
+        self.bot.storage_apis = apis
+
+        def remaining():
+            # The deadline runs out once both calls are in flight
+            calling.wait()
+            return 0
+
+        deadline = MagicMock()
+        deadline.expired.return_value = False
+        deadline.remaining.side_effect = remaining
+        on_expired = MagicMock()
+
+        with patch('src.bot.Deadline', return_value=deadline):
+            self.bot._fan_out(lambda api, deadline: api.store_node_data({}, deadline=deadline), on_expired, 'node !1')
+        release.set()
+        self.bot.fanout_executor.shutdown(wait=True)
+
+        on_expired.assert_not_called()
+        for api in apis:
+            api.counters.incr.assert_called_once_with('deadline_overrun')
+
+    def test_store_packet_fans_out_one_payload_to_every_api(self):
+        apis = [MagicMock(), MagicMock(), MagicMock()]
+        self.bot.storage_apis = apis
+        packet = {'id': 1, 'fromId': '!12345678', 'decoded': {'payload': b'hi'}}
+
+        self.bot._store_packet(packet)
+
+        payloads = [api.store_prepared_packet.call_args.args[0] for api in apis]
+        self.assertEqual(payloads[0].api_dict, {'id': 1, 'fromId': '!12345678', 'decoded': {'payload': 'aGk='}})
+        # Serialised once and shared
+        self.assertTrue(all(payload is payloads[0] for payload in payloads))
+
+    def test_store_packet_calls_apis_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+        apis = [MagicMock(), MagicMock()]
+        for api in apis:
+            # Would time out if the APIs were called one after the other
+            api.store_prepared_packet.side_effect = lambda *args, **kwargs: barrier.wait()
+        self.bot.storage_apis = apis
+
+        self.bot._store_packet({'id': 1, 'fromId': '!12345678'})
+
+        for api in apis:
+            api.store_prepared_packet.assert_called_once()
+            api.counters.incr.assert_not_called()
+
+    def test_fan_out_counts_errors_per_api(self):
+        ok_api, failing_api = MagicMock(), MagicMock()
+        failing_api.store_node_data.side_effect = Exception('boom')
+        self.bot.storage_apis = [ok_api, failing_api]
+
+        self.bot._fan_out(lambda api, deadline: api.store_node_data({}, deadline=deadline),
+                          MagicMock(), 'node !12345678')
+
+        ok_api.counters.incr.assert_not_called()
+        failing_api.counters.incr.assert_called_once_with('errors')
+
+    def test_on_receive_submits_to_packet_lane(self):
+        storage_api = MagicMock()
+        self.bot.storage_apis = [storage_api]
+        self.bot.packet_lanes = MagicMock()
+        self.bot.node_db = MagicMock()
+        self.bot.node_db.get_by_id.return_value = None
+        packet = {'fromId': '!12345678', 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}}
+
+        self.bot.on_receive(packet, self.bot.interface)
+
+        storage_api.store_raw_packet.assert_not_called()
+        self.bot.packet_lanes.submit.assert_called_once_with('TEXT_MESSAGE_APP', self.bot._store_packet, packet)
+
+    def test_filtered_packets_are_not_uploaded(self):
+        storage_api = MagicMock()
+        self.bot.storage_apis = [storage_api]
+        self.bot.packet_filter = PacketFilter(PacketFilter.default_rules(frozenset({'ROUTING_APP'})))
+        self.bot.node_db = MagicMock()
+        self.bot.node_db.get_by_id.return_value = None
+
+        self.bot.on_receive({'fromId': '!12345678', 'decoded': {'portnum': 'ROUTING_APP'}}, self.bot.interface)
+
+        storage_api.store_prepared_packet.assert_not_called()
+        self.assertEqual(self.bot.packet_filter.counters.get('ignore-portnums'), 1)
+
+    def test_shed_packets_are_not_uploaded(self):
+        self.bot.storage_apis = [MagicMock()]
+        self.bot.packet_lanes = MagicMock()
+        self.bot.packet_lanes.depth.return_value = 500
+        self.bot.packet_lanes.latency_ms.return_value = 0
+        self.bot.load_shedder = LoadShedder({'TELEMETRY_APP': 0}, depth_watermark=100)
+        self.bot.node_db = MagicMock()
+        self.bot.node_db.get_by_id.return_value = None
+
+        self.bot.on_receive({'fromId': '!12345678', 'decoded': {'portnum': 'TELEMETRY_APP'}}, self.bot.interface)
+        self.bot.on_receive({'fromId': '!12345678', 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}}, self.bot.interface)
+
+        self.bot.packet_lanes.submit.assert_called_once()
+        self.assertEqual(self.bot.packet_lanes.submit.call_args.args[0], 'TEXT_MESSAGE_APP')
+        self.assertEqual(self.bot.load_shedder.counters.get('shed_TELEMETRY_APP'), 1)
+
+    def test_text_messages_are_handled_on_command_lane(self):
+        self.bot.packet_lanes = MagicMock()
+        packet = {'toId': '^all', 'fromId': '!12345678', 'decoded': {'text': 'hello'}}
+
+        with patch.object(self.bot, 'handle_public_message') as mock_handle:
+            self.bot.on_receive_text(packet, self.bot.interface)
+
+        mock_handle.assert_not_called()
+        self.bot.packet_lanes.submit_command.assert_called_once_with(self.bot._handle_text_packet, packet)
+        self.bot.packet_lanes.submit.assert_not_called()
+
+    def test_command_replies_do_not_wait_behind_text_uploads(self):
+        release, replied = threading.Event(), threading.Event()
+        storage_api = MagicMock()
+        storage_api.store_prepared_packet.side_effect = lambda *args, **kwargs: release.wait(timeout=5)
+        self.bot.storage_apis = [storage_api]
+        self.bot.node_db = MagicMock()
+        self.bot.node_db.get_by_id.return_value = None
+        self.bot.packet_lanes = PacketLanes.from_spec(PacketLanes.DEFAULT_SPEC)
+        self.bot.packet_lanes.start()
+        self.addCleanup(self.bot.packet_lanes.stop)
+        self.addCleanup(release.set)
+        packet = {'id': 1, 'toId': '^all', 'fromId': '!12345678',
+                  'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'text': 'hello'}}
+
+        with patch.object(self.bot, 'handle_public_message', side_effect=lambda packet: replied.set()):
+            # The upload of this message (and the one after it) is stuck on a slow API
+            self.bot.on_receive(packet, self.bot.interface)
+            self.bot.on_receive(dict(packet, id=2), self.bot.interface)
+            self.bot.on_receive_text(packet, self.bot.interface)
+
+            self.assertTrue(replied.wait(timeout=2))
+        storage_api.store_prepared_packet.assert_called_once()
+
+    def test_duplicate_packets_are_not_uploaded_or_counted(self):
+        storage_api = MagicMock()
+        self.bot.storage_apis = [storage_api]
+        self.bot.packet_dedup = PacketDeduplicator()
+        self.bot.node_info = MagicMock()
+        self.bot.node_db = MagicMock()
+        packet = {'id': 1, 'from': 305419896, 'fromId': '!12345678', 'decoded': {'portnum': 'TEXT_MESSAGE_APP'}}
+
+        self.bot.on_receive(packet, self.bot.interface)
+        self.bot.on_receive(dict(packet), self.bot.interface)
+
+        storage_api.store_prepared_packet.assert_called_once()
+        self.bot.node_info.node_packet_received.assert_called_once_with('!12345678', 'TEXT_MESSAGE_APP')
+
+    def test_node_updates_are_coalesced(self):
+        self.bot.node_info = MagicMock()
+        self.bot.node_db = MagicMock()
+        storage_api = MagicMock()
+        self.bot.storage_apis = [storage_api]
+        self.bot.node_update_coalescer = Batcher(self.bot.store_node_batch, max_items=100, max_delay_ms=60_000,
+                                                 key_fn=lambda mesh_node: mesh_node.user.id)
+
+        for long_name in ('Old name', 'New name'):
+            self.bot.on_node_updated({'user': {'id': '!12345678', 'longName': long_name}}, self.bot.interface)
+        self.bot.on_node_updated({'user': {'id': '!87654321', 'longName': 'Other'}}, self.bot.interface)
+        self.bot.node_db.store_node.assert_not_called()
+        self.bot.node_update_coalescer.close()
+
+        stored = self.bot.node_db.store_nodes.call_args.args[0]
+        self.assertEqual([mesh_node.user.long_name for mesh_node in stored], ['New name', 'Other'])
+        uploaded = storage_api.store_nodes.call_args.args[0]
+        self.assertEqual([node_data['id'] for node_data in uploaded], ['!12345678', '!87654321'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from datetime import datetime, timedelta, timezone
 
-from src.helpers import pretty_print_last_heard
+from src.helpers import from_epoch_ms, pretty_print_last_heard, to_epoch_ms
 
 
 class TestPrettyPrintLastHeard(unittest.TestCase):
@@ -56,5 +56,25 @@ class TestPrettyPrintLastHeard(unittest.TestCase):
         self.assertEqual(pretty_print_last_heard(future_time), "0s ago")
 
 
+class TestEpochMs(unittest.TestCase):
+
+    def test_round_trip(self):
+        time = datetime(2024, 5, 1, 12, 30, 15, 123000, tzinfo=timezone.utc)
+        self.assertEqual(to_epoch_ms(time), 1714566615123)
+        self.assertEqual(from_epoch_ms(1714566615123), time)
+
+    def test_naive_datetimes_are_utc(self):
+        self.assertEqual(to_epoch_ms(datetime(1970, 1, 1, 0, 0, 1)), 1000)
+
+    def test_iso_strings(self):
+        self.assertEqual(to_epoch_ms('1970-01-01T01:00:01+01:00'), 1000)
+        self.assertEqual(to_epoch_ms('1970-01-01 00:00:01.5+00:00'), 1500)
+
+    def test_unset_times(self):
+        self.assertIsNone(to_epoch_ms(None))
+        self.assertIsNone(to_epoch_ms(0))
+        self.assertIsNone(from_epoch_ms(None))
+
+
 if __name__ == '__main__':
     unittest.main()
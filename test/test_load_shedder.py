@@ -0,0 +1,34 @@
+import unittest
+
+from src.load_shedder import LoadShedder
+
+
+class TestLoadShedder(unittest.TestCase):
+    def setUp(self):
+        self.shedder = LoadShedder({'TELEMETRY_APP': 0.25, 'POSITION_APP': 0}, depth_watermark=100,
+                                   latency_watermark_ms=1000)
+
+    def test_nothing_shed_without_pressure(self):
+        self.assertFalse(any(self.shedder.should_shed('TELEMETRY_APP', 99, 999) for _ in range(10)))
+
+    def test_samples_under_backlog_pressure(self):
+        kept = [not self.shedder.should_shed('TELEMETRY_APP', 100, 0) for _ in range(8)]
+
+        self.assertEqual(kept, [False, False, False, True, False, False, False, True])
+        self.assertEqual(self.shedder.counters.get('shed_TELEMETRY_APP'), 6)
+
+    def test_sheds_under_latency_pressure(self):
+        self.assertTrue(all(self.shedder.should_shed('POSITION_APP', 0, 1000) for _ in range(5)))
+
+    def test_unsampled_portnums_are_never_shed(self):
+        self.assertFalse(self.shedder.should_shed('TEXT_MESSAGE_APP', 10_000, 10_000))
+
+    def test_parse_sample_rates(self):
+        self.assertEqual(LoadShedder.parse_sample_rates('telemetry_app=0.25, POSITION_APP=0.5,'),
+                         {'TELEMETRY_APP': 0.25, 'POSITION_APP': 0.5})
+        with self.assertRaises(ValueError):
+            LoadShedder.parse_sample_rates('TELEMETRY_APP=some')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import patch
+
+from src.packet_dedup import PacketDeduplicator
+
+
+def _packet(from_num=1, packet_id=100, hop_start=3, hop_limit=3, snr=5.0):
+    return {'from': from_num, 'id': packet_id, 'hopStart': hop_start, 'hopLimit': hop_limit, 'rxSnr': snr}
+
+
+class TestPacketDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.dedup = PacketDeduplicator(ttl_sec=60, max_entries=3)
+
+    def test_first_copy_is_not_a_duplicate(self):
+        self.assertFalse(self.dedup.is_duplicate(_packet()))
+        self.assertTrue(self.dedup.is_duplicate(_packet()))
+
+    def test_key_includes_sender(self):
+        self.assertFalse(self.dedup.is_duplicate(_packet(from_num=1)))
+        self.assertFalse(self.dedup.is_duplicate(_packet(from_num=2)))
+
+    def test_packets_without_id_are_never_duplicates(self):
+        self.assertFalse(self.dedup.is_duplicate({'from': 1, 'id': 0}))
+        self.assertFalse(self.dedup.is_duplicate({'from': 1, 'id': 0}))
+        self.assertEqual(len(self.dedup), 0)
+
+    def test_duplicates_record_hops_and_snr(self):
+        self.dedup.is_duplicate(_packet())
+        self.dedup.is_duplicate(_packet(hop_limit=1, snr=-10.5))
+
+        seen = self.dedup.get(1, 100)
+        self.assertEqual(seen.copies, 2)
+        self.assertEqual(seen.hops, [2])
+        self.assertEqual(seen.snrs, [-10.5])
+        self.assertEqual(self.dedup.counters.snapshot(), {'unique': 1, 'duplicates': 1, 'duplicates_hops_2': 1})
+
+    @patch('src.packet_dedup.time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        mock_monotonic.return_value = 1000
+        self.dedup.is_duplicate(_packet())
+
+        mock_monotonic.return_value = 1061
+        self.assertFalse(self.dedup.is_duplicate(_packet()))
+        self.assertEqual(self.dedup.counters.get('expired'), 1)
+
+    def test_oldest_entries_are_evicted_when_full(self):
+        for packet_id in range(1, 5):
+            self.dedup.is_duplicate(_packet(packet_id=packet_id))
+
+        self.assertEqual(len(self.dedup), 3)
+        self.assertIsNone(self.dedup.get(1, 1))
+        self.assertEqual(self.dedup.counters.get('evicted'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.packet_filters import PacketFilter, PacketFilterRule
+
+MY_ID = '!aabbccdd'
+
+
+def _packet(portnum='TEXT_MESSAGE_APP', sender='!12345678', **extra):
+    return {'fromId': sender, 'decoded': {'portnum': portnum}, **extra}
+
+
+class TestPacketFilterRule(unittest.TestCase):
+    def test_portnum(self):
+        rule = PacketFilterRule.compile({'portnum': ['routing_app', 345]})
+
+        self.assertTrue(rule.matches(_packet('ROUTING_APP'), MY_ID))
+        self.assertTrue(rule.matches(_packet(345), MY_ID))
+        self.assertFalse(rule.matches(_packet('TEXT_MESSAGE_APP'), MY_ID))
+
+    def test_sender_and_from_self(self):
+        self.assertTrue(PacketFilterRule.compile({'sender': '!12345678'}).matches(_packet(), MY_ID))
+        self.assertTrue(PacketFilterRule.compile({'from_self': True}).matches(_packet(sender=MY_ID), MY_ID))
+        self.assertFalse(PacketFilterRule.compile({'from_self': True}).matches(_packet(), MY_ID))
+        self.assertFalse(PacketFilterRule.compile({'from_self': True}).matches(_packet(sender=None), None))
+
+    def test_channel_defaults_to_zero(self):
+        rule = PacketFilterRule.compile({'channel': [0, 2]})
+
+        self.assertTrue(rule.matches(_packet(), MY_ID))
+        self.assertTrue(rule.matches(_packet(channel=2), MY_ID))
+        self.assertFalse(rule.matches(_packet(channel=1), MY_ID))
+
+    def test_field_presence(self):
+        packet = _packet('TELEMETRY_APP')
+        packet['decoded']['telemetry'] = {'deviceMetrics': {'batteryLevel': 90}}
+
+        self.assertTrue(PacketFilterRule.compile({'has': 'decoded.telemetry.deviceMetrics'}).matches(packet, MY_ID))
+        self.assertFalse(PacketFilterRule.compile({'has': 'decoded.telemetry.environmentMetrics'}).matches(packet, MY_ID))
+        self.assertTrue(PacketFilterRule.compile({'missing': 'encrypted'}).matches(packet, MY_ID))
+
+    def test_all_conditions_must_match(self):
+        rule = PacketFilterRule.compile({'portnum': 'TEXT_MESSAGE_APP', 'sender': '!87654321'})
+        self.assertFalse(rule.matches(_packet(), MY_ID))
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            PacketFilterRule.compile({'name': 'typo', 'portnums': 'TEXT_MESSAGE_APP'})
+        with self.assertRaises(ValueError):
+            PacketFilterRule.compile({'name': 'everything'})
+
+
+class TestPacketFilter(unittest.TestCase):
+    def test_default_rules(self):
+        packet_filter = PacketFilter(PacketFilter.default_rules(frozenset({'ROUTING_APP'})))
+        self_metrics = _packet('TELEMETRY_APP', sender=MY_ID)
+        self_metrics['decoded']['telemetry'] = {'deviceMetrics': {}}
+        self_environment = _packet('TELEMETRY_APP', sender=MY_ID)
+        self_environment['decoded']['telemetry'] = {'environmentMetrics': {}}
+
+        self.assertEqual(packet_filter.match(_packet('ROUTING_APP'), MY_ID).name, 'ignore-portnums')
+        self.assertEqual(packet_filter.match({'fromId': '!12345678', 'encrypted': 'abc'}, MY_ID).name, 'not-decoded')
+        self.assertEqual(packet_filter.match(self_metrics, MY_ID).name, 'self-device-metrics')
+        self.assertIsNone(packet_filter.match(self_environment, MY_ID))
+        self.assertIsNone(packet_filter.match(_packet(), MY_ID))
+        self.assertEqual(packet_filter.counters.snapshot(),
+                         {'ignore-portnums': 1, 'not-decoded': 1, 'self-device-metrics': 1})
+
+    def test_load_rules(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump([{'name': 'no-range-tests', 'portnum': 'RANGE_TEST_APP'}], f)
+        try:
+            rules = PacketFilter.load_rules(f.name)
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual([rule.name for rule in rules], ['no-range-tests'])
+
+    def test_parse_rules_requires_list(self):
+        with self.assertRaises(ValueError):
+            PacketFilter.parse_rules('{"portnum": "RANGE_TEST_APP"}')
+
+
+if __name__ == '__main__':
+    unittest.main()
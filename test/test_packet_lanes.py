@@ -0,0 +1,93 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.load_shedder import LoadShedder
+from src.packet_lanes import PacketLanes
+
+
+class TestPacketLanes(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('src.api.upload_queue.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_from_spec(self):
+        lanes = PacketLanes.from_spec('TEXT_MESSAGE_APP=1, position_app+NODEINFO_APP=3,TELEMETRY_APP', max_size=10,
+                                      default_workers=2)
+
+        self.assertEqual(list(lanes.lanes), ['text_message_app', 'position_app', 'telemetry_app'])
+        self.assertIs(lanes.lane_for('NODEINFO_APP'), lanes.lanes['position_app'])
+        self.assertEqual(lanes.lanes['position_app'].worker_count, 3)
+        self.assertEqual(lanes.lanes['telemetry_app'].worker_count, 1)
+        self.assertIs(lanes.lane_for('ROUTING_APP'), lanes.default)
+        self.assertEqual(lanes.default.worker_count, 2)
+        self.assertEqual(lanes.default.max_size, 10)
+
+    def test_empty_spec_has_only_default_and_command_lanes(self):
+        lanes = PacketLanes.from_spec('')
+        self.assertEqual(lanes.upload_lanes(), [lanes.default])
+        self.assertEqual(lanes.all_lanes(), [lanes.commands, lanes.default])
+
+    def test_invalid_spec(self):
+        with self.assertRaises(ValueError):
+            PacketLanes.from_spec('TEXT_MESSAGE_APP=lots')
+
+    def test_busy_lane_does_not_block_other_lanes(self):
+        lanes = PacketLanes.from_spec('TEXT_MESSAGE_APP=1,TELEMETRY_APP=1')
+        lanes.start()
+        release = threading.Event()
+        handled = threading.Event()
+
+        for _ in range(5):
+            lanes.submit('TELEMETRY_APP', release.wait, 5)
+        lanes.submit('TEXT_MESSAGE_APP', handled.set)
+
+        self.assertTrue(handled.wait(2))
+        release.set()
+        lanes.stop()
+        stats = lanes.stats()
+        self.assertEqual(stats['lane-telemetry_app']['completed'], 5)
+        self.assertEqual(stats['lane-text_message_app']['completed'], 1)
+
+    def test_shedding_stops_once_quiet_lane_is_idle(self):
+        lanes = PacketLanes.from_spec('TEXT_MESSAGE_APP=1,TRACEROUTE_APP=1')
+        lanes.start()
+        self.addCleanup(lanes.stop)
+        shedder = LoadShedder({'TELEMETRY_APP': 0}, depth_watermark=0, latency_watermark_ms=20)
+
+        # One slow upload on the traceroute lane holds up the next for 500ms
+        started, release = threading.Event(), threading.Event()
+        lanes.submit('TRACEROUTE_APP', lambda: (started.set(), release.wait(5)))
+        self.assertTrue(started.wait(5))
+        lanes.submit('TRACEROUTE_APP', lambda: None)
+        self.now += 0.5
+        release.set()
+        lanes.lanes['traceroute_app'].join()
+        self.assertTrue(shedder.should_shed('TELEMETRY_APP', lanes.depth(), lanes.latency_ms()))
+
+        # Nothing else arrives on that lane
+        self.now += 60
+        self.assertFalse(shedder.should_shed('TELEMETRY_APP', lanes.depth(), lanes.latency_ms()))
+
+    def test_commands_do_not_count_towards_latency(self):
+        lanes = PacketLanes.from_spec('TEXT_MESSAGE_APP=1')
+        lanes.start()
+        self.addCleanup(lanes.stop)
+
+        started, release = threading.Event(), threading.Event()
+        lanes.submit_command(lambda: (started.set(), release.wait(5)))
+        self.assertTrue(started.wait(5))
+        lanes.submit_command(lambda: None)
+        self.assertEqual(lanes.depth(), 0)
+        self.now += 0.5
+        release.set()
+        lanes.commands.join()
+
+        self.assertEqual(lanes.commands.stats()['completed'], 2)
+        self.assertEqual(lanes.latency_ms(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from requests import ConnectionError, HTTPError
+
+from src.replay_failed_packets import FailedPacketReplayer, RateLimiter
+
+
+def _http_error(status_code: int) -> HTTPError:
+    response = MagicMock()
+    response.status_code = status_code
+    return HTTPError(response=response)
+
+
+class TestFailedPacketReplayer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+        self.storage_api = MagicMock()
+        self.storage_api.base_url = 'http://localhost:8000'
+        self.replayer = FailedPacketReplayer(self.storage_api, self.dir, concurrency=4, rate_per_sec=0)
+
+    def _write(self, name: str, content: dict):
+        (self.dir / name).write_text(json.dumps(content))
+
+    def test_skips_companion_files(self):
+        self._write('failed_packet_20240102000000.json', {'id': 2})
+        self._write('failed_packet_20240101000000.json', {'id': 1})
+        self._write('failed_packet_20240101000000_error.json', {'status_code': 500})
+        self._write('failed_packet_20240101000000_raw.json', {})
+
+        self.assertEqual([path.name for path in self.replayer.pending_files()],
+                         ['failed_packet_20240101000000.json', 'failed_packet_20240102000000.json'])
+
+    def test_uploaded_packets_are_archived_with_companions(self):
+        self._write('failed_packet_20240101000000.json', {'id': 1})
+        self._write('failed_packet_20240101000000_error.json', {'status_code': 500})
+
+        counts = self.replayer.run()
+
+        self.storage_api.replay_packet.assert_called_once_with({'id': 1})
+        self.assertEqual(counts, {'replayed': 1})
+        self.assertEqual(sorted(path.name for path in (self.dir / 'archive').iterdir()),
+                         ['failed_packet_20240101000000.json', 'failed_packet_20240101000000_error.json'])
+        self.assertEqual(self.replayer.pending_files(), [])
+
+    def test_retryable_failures_are_left_in_place(self):
+        self._write('failed_packet_20240101000000.json', {'id': 1})
+        self.storage_api.replay_packet.side_effect = ConnectionError()
+
+        counts = self.replayer.run()
+
+        self.assertEqual(counts, {'failed': 1})
+        self.assertEqual(len(self.replayer.pending_files()), 1)
+
+    def test_rejected_packets_are_moved_aside(self):
+        self._write('failed_packet_20240101000000.json', {'id': 1})
+        self.storage_api.replay_packet.side_effect = _http_error(400)
+
+        counts = self.replayer.run()
+
+        self.assertEqual(counts, {'rejected': 1})
+        self.assertTrue((self.dir / 'rejected' / 'failed_packet_20240101000000.json').exists())
+
+    def test_unreadable_files_are_counted(self):
+        (self.dir / 'failed_packet_20240101000000.json').write_text('{not json')
+
+        counts = self.replayer.run()
+
+        self.storage_api.replay_packet.assert_not_called()
+        self.assertEqual(counts, {'unreadable': 1})
+
+    def test_replays_many_packets(self):
+        for i in range(50):
+            self._write(f'failed_packet_2024010100{i:04d}.json', {'id': i})
+
+        counts = self.replayer.run()
+
+        self.assertEqual(counts, {'replayed': 50})
+        self.assertEqual({call.args[0]['id'] for call in self.storage_api.replay_packet.call_args_list},
+                         set(range(50)))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_spaces_calls(self):
+        limiter = RateLimiter(10)
+        with patch('src.replay_failed_packets.time.monotonic', return_value=100.0), \
+                patch('src.replay_failed_packets.time.sleep') as mock_sleep:
+            for _ in range(3):
+                limiter.wait()
+
+        self.assertEqual([round(call.args[0], 6) for call in mock_sleep.call_args_list], [0.1, 0.2])
+
+    def test_zero_rate_is_unlimited(self):
+        with patch('src.replay_failed_packets.time.sleep') as mock_sleep:
+            RateLimiter(0).wait()
+        mock_sleep.assert_not_called()
@@ -0,0 +1,73 @@
+import threading
+import unittest
+
+from src.utils.batcher import Batcher
+
+
+class TestBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def _flush(self, items):
+        self.batches.append(items)
+        self.flushed.set()
+
+    def test_flushes_when_batch_is_full(self):
+        batcher = Batcher(self._flush, max_items=3, max_delay_ms=60_000)
+        for i in range(3):
+            batcher.add(i)
+
+        self.assertTrue(self.flushed.wait(2))
+        self.assertEqual(self.batches, [[0, 1, 2]])
+        batcher.close()
+
+    def test_flushes_after_delay(self):
+        batcher = Batcher(self._flush, max_items=100, max_delay_ms=20)
+        batcher.add('a')
+
+        self.assertTrue(self.flushed.wait(2))
+        self.assertEqual(self.batches, [['a']])
+        batcher.close()
+
+    def test_close_flushes_pending_items_in_chunks(self):
+        batcher = Batcher(self._flush, max_items=2, max_delay_ms=60_000)
+        # Stop the background thread first, so only close() flushes
+        with batcher._cond:
+            batcher._running = False
+            batcher._cond.notify()
+        batcher._thread.join()
+
+        for i in range(5):
+            batcher.add(i)
+        batcher.close()
+
+        self.assertEqual(self.batches, [[0, 1], [2, 3], [4]])
+
+    def test_coalesces_items_with_the_same_key(self):
+        batcher = Batcher(self._flush, max_items=10, max_delay_ms=60_000, key_fn=lambda item: item[0])
+        for item in [('a', 1), ('b', 1), ('a', 2), ('c', 1), ('a', 3)]:
+            batcher.add(item)
+        batcher.close()
+
+        self.assertEqual(self.batches, [[('a', 3), ('b', 1), ('c', 1)]])
+        self.assertEqual(batcher.coalesced, 2)
+
+    def test_flush_error_does_not_stop_batcher(self):
+        calls = []
+
+        def flaky_flush(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise RuntimeError('boom')
+
+        batcher = Batcher(flaky_flush, max_items=1, max_delay_ms=60_000)
+        batcher.add(1)
+        batcher.add(2)
+        batcher.close()
+
+        self.assertEqual(calls, [[1], [2]])
+
+
+if __name__ == '__main__':
+    unittest.main()